@@ -0,0 +1,127 @@
+import os
+from functools import lru_cache
+import numpy as np
+from matplotlib.artist import Artist, allow_rasterization
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import TextPath, text_to_path
+
+# Labels never grow past the old per-cell ax.text size and are thinned rather than drawn below the minimum
+ANNOTATION_MAX_FONT = float(os.getenv("ANNOTATION_MAX_FONT", "10"))
+ANNOTATION_MIN_FONT = float(os.getenv("ANNOTATION_MIN_FONT", "5"))
+# Share of a cell's width and height a label may fill
+CELL_FILL = 0.85
+# Vertical room a line of text needs, in font sizes
+LINE_HEIGHT = 1.2
+
+_PROP = FontProperties()
+
+@lru_cache(maxsize=None)
+def _advance(char: str) -> float:
+  """Advance width of one character at a font size of 1pt."""
+  width, _, _ = text_to_path.get_text_width_height_descent(char, _PROP.copy(), ismath=False)
+  return width / _PROP.get_size_in_points()
+
+@lru_cache(maxsize=1)
+def _digit_half_height() -> float:
+  return TextPath((0, 0), "0", size=1, prop=_PROP).get_extents().height / 2
+
+def label_widths(labels: np.ndarray) -> np.ndarray:
+  """Width of every label at 1pt, measured once per distinct label."""
+  unique, inverse = np.unique(labels, return_inverse=True)
+  widths = np.array([sum(_advance(char) for char in label) for label in unique])
+  return widths[inverse].reshape(np.shape(labels))
+
+class CellLabels(Artist):
+  """Every label of a heatmap as one artist, drawn straight through the renderer.
+
+  Unlike one Text per cell there is no per-label layout, bbox or artist bookkeeping;
+  positions are transformed in one call and labels are centred from their known widths.
+  """
+
+  def __init__(self, offsets: np.ndarray, labels: np.ndarray, widths: np.ndarray, font_size: float, color: str = "black"):
+    super().__init__()
+    self._offsets = offsets
+    self._labels = labels
+    self._widths = widths
+    self._prop = _PROP.copy()
+    self._prop.set_size(font_size)
+    self._color = color
+
+  def __len__(self):
+    return len(self._labels)
+
+  @allow_rasterization
+  def draw(self, renderer):
+    if not self.get_visible() or not len(self._labels):
+      return
+    renderer.open_group("cell_labels", gid=self.get_gid())
+    gc = renderer.new_gc()
+    gc.set_foreground(self._color)
+    gc.set_alpha(self.get_alpha())
+    self._set_gc_clip(gc)
+    size = self._prop.get_size_in_points()
+    points = self.get_transform().transform(self._offsets)
+    x = points[:, 0] - renderer.points_to_pixels(self._widths * size) / 2
+    # draw_text takes the baseline; digits sit on it, so drop by half their height
+    y = points[:, 1] - renderer.points_to_pixels(_digit_half_height() * size)
+    if renderer.flipy():
+      y = renderer.get_canvas_width_height()[1] - y
+    for label, left, baseline in zip(self._labels, x, y):
+      renderer.draw_text(gc, left, baseline, label, self._prop, 0)
+    gc.restore()
+    renderer.close_group("cell_labels")
+    self.stale = False
+
+def _corner_mean(A: np.ndarray) -> np.ndarray:
+  return (A[:-1, :-1] + A[1:, :-1] + A[:-1, 1:] + A[1:, 1:]) / 4
+
+def cell_centers(X: np.ndarray, Y: np.ndarray, shape: tuple[int, int]):
+  """Cell centres of a pcolormesh: the grid itself for nearest shading, corner averages for flat."""
+  X, Y = np.asarray(X, dtype=float), np.asarray(Y, dtype=float)
+  if X.shape == shape:
+    return X, Y
+  if X.shape == (shape[0] + 1, shape[1] + 1):
+    return _corner_mean(X), _corner_mean(Y)
+  raise ValueError("Mesh coordinates do not match the data shape")
+
+def _axes_points(ax) -> tuple[float, float]:
+  fig = ax.figure
+  box = ax.get_position()
+  width, height = fig.get_size_inches()
+  return box.width * width * 72, box.height * height * 72
+
+def layout(ax, shape: tuple[int, int], label_width: float) -> tuple[int, int, float]:
+  """Row step, column step and font size that keep labels readable at the axes' size.
+
+  `label_width` is the widest label at 1pt. Cells too small for ANNOTATION_MIN_FONT
+  are thinned to every n-th row or column so the labels that remain fit.
+  """
+  rows, cols = shape
+  width, height = _axes_points(ax)
+  cell_width, cell_height = width / max(cols, 1), height / max(rows, 1)
+  fit_width = CELL_FILL * cell_width / max(label_width, 1e-9)
+  fit_height = CELL_FILL * cell_height / LINE_HEIGHT
+  col_step = max(1, int(np.ceil(ANNOTATION_MIN_FONT / fit_width)))
+  row_step = max(1, int(np.ceil(ANNOTATION_MIN_FONT / fit_height)))
+  return row_step, col_step, min(ANNOTATION_MAX_FONT, fit_width * col_step, fit_height * row_step)
+
+def annotate(ax, X: np.ndarray, Y: np.ndarray, values: np.ndarray, fmt: str = "%.2f", rasterized: bool = False,
+  color: str = "black") -> CellLabels:
+  """Writes each cell's value at its centre as a single CellLabels artist instead of one Text per cell.
+
+  Call after the figure layout is final: the font size and thinning follow the axes' size.
+  """
+  values = np.asarray(values, dtype=float)
+  labels = np.char.mod(fmt, values)
+  widths = label_widths(labels)
+  row_step, col_step, font_size = layout(ax, values.shape, widths.max(initial=0))
+  keep = np.zeros(values.shape, dtype=bool)
+  keep[(row_step - 1) // 2::row_step, (col_step - 1) // 2::col_step] = True
+  keep &= np.isfinite(values)
+  offsets = np.column_stack([np.asarray(X, dtype=float)[keep], np.asarray(Y, dtype=float)[keep]])
+  artist = CellLabels(offsets, labels[keep], widths[keep], font_size, color)
+  artist.set_transform(ax.transData)
+  artist.set_rasterized(rasterized)
+  artist.set_zorder(3)
+  ax.add_artist(artist)
+  return artist
@@ -0,0 +1,245 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+import requests
+from google.auth import exceptions as google_exceptions
+from google.auth import jwt
+from google.auth.transport import requests as google_requests
+from google.cloud import iam_v3
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v1/certs"
+
+class AuthorizationCache:
+  """Process-wide cache of the principals that hold a role on a resource.
+
+  Bindings are fetched once per TTL with a reused client. Stale snapshots keep
+  answering while a background refresh runs, and denied users are remembered
+  for a short while so they cannot force a fetch on every request.
+  """
+
+  def __init__(self, resource: str, role: str, client_factory: Callable = iam_v3.PolicyBindingsClient,
+    ttl: float = 300, max_stale: float = 3600, negative_ttl: float = 60, min_refresh: float = 5,
+    clock: Callable[[], float] = time.monotonic):
+    self.resource = resource
+    self.role = role
+    self.ttl = ttl
+    self.min_refresh = min_refresh
+    self.max_stale = max_stale
+    self.negative_ttl = negative_ttl
+    self._client_factory = client_factory
+    self._client = None
+    self._clock = clock
+    self._principals: Optional[frozenset] = None
+    self._fetched_at = 0.0
+    self._denied: dict[str, float] = {}
+    self._lock = threading.Lock()
+    self._fetch_lock = threading.Lock()
+    self._refreshing = False
+    self.hits = 0
+    self.misses = 0
+    self.negative_hits = 0
+    self.refreshes = 0
+
+  def _get_client(self):
+    if self._client is None:
+      self._client = self._client_factory()
+    return self._client
+
+  def refresh(self):
+    """Fetches the policy bindings and rebuilds the principal set."""
+    with self._fetch_lock:
+      request = iam_v3.ListPolicyBindingsRequest(parent=self.resource)
+      response = self._get_client().list_policy_bindings(request=request)
+      principals = frozenset(
+        principal
+        for binding in response.policy_bindings if binding.role == self.role
+        for principal in binding.principals
+      )
+      with self._lock:
+        self._principals = principals
+        self._fetched_at = now = self._clock()
+        # Denials last their own TTL, so principals denied in turn cannot force a fetch per min_refresh;
+        # only those the new policy grants, and expired entries, are dropped
+        self._denied = {principal: denied_at for principal, denied_at in self._denied.items()
+          if principal not in principals and now - denied_at < self.negative_ttl}
+        self.refreshes += 1
+
+  def _refresh_in_background(self):
+    with self._lock:
+      if self._refreshing:
+        return
+      self._refreshing = True
+
+    def worker():
+      try:
+        self.refresh()
+      except Exception as e:
+        print(f"Background IAM refresh failed: {e}")
+      finally:
+        with self._lock:
+          self._refreshing = False
+
+    threading.Thread(target=worker, name="iam-refresh", daemon=True).start()
+
+  def is_authorized(self, email: str) -> bool:
+    """Blocking check; may fetch bindings when the snapshot is missing or too old."""
+    principal = f"user:{email}"
+    now = self._clock()
+    age = now - self._fetched_at
+    fetched = False
+    if self._principals is None or age > self.max_stale:
+      self.misses += 1
+      self.refresh()
+      fetched = True
+    elif age > self.ttl:
+      self._refresh_in_background()
+    if principal in self._principals:
+      if not fetched:
+        self.hits += 1
+      return True
+    with self._lock:
+      denied_at = self._denied.get(principal)
+    if denied_at is not None and now - denied_at < self.negative_ttl:
+      self.negative_hits += 1
+      return False
+    if not fetched and age > self.min_refresh:
+      # A freshly granted user should not wait a full TTL, so re-check once before denying
+      self.misses += 1
+      self.refresh()
+    elif not fetched:
+      self.hits += 1
+    with self._lock:
+      self._denied[principal] = self._clock()
+    return principal in self._principals
+
+  def is_cached(self, email: str) -> bool:
+    """True when `is_authorized` can answer without a blocking fetch."""
+    principal = f"user:{email}"
+    now = self._clock()
+    if self._principals is None or now - self._fetched_at > self.max_stale:
+      return False
+    if principal in self._principals:
+      return True
+    with self._lock:
+      denied_at = self._denied.get(principal)
+    return denied_at is not None and now - denied_at < self.negative_ttl
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses + self.negative_hits
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "negative_hits": self.negative_hits,
+      "refreshes": self.refreshes,
+      "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+      "principals": len(self._principals) if self._principals is not None else 0,
+    }
+
+class TokenVerifier:
+  """Verifies Google ID tokens with cached signing certs and a cache of verified tokens.
+
+  Certs are fetched through one pooled HTTP session and kept for the
+  Cache-Control max-age Google sends with them; an unknown key id refetches
+  them at most once per `min_refresh_interval`. Tokens that already passed
+  verification are remembered by hash until their `exp`, so a burst of
+  requests carrying the same token costs one signature check.
+  """
+
+  def __init__(self, audience: Optional[str], request: Optional[Callable] = None, certs_url: str = GOOGLE_CERTS_URL,
+    max_tokens: int = 1024, default_max_age: float = 300, min_refresh_interval: float = 60,
+    clock: Callable[[], float] = time.time):
+    self.audience = audience
+    self.certs_url = certs_url
+    self.max_tokens = max_tokens
+    self.default_max_age = default_max_age
+    self.min_refresh_interval = min_refresh_interval
+    self._request = request
+    self._clock = clock
+    self._certs: Optional[dict] = None
+    self._certs_expire_at = 0.0
+    self._forced_at = float("-inf")
+    self._verified: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+    self._lock = threading.Lock()
+    self._certs_lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.cert_fetches = 0
+
+  def _get_request(self):
+    if self._request is None:
+      self._request = google_requests.Request(session=requests.Session())
+    return self._request
+
+  def _max_age(self, headers) -> float:
+    cache_control = {k.lower(): v for k, v in dict(headers or {}).items()}.get("cache-control", "")
+    match = re.search(r"max-age=(\d+)", cache_control)
+    return float(match.group(1)) if match else self.default_max_age
+
+  def certs(self, force: bool = False) -> dict:
+    with self._certs_lock:
+      if not force and self._certs is not None and self._clock() < self._certs_expire_at:
+        return self._certs
+      if force and self._certs is not None:
+        # Unknown key ids are attacker-controlled, so they may force at most one fetch per interval
+        if self._clock() - self._forced_at < self.min_refresh_interval:
+          return self._certs
+        self._forced_at = self._clock()
+      response = self._get_request()(self.certs_url, method="GET")
+      if response.status != 200:
+        raise google_exceptions.TransportError(f"Could not fetch certificates at {self.certs_url}")
+      self._certs = json.loads(response.data.decode("utf-8"))
+      self._certs_expire_at = self._clock() + self._max_age(response.headers)
+      self.cert_fetches += 1
+      return self._certs
+
+  @staticmethod
+  def _key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+  def lookup(self, token: str) -> Optional[dict]:
+    """Returns the claims of an already verified, unexpired token without blocking."""
+    key = self._key(token)
+    with self._lock:
+      entry = self._verified.get(key)
+      if entry is None:
+        return None
+      expires_at, idinfo = entry
+      if self._clock() >= expires_at:
+        del self._verified[key]
+        return None
+      self._verified.move_to_end(key)
+      self.hits += 1
+      return idinfo
+
+  def verify(self, token: str) -> dict:
+    """Returns the token claims, raising ValueError when verification fails."""
+    idinfo = self.lookup(token)
+    if idinfo is not None:
+      return idinfo
+    certs = self.certs()
+    key_id = jwt.decode_header(token).get("kid")
+    if key_id is not None and key_id not in certs:
+      # Google rotated its keys before our cached copy expired; a key id still
+      # missing after the (rate-limited) refresh fails in jwt.decode below
+      certs = self.certs(force=True)
+    idinfo = jwt.decode(token, certs=certs, audience=self.audience)
+    with self._lock:
+      self.misses += 1
+      self._verified[self._key(token)] = (float(idinfo["exp"]), idinfo)
+      while len(self._verified) > self.max_tokens:
+        self._verified.popitem(last=False)
+    return idinfo
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "cert_fetches": self.cert_fetches,
+      "hit_ratio": self.hits / lookups if lookups else 0.0,
+      "cached_tokens": len(self._verified),
+    }
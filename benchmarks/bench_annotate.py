@@ -0,0 +1,52 @@
+"""Render time and PDF size of annotated heatmaps against grid size.
+
+`text` is the old one-ax.text-per-cell loop; `artist` is annotate.annotate,
+which thins labels to what is readable at the figure size and draws them as
+a single CellLabels artist.
+
+  python -m benchmarks.bench_annotate --grids 10 30 100 300
+"""
+import argparse
+import time
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import annotate
+from formats import OutputFormat, savefig
+
+def render(grid: int, method: str, size: str, fmt: str) -> tuple[float, int, int]:
+  data = np.random.default_rng(grid).normal(size=(grid, grid))
+  start = time.perf_counter()
+  fig, ax = plt.subplots(figsize=(7, 3) if size == "large" else (3.375, 3))
+  im = ax.pcolormesh(data, shading="nearest")
+  fig.colorbar(im, ax=ax)
+  fig.tight_layout()
+  if method == "text":
+    for i in range(grid):
+      for j in range(grid):
+        ax.text(j, i, f"{data[i, j]:.2f}", ha="center", va="center", color="black")
+    labels = grid * grid
+  else:
+    X, Y = np.meshgrid(np.arange(grid), np.arange(grid))
+    labels = len(annotate.annotate(ax, X, Y, data))
+  size_bytes = len(savefig(fig, OutputFormat(fmt)).getvalue())
+  plt.close(fig)
+  return time.perf_counter() - start, size_bytes, labels
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--grids", type=int, nargs="+", default=[10, 30, 100, 300])
+  parser.add_argument("--size", default="small", choices=["small", "large"])
+  parser.add_argument("--format", default="pdf", choices=["pdf", "png", "svg"])
+  args = parser.parse_args(argv)
+  render(2, "text", args.size, args.format)
+  render(2, "artist", args.size, args.format)
+  print(f"{'grid':>6} {'method':<11} {'labels':>8} {'seconds':>8} {'KiB':>9}")
+  for grid in args.grids:
+    for method in ("text", "artist"):
+      seconds, size_bytes, labels = render(grid, method, args.size, args.format)
+      print(f"{grid:>6} {method:<11} {labels:>8} {seconds:>8.3f} {size_bytes / 1024:>9.1f}")
+
+if __name__ == "__main__":
+  main()
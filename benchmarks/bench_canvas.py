@@ -0,0 +1,71 @@
+"""Per-request cost of figure setup: pyplot versus the pooled canvas figures.
+
+Both paths draw the same small scatter plot. `pyplot` goes through
+plt.subplots/plt.close like plot.py used to; `fresh` builds a Figure on an Agg
+canvas without pyplot; `pooled` is canvas.subplots/canvas.release, reusing
+cleared figures. Allocations are the bytes tracemalloc sees allocated over
+one request (net of what is freed again).
+
+  python -m benchmarks.bench_canvas --requests 200 --format png
+"""
+import argparse
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import canvas
+from formats import OutputFormat, savefig
+
+DATA = np.random.default_rng(0).normal(size=(2, 200))
+
+def draw(fig, ax, output):
+  ax.scatter(DATA[0], DATA[1], marker="o")
+  ax.set_xlabel("x")
+  ax.set_ylabel("y")
+  ax.grid()
+  fig.tight_layout()
+  return savefig(fig, output)
+
+def pyplot_request(output):
+  fig, ax = plt.subplots(figsize=canvas.FIGURE_SIZES["small"])
+  draw(fig, ax, output)
+  plt.close(fig)
+
+def fresh_request(output):
+  fig = matplotlib.figure.Figure(figsize=canvas.FIGURE_SIZES["small"])
+  matplotlib.backends.backend_agg.FigureCanvasAgg(fig)
+  draw(fig, fig.subplots(), output)
+
+def pooled_request(output):
+  fig, ax = canvas.subplots("small")
+  draw(fig, ax, output)
+  canvas.release(fig)
+
+def measure(request, requests: int, output) -> dict:
+  for _ in range(3):
+    request(output)
+  start = time.perf_counter()
+  for _ in range(requests):
+    request(output)
+  seconds = (time.perf_counter() - start) / requests
+  tracemalloc.start()
+  request(output)
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return {"ms": 1000 * seconds, "peak_kib": peak / 1024}
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--requests", type=int, default=100)
+  parser.add_argument("--format", default="png", choices=["pdf", "png", "svg"])
+  args = parser.parse_args(argv)
+  output = OutputFormat(args.format)
+  print(f"{'path':<8} {'ms/request':>11} {'peak KiB':>9}")
+  for name, request in (("pyplot", pyplot_request), ("fresh", fresh_request), ("pooled", pooled_request)):
+    result = measure(request, args.requests, output)
+    print(f"{name:<8} {result['ms']:>11.2f} {result['peak_kib']:>9.0f}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,79 @@
+"""CSV parse time, throughput and peak RSS per readers engine against the previous pandas path.
+
+The sample is a two-series float CSV of about `--megabytes`, written by
+repeating one encoded block. `legacy` is what helper.load_data did before
+readers.py: pandas' default reader with a fixed header row and a transpose.
+Each case runs in a fresh process and reports the rise in peak RSS.
+
+  python -m benchmarks.bench_csv --megabytes 1024
+  python -m benchmarks.bench_csv --megabytes 64 --engines legacy pandas
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks import datagen
+from benchmarks.bench_ingest import _current_rss_kib, _peak_rss_kib
+
+BLOCK_ROWS = 100_000
+
+def write_sample(path: str, megabytes: int, columns: int = 2) -> int:
+  """Writes the header and whole blocks until the file reaches `megabytes`; returns the row count."""
+  block = datagen.encode(datagen.series(BLOCK_ROWS, columns), "csv", ["x"] + [f"y{i}" for i in range(1, columns)])
+  header, body = block.split(b"\n", 1)
+  rows = 0
+  with open(path, "wb") as f:
+    f.write(header + b"\n")
+    while f.tell() < megabytes * 2**20:
+      f.write(body)
+      rows += BLOCK_ROWS
+  return rows
+
+def _legacy(f):
+  import pandas as pd
+  df = pd.read_csv(f, encoding="utf-8", dtype=np.float64)
+  return df.to_numpy(dtype=float, copy=False).T
+
+def _measure(path: str, engine: str, queue):
+  import readers
+  before = _current_rss_kib()
+  start = time.perf_counter()
+  with open(path, "rb") as f:
+    data = _legacy(f) if engine == "legacy" else readers.read_csv(f, engine)[0]
+  elapsed = time.perf_counter() - start
+  queue.put({"seconds": elapsed, "peak_rss_mib": max(_peak_rss_kib() - before, 0) / 1024,
+    "contiguous": bool(data[0].flags.c_contiguous), "shape": data.shape})
+
+def measure(path: str, engine: str) -> dict:
+  context = multiprocessing.get_context("spawn")
+  queue = context.Queue()
+  process = context.Process(target=_measure, args=(path, engine, queue))
+  process.start()
+  result = queue.get()
+  process.join()
+  return result
+
+def main(argv=None):
+  import readers
+  engines = ["legacy"] + [name for name in readers.ENGINES if name != "pyarrow" or readers.pyarrow is not None]
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--megabytes", type=int, default=256)
+  parser.add_argument("--engines", nargs="+", default=engines, choices=engines)
+  parser.add_argument("--dir", help="where to write the sample (default: a temporary directory)")
+  args = parser.parse_args(argv)
+  with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+    path = os.path.join(directory, "sample.csv")
+    rows = write_sample(path, args.megabytes)
+    size = os.path.getsize(path) / 2**20
+    print(f"{size:.0f} MiB, {rows} rows\n")
+    print(f"{'engine':<8} {'seconds':>8} {'MiB/s':>8} {'peak MiB':>9} {'contiguous':>11}")
+    for engine in args.engines:
+      result = measure(path, engine)
+      print(f"{engine:<8} {result['seconds']:>8.2f} {size / result['seconds']:>8.1f} {result['peak_rss_mib']:>9.0f} "
+        f"{str(result['contiguous']):>11}")
+
+if __name__ == "__main__":
+  sys.exit(main())
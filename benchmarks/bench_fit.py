@@ -0,0 +1,85 @@
+"""Convergence of the curve fits on synthetic noisy data, with and without the
+data-driven initial guesses and analytic Jacobians in fitting.py.
+
+`plain` is the old call, `curve_fit(model, x, y)` with p0 all ones and a
+finite-difference Jacobian; `guided` is fitting.curvefit. A fit counts as a
+success when it converges and recovers every true parameter to 10%.
+
+  python -m benchmarks.bench_fit --trials 200 --noise 0.05
+"""
+import argparse
+import time
+import warnings
+import numpy as np
+from scipy.optimize import OptimizeWarning, curve_fit
+import fitting
+
+def sample(model: str, rng, points: int, noise: float):
+  if model == "exponential":
+    truth = [rng.uniform(0.5, 20), rng.uniform(-3, 3)]
+    x = np.linspace(0, 3, points)
+  elif model == "logistic":
+    truth = [rng.uniform(1, 100), rng.uniform(0.5, 5), rng.uniform(-10, 10)]
+    x = np.linspace(truth[2] - 8 / truth[1], truth[2] + 8 / truth[1], points)
+  elif model == "gaussian":
+    truth = [rng.uniform(1, 100), rng.uniform(-50, 50), rng.uniform(0.5, 10)]
+    x = np.linspace(truth[1] - 5 * truth[2], truth[1] + 5 * truth[2], points)
+  elif model == "power_law":
+    truth = [rng.uniform(0.5, 20), rng.uniform(-2, 3)]
+    x = np.linspace(0.5, 50, points)
+  else:
+    raise ValueError(model)
+  fn = fitting.MODELS[model][0]
+  y = fn(x, *truth)
+  y = y + rng.normal(scale=noise * np.std(y), size=points)
+  return x, y, np.array(truth)
+
+def plain(model: str, x, y):
+  params, _, info, _, _ = curve_fit(fitting.MODELS[model][0], x, y, full_output=True)
+  return params, int(info["nfev"])
+
+def guided(model: str, x, y):
+  stats = fitting.curvefit(model, np.array([x, y]))
+  return np.array(list(stats["params"].values())), stats["nfev"]
+
+def run(model: str, method, trials: int, points: int, noise: float, seed: int) -> dict:
+  rng = np.random.default_rng(seed)
+  successes, nfevs, seconds = 0, [], []
+  for _ in range(trials):
+    x, y, truth = sample(model, rng, points, noise)
+    start = time.perf_counter()
+    try:
+      with warnings.catch_warnings():
+        warnings.simplefilter("ignore", (OptimizeWarning, RuntimeWarning))
+        params, nfev = method(model, x, y)
+    except (RuntimeError, ValueError):
+      seconds.append(time.perf_counter() - start)
+      continue
+    seconds.append(time.perf_counter() - start)
+    nfevs.append(nfev)
+    # sigma enters the Gaussian squared, so its sign is not identifiable
+    if model == "gaussian":
+      params = np.r_[params[:2], abs(params[2])]
+    successes += bool(np.all(np.abs(params - truth) <= 0.1 * np.abs(truth) + 1e-9))
+  return {
+    "success": successes / trials,
+    "median_ms": 1000 * float(np.median(seconds)),
+    "mean_nfev": float(np.mean(nfevs)) if nfevs else float("nan"),
+  }
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--trials", type=int, default=100)
+  parser.add_argument("--points", type=int, default=200)
+  parser.add_argument("--noise", type=float, default=0.05, help="noise as a fraction of the signal's std")
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--models", nargs="+", default=["exponential", "logistic", "gaussian", "power_law"])
+  args = parser.parse_args(argv)
+  print(f"{'model':<12} {'method':<7} {'success':>8} {'median ms':>10} {'mean nfev':>10}")
+  for model in args.models:
+    for name, method in (("plain", plain), ("guided", guided)):
+      result = run(model, method, args.trials, args.points, args.noise, args.seed)
+      print(f"{model:<12} {name:<7} {result['success']:>8.1%} {result['median_ms']:>10.2f} {result['mean_nfev']:>10.1f}")
+
+if __name__ == "__main__":
+  main()
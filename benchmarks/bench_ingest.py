@@ -0,0 +1,88 @@
+"""Peak RSS of helper.load_data per input format and file size.
+
+Each case runs in a fresh process and reports how far the peak RSS rose above
+the resident size just before the load. The `bytes` path mirrors the old
+`await file.read()` handlers; the `stream` path hands the parser the open file
+like the routers do now.
+
+  python -m benchmarks.bench_ingest --rows 100000 1000000
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import numpy as np
+from benchmarks import datagen
+
+FORMATS = datagen.FORMATS
+
+def write_sample(directory: str, file_ext: str, rows: int) -> str:
+  path = os.path.join(directory, f"sample_{rows}.{file_ext}")
+  with open(path, "wb") as f:
+    f.write(datagen.encode(np.random.default_rng(0).normal(size=(2, rows)), file_ext, ["x", "y"]))
+  return path
+
+def _peak_rss_kib() -> int:
+  # ru_maxrss survives exec, so a spawned child would report the parent's peak; VmHWM starts afresh
+  try:
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # macOS reports bytes, Linux reports KiB
+  return peak // 1024 if sys.platform == "darwin" else peak
+
+def _current_rss_kib() -> int:
+  try:
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("VmRSS:"):
+          return int(line.split()[1])
+  except OSError:
+    pass
+  return _peak_rss_kib()
+
+def _measure(path: str, file_ext: str, mode: str, queue):
+  import helper
+  before = _current_rss_kib()
+  start = time.perf_counter()
+  with open(path, "rb") as f:
+    source = f.read() if mode == "bytes" else f
+    data, _ = helper.load_data(file_ext, source)
+    elapsed = time.perf_counter() - start
+  queue.put({"peak_rss_mib": max(_peak_rss_kib() - before, 0) / 1024, "array_mib": np.asarray(data).nbytes / 2**20, "seconds": elapsed})
+
+def measure(path: str, file_ext: str, mode: str) -> dict:
+  context = multiprocessing.get_context("spawn")
+  queue = context.Queue()
+  process = context.Process(target=_measure, args=(path, file_ext, mode, queue))
+  process.start()
+  result = queue.get()
+  process.join()
+  return result
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000])
+  parser.add_argument("--formats", nargs="+", default=list(FORMATS), choices=FORMATS)
+  args = parser.parse_args(argv)
+  print(f"{'format':<6} {'rows':>10} {'file MiB':>9} {'mode':<7} {'peak MiB':>9} {'array MiB':>10} {'seconds':>8}")
+  with tempfile.TemporaryDirectory() as directory:
+    for rows in args.rows:
+      for file_ext in args.formats:
+        path = write_sample(directory, file_ext, rows)
+        size = os.path.getsize(path) / 2**20
+        for mode in ("bytes", "stream"):
+          result = measure(path, file_ext, mode)
+          print(f"{file_ext:<6} {rows:>10} {size:>9.1f} {mode:<7} {result['peak_rss_mib']:>9.1f} "
+            f"{result['array_mib']:>10.1f} {result['seconds']:>8.3f}")
+        os.remove(path)
+
+if __name__ == "__main__":
+  main()
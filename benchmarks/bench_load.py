@@ -0,0 +1,85 @@
+"""In-process load test: throughput and latency percentiles per endpoint under concurrency.
+
+Requests go through the whole ASGI app (middleware, form parsing, the render
+pool) over httpx's ASGI transport, so no server or network is involved.
+Authentication is stubbed out and the result cache is off unless `--cache` is
+given, so every request really renders.
+
+  python -m benchmarks.bench_load --endpoints /plot/scatter /fit/gaussfit --rows 100 100000 --concurrency 1 8
+  python -m benchmarks.bench_load --requests 50 --save load.json
+  python -m benchmarks.bench_load --requests 50 --compare load.json
+"""
+import argparse
+import asyncio
+import sys
+import time
+import httpx
+from benchmarks import datagen, harness
+
+async def run_case(client: httpx.AsyncClient, endpoint: str, rows: int, requests: int, concurrency: int) -> dict:
+  files, fields = datagen.ENDPOINTS[endpoint](rows)
+  latencies, statuses = [], {}
+  remaining = iter(range(requests))
+
+  async def worker():
+    for _ in remaining:
+      start = time.perf_counter()
+      response = await client.post(endpoint, files=files, data=fields)
+      latencies.append(time.perf_counter() - start)
+      statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+  # One request first so worker start-up and imports are not measured
+  await client.post(endpoint, files=files, data=fields)
+  start = time.perf_counter()
+  await asyncio.gather(*(worker() for _ in range(concurrency)))
+  elapsed = time.perf_counter() - start
+  return {
+    "seconds": harness.percentile(latencies, 50),
+    "p90": harness.percentile(latencies, 90),
+    "p99": harness.percentile(latencies, 99),
+    "throughput": requests / elapsed,
+    "errors": sum(count for status, count in statuses.items() if status != 200),
+    "statuses": {str(status): count for status, count in statuses.items()},
+  }
+
+async def run(args) -> dict:
+  import main
+  import result_cache
+  from executor import render_executor
+  user = {"email": "bench@example.com"}
+  main.app.dependency_overrides[main.get_current_user] = lambda: user
+  main.app.dependency_overrides[main.authorize_action] = lambda: user
+  if not args.cache:
+    result_cache.cache.max_bytes = 0
+    result_cache.cache.directory = None
+  results = {}
+  print(f"{'case':<40} {'req/s':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'errors':>7}")
+  transport = httpx.ASGITransport(app=main.app)
+  try:
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+      for endpoint in args.endpoints:
+        for rows in args.rows:
+          for concurrency in args.concurrency:
+            name = f"{endpoint}:{rows}:c{concurrency}"
+            result = await run_case(client, endpoint, rows, args.requests, concurrency)
+            results[name] = result
+            print(f"{name:<40} {result['throughput']:>8.1f} {1000 * result['seconds']:>9.1f} {1000 * result['p90']:>9.1f} "
+              f"{1000 * result['p99']:>9.1f} {result['errors']:>7}")
+  finally:
+    render_executor.shutdown()
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--endpoints", nargs="+", default=list(datagen.ENDPOINTS), choices=list(datagen.ENDPOINTS), metavar="ENDPOINT")
+  parser.add_argument("--rows", type=int, nargs="+", default=[1000])
+  parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+  parser.add_argument("--requests", type=int, default=32, help="requests per case")
+  parser.add_argument("--cache", action="store_true", help="leave the result cache on")
+  harness.add_arguments(parser)
+  args = parser.parse_args(argv)
+  results = asyncio.run(run(args))
+  return harness.finish(args, results, "load")
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,109 @@
+"""Per-function timings of the request pipeline against input size.
+
+Covers helper.load_data for every upload format, normalize_data and
+handle_missing_values, every plot.* and fit.* function, and serializing a
+finished figure. `--rows` is points per series, or cells for heatmaps and
+meshes. Each case reports the median of repeated calls.
+
+  python -m benchmarks.bench_micro --rows 10 1000 100000 --save baseline.json
+  python -m benchmarks.bench_micro --rows 10 1000 100000 --compare baseline.json
+  python -m benchmarks.bench_micro --only "fit\\.|load_data:csv" --rows 10 10000000
+"""
+import argparse
+import re
+import sys
+import numpy as np
+import canvas
+import fit
+import helper
+import plot
+from benchmarks import datagen, harness
+from formats import OutputFormat, savefig, serialize
+
+XY = ["x", "y"]
+Z = ["x", "y", "z"]
+
+def _compose(rows: int):
+  data = [datagen.series(rows, seed=seed) for seed in range(4)]
+  return plot.compose, (data, ["a", "b", "c", "d"], ["scatter"] * 4, "grid", XY, "Benchmark", "large")
+
+# Name -> rows -> (function, positional arguments)
+PLOTS = {
+  "scatter": lambda rows: (plot.scatter, (datagen.series(rows), XY, "small")),
+  "errbar1x": lambda rows: (plot.errbar1x, (datagen.errors(rows), XY, "small")),
+  "errbar1y": lambda rows: (plot.errbar1y, (datagen.errors(rows), XY, "small")),
+  "errbar2xy": lambda rows: (plot.errbar2xy, (datagen.errors(rows, 4), XY, "small")),
+  "bar": lambda rows: (plot.bar, (datagen.series(rows), XY, "small")),
+  "pie": lambda rows: (plot.pie, (np.arange(1.0, 6.0)[None], list("ABCDE"), "small")),
+  # boxplot draws one box per column of the array it gets
+  "boxplot": lambda rows: (plot.boxplot, (datagen.series(rows, 3)[1:].T, ["a", "b"], "small", "x", "y")),
+  "eqhist": lambda rows: (plot.eqhist, (datagen.series(rows)[1], None, 50, "y", "count", "small")),
+  "varyhist": lambda rows: (plot.varyhist, (datagen.series(rows), None, "x", "count", "small")),
+  "imshowhmap": lambda rows: (plot.imshowhmap, (datagen.matrix(rows), Z, "Benchmark", "viridis", "lower", "large")),
+  "pmhmap": lambda rows: (plot.pmhmap, (datagen.matrix(rows), Z, "Benchmark", "viridis", "auto", "large")),
+  "pmChmap": lambda rows: (plot.pmChmap, (datagen.matrix(rows), np.vstack([np.arange(datagen.side(rows), dtype=float)] * 2), Z,
+    "Benchmark", "viridis", "nearest", "large")),
+  "pmfhmap": lambda rows: (plot.pmfhmap, (*datagen.mesh(rows), Z, "Benchmark", "viridis", "auto", "np.sin(x) * np.cos(y)", "large")),
+  "contourmap": lambda rows: (plot.contourmap, (*datagen.mesh(rows), "Benchmark", "viridis", 10, "np.sin(x) * np.cos(y)", "large", Z)),
+  "compose": _compose,
+}
+FITS = {
+  "polyfit": lambda rows: (fit.polyfit, (datagen.curve("polynomial", rows), XY, 3, "small")),
+  "expfit": lambda rows: (fit.expfit, (datagen.curve("exponential", rows), XY, "small")),
+  "logfit": lambda rows: (fit.logfit, (datagen.curve("logistic", rows), XY, "small")),
+  "gaussfit": lambda rows: (fit.gaussfit, (datagen.curve("gaussian", rows), XY, "small")),
+  "powfit": lambda rows: (fit.powfit, (datagen.curve("power_law", rows), XY, "small")),
+  "poissonfit": lambda rows: (fit.poissonfit, (datagen.curve("poisson", min(rows, 50)), XY, "small")),
+}
+
+def cases(rows_list: list[int]):
+  """Yields (name, setup) for every case; setup builds the inputs and returns the callable to time."""
+  for rows in rows_list:
+    for file_ext in datagen.FORMATS:
+      yield f"load_data:{file_ext}:{rows}", lambda file_ext=file_ext, rows=rows: _load(file_ext, rows)
+    yield f"normalize_data:{rows}", lambda rows=rows: lambda data=datagen.series(rows): helper.normalize_data(data, "zscore")
+    yield f"handle_missing_values:{rows}", lambda rows=rows: lambda data=datagen.series(rows): helper.handle_missing_values(data, "median")
+    for prefix, builders in (("plot", PLOTS), ("fit", FITS)):
+      for name, build in builders.items():
+        yield f"{prefix}.{name}:{rows}", lambda build=build, rows=rows: _bind(*build(rows))
+    for fmt in ("pdf", "png", "svg"):
+      yield f"savefig:{fmt}:{rows}", lambda fmt=fmt, rows=rows: _serialize(rows, OutputFormat(fmt))
+
+def _load(file_ext: str, rows: int):
+  upload = datagen.encode(datagen.series(rows), file_ext, XY)
+  return lambda: helper.load_data(file_ext, upload)
+
+def _bind(fn, args):
+  return lambda: serialize(fn(*args))
+
+def _serialize(rows: int, output: OutputFormat):
+  data = datagen.series(rows)
+  fig, ax = canvas.subplots("small")
+  ax.scatter(data[0], data[1])
+  fig.tight_layout()
+  return lambda: savefig(fig, output)
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100_000])
+  parser.add_argument("--only", help="regular expression selecting case names")
+  parser.add_argument("--min-time", type=float, default=0.2, help="seconds to spend repeating each case")
+  harness.add_arguments(parser)
+  args = parser.parse_args(argv)
+  only = re.compile(args.only) if args.only else None
+  results = {}
+  print(f"{'case':<48} {'median ms':>10} {'min ms':>10} {'runs':>5}")
+  for name, setup in cases(args.rows):
+    if only is not None and not only.search(name):
+      continue
+    try:
+      result = harness.timeit(setup(), args.min_time)
+    except Exception as e:
+      print(f"{name:<48} failed: {e}")
+      continue
+    results[name] = result
+    print(f"{name:<48} {1000 * result['seconds']:>10.2f} {1000 * result['min']:>10.2f} {result['runs']:>5}")
+  return harness.finish(args, results, "micro")
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,40 @@
+"""PDF size and render time of dense heatmaps with and without rasterization.
+
+  python -m benchmarks.bench_rasterize --grid 100 500 1000 2000
+"""
+import argparse
+import time
+import numpy as np
+import plot
+from formats import serialize
+
+def render(grid: int, kind: str):
+  rng = np.random.default_rng(0)
+  if kind == "pmhmap":
+    data = rng.random((grid, grid))
+    return plot.pmhmap(data, ["x", "y", "z"], "Benchmark", "viridis", "auto", "large")
+  X, Y = np.meshgrid(np.linspace(-3, 3, grid), np.linspace(-3, 3, grid))
+  return plot.contourmap(X, Y, "Benchmark", "viridis", 10, "np.sin(x) * np.cos(y)", "large", ["x", "y", "z"])
+
+def measure(grid: int, kind: str, threshold: int) -> tuple[float, int]:
+  plot.RASTERIZE_MIN_CELLS = threshold
+  start = time.perf_counter()
+  buf = serialize(render(grid, kind))
+  return time.perf_counter() - start, len(buf.getvalue())
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--grid", type=int, nargs="+", default=[100, 500, 1000])
+  parser.add_argument("--kinds", nargs="+", default=["pmhmap", "contour"], choices=["pmhmap", "contour"])
+  args = parser.parse_args(argv)
+  default_threshold = plot.RASTERIZE_MIN_CELLS
+  print(f"{'kind':<8} {'grid':>6} {'vector s':>9} {'vector KiB':>11} {'raster s':>9} {'raster KiB':>11}")
+  for kind in args.kinds:
+    for grid in args.grid:
+      vector_seconds, vector_bytes = measure(grid, kind, threshold=np.iinfo(np.int64).max)
+      raster_seconds, raster_bytes = measure(grid, kind, threshold=default_threshold)
+      print(f"{kind:<8} {grid:>6} {vector_seconds:>9.2f} {vector_bytes / 1024:>11.0f} {raster_seconds:>9.2f} {raster_bytes / 1024:>11.0f}")
+  plot.RASTERIZE_MIN_CELLS = default_threshold
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,154 @@
+"""Synthetic uploads for the benchmarks: arrays of a given size, encoded the way clients send them.
+
+`series` and `curve` give (columns, rows) arrays like helper.load_data returns,
+`mesh` and `matrix` give square 2D grids with about `rows` cells, and `encode`
+turns any of them into the bytes of a CSV, JSON, NDJSON, NPY, NPZ or HDF5 upload, or a
+Parquet, Feather or Arrow IPC stream one when pyarrow is installed.
+`ENDPOINTS` describes a valid request for every route at a given size.
+"""
+import io
+import json
+import math
+import h5py
+import numpy as np
+import readers
+
+FORMATS = ("csv", "json", "ndjson", "npy", "npz", "h5")
+if readers.pyarrow is not None:
+  FORMATS += ("parquet", "feather", "arrows")
+
+def series(rows: int, columns: int = 2, seed: int = 0) -> np.ndarray:
+  """Sorted x values and `columns - 1` noisy random walks over them."""
+  rng = np.random.default_rng(seed)
+  x = np.linspace(0, 100, rows)
+  return np.vstack([x, *(rng.normal(size=(columns - 1, rows)).cumsum(axis=1))])
+
+def errors(rows: int, columns: int = 3, seed: int = 0) -> np.ndarray:
+  """x, y and `columns - 2` positive error columns."""
+  rng = np.random.default_rng(seed)
+  data = series(rows, 2, seed)
+  return np.vstack([data, rng.uniform(0.05, 0.5, size=(columns - 2, rows))])
+
+def curve(model: str, rows: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+  """Noisy samples of a fitting.py model, shaped so its fit converges."""
+  rng = np.random.default_rng(seed)
+  if model == "exponential":
+    x = np.linspace(0, 3, rows)
+    y = 2 * np.exp(0.8 * x)
+  elif model == "logistic":
+    x = np.linspace(-10, 10, rows)
+    y = 50 / (1 + np.exp(-1.5 * x))
+  elif model == "gaussian":
+    x = np.linspace(-20, 20, rows)
+    y = 30 * np.exp(-x ** 2 / (2 * 4 ** 2))
+  elif model == "power_law":
+    x = np.linspace(0.5, 50, rows)
+    y = 3 * x ** 1.5
+  elif model == "poisson":
+    x = np.arange(rows, dtype=float)
+    counts = np.bincount(rng.poisson(min(4.0, rows / 3), size=100 * rows), minlength=rows)[:rows]
+    return np.vstack([x, counts.astype(float)])
+  else:
+    x = np.linspace(-5, 5, rows)
+    y = 0.5 * x ** 3 - x ** 2 + 2
+  return np.vstack([x, y + noise * np.abs(y).mean() * rng.normal(size=rows)])
+
+def side(cells: int) -> int:
+  return max(2, math.isqrt(cells))
+
+def matrix(cells: int, seed: int = 0) -> np.ndarray:
+  n = side(cells)
+  return np.random.default_rng(seed).normal(size=(n, n))
+
+def mesh(cells: int) -> tuple[np.ndarray, np.ndarray]:
+  n = side(cells)
+  return np.meshgrid(np.linspace(-3, 3, n), np.linspace(-3, 3, n))
+
+def encode(data: np.ndarray, file_ext: str, headers: list[str] | None = None) -> bytes:
+  """The upload a client would send for `data`, in helper.load_data's layout for that format.
+
+  CSVs hold one series per column; with `headers=None` a 2D array is written as a
+  matrix (first header "m"), which load_data keeps as rows.
+  """
+  data = np.asarray(data, dtype=float)
+  buf = io.BytesIO()
+  if file_ext == "csv":
+    if headers is None:
+      header = ",".join(["m"] + ["_"] * (data.shape[1] - 1))
+      np.savetxt(buf, data, delimiter=",", header=header, comments="", fmt="%.17g")
+    else:
+      np.savetxt(buf, np.atleast_2d(data).T, delimiter=",", header=",".join(headers), comments="", fmt="%.17g")
+  elif file_ext == "json":
+    names = headers or [f"c{i}" for i in range(len(data))]
+    buf.write(json.dumps({name: column.tolist() for name, column in zip(names, np.atleast_2d(data))}).encode("utf-8"))
+  elif file_ext == "ndjson":
+    names = headers or [f"c{i}" for i in range(len(data))]
+    for row in np.atleast_2d(data).T.tolist():
+      buf.write(json.dumps(dict(zip(names, row))).encode("utf-8") + b"\n")
+  elif file_ext == "npy":
+    np.save(buf, data)
+  elif file_ext == "npz":
+    np.savez(buf, data=data)
+  elif file_ext == "h5":
+    with h5py.File(buf, "w") as f:
+      f.create_dataset("data", data=data)
+  elif file_ext in readers.COLUMNAR_FORMATS:
+    pyarrow = readers.pyarrow
+    names = headers or [f"c{i}" for i in range(len(data))]
+    table = pyarrow.table({name: column for name, column in zip(names, np.atleast_2d(data))})
+    if file_ext == "parquet":
+      readers.pa_parquet.write_table(table, buf)
+    elif file_ext == "arrows":
+      with readers.pa_ipc.new_stream(buf, table.schema) as writer:
+        writer.write_table(table)
+    else:
+      import pyarrow.feather
+      pyarrow.feather.write_feather(table, buf, compression="uncompressed")
+  else:
+    raise ValueError(f"Unknown format: {file_ext}")
+  return buf.getvalue()
+
+def _csv(name: str, data: np.ndarray, headers: list[str] | None) -> tuple[str, tuple[str, bytes, str]]:
+  return name, (f"{name}.csv", encode(data, "csv", headers), "text/csv")
+
+XY = ["x", "y"]
+HEATMAP = {"title": "Benchmark", "cmap": "viridis", "size": "large", "useAnnotation": "false", "normalization": "none",
+  "missing_values": "mean", "xlabel": "x", "ylabel": "y", "zlabel": "z"}
+
+def _fit(model: str):
+  return lambda rows: ([_csv("file", curve(model, rows), XY)], {"size": "small"})
+
+def _mesh_files(rows: int):
+  X, Y = mesh(rows)
+  return [_csv("files", X, None), _csv("files", Y, None)]
+
+# Route -> rows -> (multipart files, form fields); `rows` is points per series, or cells for meshes
+ENDPOINTS = {
+  "/plot/scatter": lambda rows: ([_csv("file", series(rows), XY)], {"size": "small"}),
+  "/plot/errbar1x": lambda rows: ([_csv("file", errors(rows), ["x", "y", "err"])], {"size": "small"}),
+  "/plot/errbar1y": lambda rows: ([_csv("file", errors(rows), ["x", "y", "err"])], {"size": "small"}),
+  "/plot/errbar2xy": lambda rows: ([_csv("file", errors(rows, 4), ["x", "y", "errx", "erry"])], {"size": "small"}),
+  "/plot/bar": lambda rows: ([_csv("file", series(rows), XY)], {"size": "small"}),
+  "/plot/pie": lambda rows: ([_csv("file", np.arange(1.0, 6.0)[None], ["share"])], {"size": "small", "categories": list("ABCDE")}),
+  # A matrix CSV keeps samples as rows, so the two columns become the two boxes
+  "/plot/boxplot": lambda rows: ([_csv("file", series(rows, 3)[1:].T, None)],
+    {"size": "small", "categories": ["a", "b"], "xlabel": "x", "ylabel": "y"}),
+  "/plot/eqhist": lambda rows: ([_csv("files", series(rows)[1:], ["y"])], {"bins": "50", "xlabel": "y", "ylabel": "count", "size": "small"}),
+  "/plot/varyhist": lambda rows: ([_csv("files", series(rows), XY)], {"xlabel": "x", "ylabel": "count", "size": "small"}),
+  "/plot/imshowhmap": lambda rows: ([_csv("file", matrix(rows), None)], {**HEATMAP, "origin": "lower"}),
+  "/plot/pmhmap": lambda rows: ([_csv("file", matrix(rows), None)], {**HEATMAP, "shading": "auto"}),
+  "/plot/pmChmap": lambda rows: ([_csv("files", matrix(rows), None),
+    _csv("files", np.vstack([np.arange(side(rows), dtype=float)] * 2), XY)], {**HEATMAP, "shading": "nearest"}),
+  "/plot/pmfhmap": lambda rows: (_mesh_files(rows), {**HEATMAP, "shading": "auto", "func": "np.sin(x) * np.cos(y)"}),
+  "/plot/contour": lambda rows: (_mesh_files(rows), {**HEATMAP, "levels": ["-1", "0", "1"], "func": "np.sin(x) * np.cos(y)"}),
+  "/plot/compose": lambda rows: ([_csv("files", series(rows, 2, seed), XY) for seed in range(4)], {"layout": "grid"}),
+  "/fit/polyfit": lambda rows: ([_csv("file", curve("polynomial", rows), XY)], {"size": "small", "poly_degree": "3"}),
+  "/fit/expfit": _fit("exponential"),
+  "/fit/logfit": _fit("logistic"),
+  "/fit/gaussfit": _fit("gaussian"),
+  "/fit/powfit": _fit("power_law"),
+  "/fit/poissonfit": lambda rows: ([_csv("file", curve("poisson", min(rows, 50)), XY)], {"size": "small"}),
+  "/fit/gaussfit/params": lambda rows: ([_csv("file", curve("gaussian", rows), XY)], {}),
+  "/fit/batch": lambda rows: ([("file", ("batch.npy", encode(np.vstack([curve("gaussian", rows, seed=seed) for seed in range(16)])[1::2], "npy"),
+    "application/octet-stream"))], {"model": "gaussfit", "x": "index"}),
+}
@@ -0,0 +1,75 @@
+"""Timing, JSON baselines and regression checks shared by bench_micro and bench_load.
+
+A run is a dict of case name -> metrics, where "seconds" is the figure compared
+against a baseline. `--save PATH` stores the run; `--compare PATH` prints each
+case against the stored one and exits with status 1 when any case got slower
+by more than `--tolerance`.
+"""
+import json
+import platform
+import sys
+import time
+from typing import Callable, Optional
+import numpy as np
+
+def timeit(fn: Callable[[], object], min_time: float = 0.2, max_runs: int = 50, min_runs: int = 3) -> dict:
+  """Runs `fn` until `min_time` has passed (at least `min_runs`, at most `max_runs`) after one warm-up call."""
+  fn()
+  times = []
+  deadline = time.perf_counter() + min_time
+  while len(times) < min_runs or (len(times) < max_runs and time.perf_counter() < deadline):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return {"seconds": float(np.median(times)), "min": float(np.min(times)), "runs": len(times)}
+
+def add_arguments(parser):
+  parser.add_argument("--save", metavar="PATH", help="store this run as a JSON baseline")
+  parser.add_argument("--compare", metavar="PATH", help="compare this run against a stored baseline")
+  parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown that counts as a regression (default 0.25 = 25%%)")
+
+def save(path: str, results: dict, benchmark: str):
+  document = {
+    "benchmark": benchmark,
+    "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "python": sys.version.split()[0],
+    "machine": platform.platform(),
+    "results": results,
+  }
+  with open(path, "w") as f:
+    json.dump(document, f, indent=2, sort_keys=True)
+
+def compare(baseline: dict, results: dict, tolerance: float) -> list[str]:
+  """Prints every case found in both runs and returns the names of the regressions."""
+  regressions = []
+  print(f"\n{'case':<48} {'baseline ms':>12} {'now ms':>10} {'change':>8}")
+  for name, result in results.items():
+    before = baseline.get(name)
+    if before is None or not before.get("seconds"):
+      continue
+    change = result["seconds"] / before["seconds"] - 1
+    flag = ""
+    if change > tolerance:
+      regressions.append(name)
+      flag = "  REGRESSION"
+    print(f"{name:<48} {1000 * before['seconds']:>12.2f} {1000 * result['seconds']:>10.2f} {change:>+8.0%}{flag}")
+  return regressions
+
+def finish(args, results: dict, benchmark: str) -> int:
+  """Saves and/or compares according to the command line; returns the process exit status."""
+  if args.save:
+    save(args.save, results, benchmark)
+  if args.compare:
+    with open(args.compare) as f:
+      baseline = json.load(f)
+    if baseline.get("benchmark") != benchmark:
+      print(f"{args.compare} is a {baseline.get('benchmark')} baseline, not {benchmark}", file=sys.stderr)
+      return 2
+    regressions = compare(baseline["results"], results, args.tolerance)
+    if regressions:
+      print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+      return 1
+  return 0
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+  return float(np.percentile(values, q)) if values else None
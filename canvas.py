@@ -0,0 +1,80 @@
+import os
+import threading
+from typing import Optional
+import matplotlib
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+# Figures are built directly on an Agg canvas: no pyplot figure manager, no global current figure
+FIGURE_SIZES = {
+  "small": (3.375, 3),
+  "large": (7, 3),
+  "stats": (7, 4),
+  "grid": (7, 7),
+}
+FIGURE_POOL_SIZE = int(os.getenv("FIGURE_POOL_SIZE", "4"))
+_SUBPLOT_PARAMS = ("left", "bottom", "right", "top", "wspace", "hspace")
+
+def preset(size: Optional[str]) -> str:
+  # Anything but "large" has always rendered at the small size
+  return size if size in FIGURE_SIZES else "small"
+
+class FigurePool:
+  """Idle figures per size preset, cleared on release and handed out again."""
+
+  def __init__(self, max_idle: int = FIGURE_POOL_SIZE):
+    self.max_idle = max_idle
+    self._idle: dict[str, list[Figure]] = {name: [] for name in FIGURE_SIZES}
+    self._lock = threading.Lock()
+    self.created = 0
+    self.reused = 0
+
+  def acquire(self, size: Optional[str] = None) -> Figure:
+    name = preset(size)
+    with self._lock:
+      fig = self._idle[name].pop() if self._idle[name] else None
+      if fig is None:
+        self.created += 1
+      else:
+        self.reused += 1
+    if fig is None:
+      fig = Figure(figsize=FIGURE_SIZES[name])
+      FigureCanvasAgg(fig)
+      fig._pool_preset = name
+    return fig
+
+  def release(self, fig: Figure):
+    name = getattr(fig, "_pool_preset", None)
+    if name is None:
+      return
+    # Figure.clear() would reset every Axes before dropping it, which costs more than building new ones
+    for ax in list(fig.axes):
+      fig.delaxes(ax)
+    fig.clear()
+    # clear() keeps figure-level state that tight_layout and friends change
+    fig.set_layout_engine(None)
+    fig.subplotpars.update(*(matplotlib.rcParams[f"figure.subplot.{param}"] for param in _SUBPLOT_PARAMS))
+    fig.set_size_inches(FIGURE_SIZES[name])
+    fig.set_dpi(matplotlib.rcParams["figure.dpi"])
+    with self._lock:
+      if len(self._idle[name]) < self.max_idle:
+        self._idle[name].append(fig)
+
+  def clear(self):
+    with self._lock:
+      for figures in self._idle.values():
+        figures.clear()
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {"created": self.created, "reused": self.reused, "idle": {name: len(figures) for name, figures in self._idle.items()}}
+
+pool = FigurePool()
+
+def subplots(size: Optional[str] = None, nrows: int = 1, ncols: int = 1, **kwargs):
+  """pyplot.subplots on a pooled figure for a size preset; hand the figure back with `release`."""
+  fig = pool.acquire(size)
+  return fig, fig.subplots(nrows, ncols, **kwargs)
+
+def release(fig: Figure):
+  pool.release(fig)
@@ -0,0 +1,154 @@
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from typing import BinaryIO, Optional
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.responses import PlainTextResponse
+import metrics
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# Compression suffix of an upload name (`data.csv.gz`) -> codec
+SUFFIXES = {"gz": "gzip", "gzip": "gzip", "bz2": "bz2", "zst": "zstd", "zstd": "zstd"}
+# Formats parsed front to back, so they read straight from the decompressor;
+# the rest need random access and are decompressed into a spooled temporary file first
+STREAMED_FORMATS = {"csv", "json", "ndjson", "jsonl", "arrows"}
+# Cap on the decompressed size of an upload or request body, so a small bomb cannot fill memory or disk
+MAX_INFLATED_BYTES = int(os.getenv("MAX_INFLATED_BYTES", str(512 << 20)))
+READ_CHUNK = 1 << 20
+# Content-Encoding -> zlib window bits
+REQUEST_ENCODINGS = {"gzip": 16 + zlib.MAX_WBITS, "x-gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+class DecompressionError(ValueError):
+  """A compressed upload that is corrupt, too large once inflated, or uses a codec that is not installed."""
+
+def split_extension(filename: str) -> tuple[str, str, Optional[str]]:
+  """Splits `run.csv.gz` into ("run", "csv", "gzip"); names without a compression suffix get codec None."""
+  parts = filename.rsplit(".", 2)
+  if len(parts) == 3 and parts[2].lower() in SUFFIXES:
+    return parts[0], parts[1].lower(), SUFFIXES[parts[2].lower()]
+  stem, _, file_ext = filename.rpartition(".")
+  return stem, file_ext.lower(), None
+
+class _Inflating(io.RawIOBase):
+  """Decompressed bytes of an upload, read on demand; stops at MAX_INFLATED_BYTES.
+
+  The time spent inflating is recorded as the "decompress" stage when the stream is closed.
+  """
+
+  def __init__(self, reader):
+    self._reader = reader
+    self._total = 0
+    self._seconds = 0.0
+
+  def readable(self) -> bool:
+    return True
+
+  def close(self):
+    if not self.closed:
+      metrics.record("decompress", self._seconds)
+      self._reader.close()
+    super().close()
+
+  def readinto(self, buffer) -> int:
+    start = time.perf_counter()
+    try:
+      count = self._reader.readinto(buffer)
+    except (OSError, EOFError, zlib.error) as e:
+      raise DecompressionError(f"Corrupt compressed upload: {e}")
+    except Exception as e:
+      if zstandard is not None and isinstance(e, zstandard.ZstdError):
+        raise DecompressionError(f"Corrupt compressed upload: {e}")
+      raise
+    finally:
+      self._seconds += time.perf_counter() - start
+    self._total += count
+    if self._total > MAX_INFLATED_BYTES:
+      raise DecompressionError(f"Upload is larger than {MAX_INFLATED_BYTES} bytes once decompressed")
+    return count
+
+def _decompressor(stream: BinaryIO, codec: str):
+  if codec == "gzip":
+    return gzip.GzipFile(fileobj=stream, mode="rb")
+  if codec == "bz2":
+    return bz2.BZ2File(stream, "rb")
+  if zstandard is None:
+    raise DecompressionError("zstd uploads need zstandard installed")
+  return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True, closefd=False)
+
+def open_decompressed(stream: BinaryIO, codec: str, file_ext: str, spool_max_memory: int) -> BinaryIO:
+  """A readable stream of the decompressed upload.
+
+  Streamed formats get a buffered, forward-only reader, so the inflated file never
+  exists in full; close it once parsed. The others are inflated chunk by chunk into
+  a spooled temporary file that rolls over to disk (where it can be memory-mapped)
+  past `spool_max_memory`.
+  """
+  reader = io.BufferedReader(_Inflating(_decompressor(stream, codec)), READ_CHUNK)
+  if file_ext in STREAMED_FORMATS:
+    return reader
+  spool = tempfile.SpooledTemporaryFile(max_size=spool_max_memory)
+  with reader:
+    shutil.copyfileobj(reader, spool, READ_CHUNK)
+  spool.seek(0)
+  return spool
+
+class DecompressRequestMiddleware:
+  """Pure ASGI middleware: inflates `Content-Encoding: gzip` (or deflate) request bodies as they arrive.
+
+  The app sees a plain body without Content-Encoding or Content-Length. Bodies are
+  handed on in READ_CHUNK pieces, so one small compressed message cannot expand in memory.
+  """
+
+  def __init__(self, app, max_bytes: int = MAX_INFLATED_BYTES):
+    self.app = app
+    self.max_bytes = max_bytes
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+    encoding = Headers(scope=scope).get("content-encoding", "identity").strip().lower()
+    if encoding == "identity":
+      await self.app(scope, receive, send)
+      return
+    if encoding not in REQUEST_ENCODINGS:
+      await PlainTextResponse(f"Unsupported Content-Encoding: {encoding}", status_code=415)(scope, receive, send)
+      return
+    scope = dict(scope)
+    scope["headers"] = [(name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")]
+    inflater = zlib.decompressobj(REQUEST_ENCODINGS[encoding])
+    state = {"pending": b"", "more": True, "total": 0}
+
+    async def receive_inflated():
+      while True:
+        if not state["pending"] and state["more"]:
+          message = await receive()
+          if message["type"] != "http.request":
+            return message
+          state["pending"] = message.get("body", b"")
+          state["more"] = message.get("more_body", False)
+        try:
+          body = inflater.decompress(state["pending"], READ_CHUNK)
+          state["pending"] = inflater.unconsumed_tail
+          more = state["more"] or bool(state["pending"])
+          if not more:
+            body += inflater.flush()
+        except zlib.error as e:
+          raise HTTPException(status_code=400, detail=f"Invalid {encoding} request body: {e}")
+        state["total"] += len(body)
+        if state["total"] > self.max_bytes:
+          raise HTTPException(status_code=413, detail=f"Request body is larger than {self.max_bytes} bytes once decompressed")
+        if body or not more:
+          return {"type": "http.request", "body": body, "more_body": more}
+
+    await self.app(scope, receive_inflated, send)
@@ -0,0 +1,143 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from fastapi import HTTPException
+import formats
+import metrics
+import profiling
+
+RENDER_EXECUTOR = os.getenv("RENDER_EXECUTOR", "process")
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+RENDER_MAX_QUEUE = int(os.getenv("RENDER_MAX_QUEUE", "32"))
+RENDER_TIMEOUT = float(os.getenv("RENDER_TIMEOUT", "60"))
+RENDER_RETRY_AFTER = int(os.getenv("RENDER_RETRY_AFTER", "5"))
+RENDER_START_METHOD = os.getenv("RENDER_START_METHOD", "spawn")
+
+def _warm_up():
+  # Pay the matplotlib/scipy import cost once per worker instead of on the first job
+  import plot  # noqa: F401
+  import fit  # noqa: F401
+
+class RenderExecutor:
+  """Bounded pool that runs CPU-heavy plotting and fitting jobs off the event loop."""
+
+  def __init__(self, kind: str = RENDER_EXECUTOR, workers: int = RENDER_WORKERS, max_queue: int = RENDER_MAX_QUEUE,
+    timeout: float = RENDER_TIMEOUT, retry_after: int = RENDER_RETRY_AFTER):
+    if kind not in ("process", "thread"):
+      raise ValueError(f"Unknown render executor kind: {kind}")
+    self.kind = kind
+    self.workers = max(1, workers)
+    self.max_queue = max(0, max_queue)
+    self.timeout = timeout
+    self.retry_after = retry_after
+    self._pool = None
+    self._in_flight = 0
+    self._lock = threading.Lock()
+
+  @property
+  def capacity(self) -> int:
+    return self.workers + self.max_queue
+
+  @property
+  def in_flight(self) -> int:
+    return self._in_flight
+
+  def _create_pool(self):
+    if self.kind == "thread":
+      return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+    context = multiprocessing.get_context(RENDER_START_METHOD)
+    return ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_warm_up)
+
+  def start(self):
+    with self._lock:
+      if self._pool is None:
+        self._pool = self._create_pool()
+      return self._pool
+
+  def shutdown(self, wait: bool = True):
+    with self._lock:
+      pool, self._pool = self._pool, None
+    if pool is not None:
+      pool.shutdown(wait=wait, cancel_futures=True)
+
+  def _discard(self, pool):
+    # A crashed worker poisons the whole process pool, so replace it for the next job
+    with self._lock:
+      if self._pool is pool:
+        self._pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+  def _terminate(self, pool):
+    # A job cannot be cancelled once a worker has picked it up; killing the workers frees them and,
+    # through BrokenProcessPool, the slots of every job still on this pool
+    with self._lock:
+      if self._pool is pool:
+        self._pool = None
+    for process in list((pool._processes or {}).values()):
+      process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+  def _release(self, _future=None):
+    with self._lock:
+      self._in_flight -= 1
+
+  def _busy(self, detail: str):
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(self.retry_after)})
+
+  async def run(self, fn, *args, **kwargs):
+    with self._lock:
+      if self._in_flight >= self.capacity:
+        raise self._busy("Render queue is full, try again later")
+      self._in_flight += 1
+    pool = self.start()
+    try:
+      future = pool.submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+      self._release()
+      self._discard(pool)
+      raise self._busy("Render worker crashed, try again later")
+    except BaseException:
+      self._release()
+      raise
+    # The slot is held until the job really finishes, not when the caller stops waiting
+    future.add_done_callback(self._release)
+    try:
+      return await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)
+    except asyncio.TimeoutError:
+      if not future.cancel() and self.kind == "process":
+        self._terminate(pool)
+      raise HTTPException(status_code=504, detail="Rendering timed out")
+    except BrokenProcessPool:
+      self._discard(pool)
+      raise self._busy("Render worker crashed, try again later")
+
+render_executor = RenderExecutor()
+
+async def render(fn, *args, **kwargs):
+  """Runs a plot or fit function on the render pool, mapping failures to HTTP errors.
+
+  Figures are serialized in the worker to the request's output format (formats.serialize).
+  The job's own stage timings and its wait for a worker are added to the current request's,
+  and so is its profile when the request is being profiled.
+  """
+  session = profiling.active()
+  job = (formats.rendered, formats.current(), fn)
+  if session is not None:
+    job = (profiling.profiled, session.mode, *job)
+  submitted = time.time()
+  try:
+    with metrics.stage("render"):
+      result, timings = await render_executor.run(metrics.collect, *job, *args, **kwargs)
+  except HTTPException:
+    raise
+  except Exception as e:
+    raise HTTPException(status_code=500, detail=f"Error rendering result: {str(e)}")
+  metrics.record_worker(timings, submitted)
+  if session is not None:
+    result, worker_profile = result
+    session.merge(worker_profile)
+  return result
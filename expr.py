@@ -0,0 +1,285 @@
+import ast
+import numbers
+import os
+from functools import lru_cache
+from typing import Optional
+import numpy as np
+import scipy
+import scipy.constants  # noqa: F401
+import scipy.special  # noqa: F401
+
+try:
+  import numexpr
+except ImportError:
+  numexpr = None
+
+EXPR_CACHE_SIZE = int(os.getenv("EXPR_CACHE_SIZE", "256"))
+# Elements evaluated per chunk: keeps each temporary cache-sized instead of mesh-sized
+EXPR_CHUNK_ELEMENTS = int(os.getenv("EXPR_CHUNK_ELEMENTS", str(1 << 16)))
+EXPR_NUMEXPR = os.getenv("EXPR_NUMEXPR", "1") != "0"
+MAX_EXPRESSION_LENGTH = 1000
+
+VARIABLES = ("x", "y")
+NAMES = {
+  "np": np,
+  "sp": scipy,
+  "pi": np.pi,
+  "e": np.e,
+  "abs": np.abs,
+  "pow": np.power,
+  "min": np.minimum,
+  "max": np.maximum,
+}
+# Elementwise numpy functions that are not ufuncs (anything reducing over an axis would break chunking),
+# with their positional and keyword value arguments; `out`, `where` and nan_to_num's `copy` would let a
+# call write into the mesh
+ELEMENTWISE = {
+  np.where: (3, set()),
+  np.clip: (3, set()),
+  np.round: (2, {"decimals"}),
+  np.around: (2, {"decimals"}),
+  np.sinc: (1, set()),
+  np.nan_to_num: (1, {"nan", "posinf", "neginf"}),
+  np.angle: (2, {"deg"}),
+  np.real: (1, set()),
+  np.imag: (1, set()),
+}
+BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+UNARY_OPERATORS = (ast.UAdd, ast.USub, ast.Invert)
+COMPARISONS = (ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE)
+# Integer literals passed straight to a call must fit a C int (np.round's decimals)
+MAX_INTEGER_ARGUMENT = 2**31 - 1
+# numpy spellings numexpr understands
+NUMEXPR_FUNCTIONS = {
+  np.sin: "sin", np.cos: "cos", np.tan: "tan", np.arcsin: "arcsin", np.arccos: "arccos", np.arctan: "arctan",
+  np.arctan2: "arctan2", np.sinh: "sinh", np.cosh: "cosh", np.tanh: "tanh", np.arcsinh: "arcsinh",
+  np.arccosh: "arccosh", np.arctanh: "arctanh", np.log: "log", np.log10: "log10", np.log1p: "log1p",
+  np.exp: "exp", np.expm1: "expm1", np.sqrt: "sqrt", np.abs: "abs", np.where: "where",
+}
+NUMEXPR_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Mod: "%", ast.Pow: "**",
+  ast.USub: "-", ast.UAdd: "+", ast.Invert: "~", ast.Eq: "==", ast.NotEq: "!=", ast.Lt: "<", ast.LtE: "<=",
+  ast.Gt: ">", ast.GtE: ">="}
+
+def _signature(fn) -> tuple[int, set[str]]:
+  """Positional and keyword value arguments `fn` may be called with; a ufunc's extra positionals are outputs."""
+  if isinstance(fn, np.ufunc):
+    return fn.nin, set()
+  return next(signature for candidate, signature in ELEMENTWISE.items() if candidate is fn)
+
+def _allowed_value(value) -> bool:
+  return isinstance(value, (np.ufunc, numbers.Number)) or any(value is fn for fn in ELEMENTWISE)
+
+class _Compiler(ast.NodeTransformer):
+  """Checks every node against the whitelist and replaces np/sp lookups with pre-resolved constants."""
+
+  def __init__(self, source: str):
+    self.source = source
+    self.constants: dict[str, object] = {}
+
+  def reject(self, node, reason: str):
+    raise ValueError(f"Unsupported expression {self.source!r}: {reason}")
+
+  def bind(self, node, value) -> ast.Name:
+    for name, bound in self.constants.items():
+      if bound is value:
+        return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+    name = f"_c{len(self.constants)}"
+    self.constants[name] = value
+    return ast.copy_location(ast.Name(id=name, ctx=ast.Load()), node)
+
+  def resolve(self, node):
+    if isinstance(node, ast.Name):
+      if node.id not in NAMES:
+        self.reject(node, f"unknown name {node.id!r}")
+      return NAMES[node.id]
+    if isinstance(node, ast.Attribute):
+      if node.attr.startswith("_"):
+        self.reject(node, f"private attribute {node.attr!r}")
+      try:
+        return getattr(self.resolve(node.value), node.attr)
+      except AttributeError:
+        self.reject(node, f"unknown attribute {node.attr!r}")
+    self.reject(node, f"{type(node).__name__} is not allowed here")
+
+  def generic_visit(self, node):
+    self.reject(node, f"{type(node).__name__} is not allowed")
+
+  def visit_Expression(self, node):
+    node.body = self.visit(node.body)
+    return node
+
+  def visit_Constant(self, node):
+    if not isinstance(node.value, numbers.Number) or isinstance(node.value, bool):
+      self.reject(node, "only numeric literals are allowed")
+    # Python ints are unbounded, so `9**9**9` would never finish; numpy scalars overflow to inf
+    return self.bind(node, np.complex128(node.value) if isinstance(node.value, complex) else np.float64(node.value))
+
+  def visit_Name(self, node):
+    if node.id in VARIABLES:
+      return node
+    value = self.resolve(node)
+    if not _allowed_value(value):
+      self.reject(node, f"{node.id!r} cannot be used on its own")
+    return self.bind(node, value)
+
+  def visit_Attribute(self, node):
+    value = self.resolve(node)
+    if not _allowed_value(value):
+      self.reject(node, f"{ast.unparse(node)!r} is not an elementwise function or constant")
+    return self.bind(node, value)
+
+  def visit_BinOp(self, node):
+    if not isinstance(node.op, BINARY_OPERATORS):
+      self.reject(node, f"operator {type(node.op).__name__}")
+    node.left, node.right = self.visit(node.left), self.visit(node.right)
+    return node
+
+  def visit_UnaryOp(self, node):
+    if not isinstance(node.op, UNARY_OPERATORS):
+      self.reject(node, f"operator {type(node.op).__name__}")
+    node.operand = self.visit(node.operand)
+    return node
+
+  def visit_Compare(self, node):
+    if not all(isinstance(op, COMPARISONS) for op in node.ops):
+      self.reject(node, "only numeric comparisons are allowed")
+    if len(node.ops) != 1:
+      self.reject(node, "chained comparisons are not elementwise")
+    node.left = self.visit(node.left)
+    node.comparators = [self.visit(comparator) for comparator in node.comparators]
+    return node
+
+  def visit_Call(self, node):
+    node.func = self.visit(node.func)
+    if node.func.id not in self.constants or not callable(self.constants[node.func.id]):
+      self.reject(node, "only functions can be called")
+    positional, keywords = _signature(self.constants[node.func.id])
+    if len(node.args) > positional:
+      self.reject(node, f"{ast.unparse(node.func)} takes at most {positional} positional arguments")
+    node.args = [self.argument(arg) for arg in node.args]
+    for keyword in node.keywords:
+      if keyword.arg not in keywords:
+        self.reject(node, f"keyword argument {keyword.arg or '**'!r} is not allowed")
+      keyword.value = self.argument(keyword.value)
+    return node
+
+  def argument(self, node):
+    # Integer arguments stay ints (np.round's decimals); everything else is bound as a numpy scalar
+    value = self.integer(node)
+    if value is None:
+      return self.visit(node)
+    return ast.copy_location(ast.Constant(value), node)
+
+  def integer(self, node) -> Optional[int]:
+    """Folds integer literal arithmetic such as `-10**3`, rejecting results outside MAX_INTEGER_ARGUMENT."""
+    if isinstance(node, ast.Constant):
+      value = node.value if isinstance(node.value, int) and not isinstance(node.value, bool) else None
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+      value = self.integer(node.operand)
+      if value is not None and isinstance(node.op, ast.USub):
+        value = -value
+    elif isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub, ast.Mult, ast.Pow)):
+      left, right = self.integer(node.left), self.integer(node.right)
+      if left is None or right is None or (isinstance(node.op, ast.Pow) and right < 0):
+        return None
+      if isinstance(node.op, ast.Pow) and abs(left) > 1 and right * (abs(left).bit_length() - 1) > MAX_INTEGER_ARGUMENT.bit_length():
+        self.reject(node, f"integer argument {ast.unparse(node)} is out of range")
+      value = {ast.Add: int.__add__, ast.Sub: int.__sub__, ast.Mult: int.__mul__, ast.Pow: int.__pow__}[type(node.op)](left, right)
+    else:
+      return None
+    if value is not None and abs(value) > MAX_INTEGER_ARGUMENT:
+      self.reject(node, f"integer argument {ast.unparse(node)} is out of range")
+    return value
+
+class _NumexprSource(ast.NodeVisitor):
+  """Spells a compiled tree the way numexpr.evaluate expects, or gives up with ValueError."""
+
+  def __init__(self, constants: dict[str, object]):
+    self.constants = constants
+
+  def generic_visit(self, node):
+    raise ValueError(type(node).__name__)
+
+  def visit_Constant(self, node):
+    return repr(node.value)
+
+  def visit_Name(self, node):
+    if node.id in VARIABLES:
+      return node.id
+    value = self.constants[node.id]
+    if isinstance(value, numbers.Number) and not isinstance(value, complex):
+      return repr(float(value))
+    raise ValueError(node.id)
+
+  def visit_BinOp(self, node):
+    if type(node.op) not in NUMEXPR_OPERATORS:
+      raise ValueError(type(node.op).__name__)
+    return f"({self.visit(node.left)} {NUMEXPR_OPERATORS[type(node.op)]} {self.visit(node.right)})"
+
+  def visit_UnaryOp(self, node):
+    return f"({NUMEXPR_OPERATORS[type(node.op)]}{self.visit(node.operand)})"
+
+  def visit_Compare(self, node):
+    return f"({self.visit(node.left)} {NUMEXPR_OPERATORS[type(node.ops[0])]} {self.visit(node.comparators[0])})"
+
+  def visit_Call(self, node):
+    fn = self.constants[node.func.id]
+    name = next((spelling for candidate, spelling in NUMEXPR_FUNCTIONS.items() if candidate is fn), None)
+    if name is None or node.keywords:
+      raise ValueError(node.func.id)
+    return f"{name}({', '.join(self.visit(arg) for arg in node.args)})"
+
+class Expression:
+  """A validated `func` string compiled to `fn(x, y)`, plus its numexpr spelling when it has one."""
+
+  def __init__(self, source: str, fn, numexpr_source: Optional[str]):
+    self.source = source
+    self.fn = fn
+    self.numexpr_source = numexpr_source
+
+  def __call__(self, x, y):
+    return self.fn(x, y)
+
+@lru_cache(maxsize=EXPR_CACHE_SIZE)
+def compile_expression(source: str) -> Expression:
+  """Parses `source` against the whitelist; raises ValueError for anything else."""
+  if len(source) > MAX_EXPRESSION_LENGTH:
+    raise ValueError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+  try:
+    tree = ast.parse(source.strip(), mode="eval")
+  except SyntaxError as e:
+    raise ValueError(f"Invalid expression {source!r}: {e.msg}")
+  compiler = _Compiler(source)
+  tree = ast.fix_missing_locations(compiler.visit(tree))
+  body = ast.Expression(ast.Lambda(
+    args=ast.arguments(posonlyargs=[], args=[ast.arg(arg=name) for name in VARIABLES], kwonlyargs=[], kw_defaults=[], defaults=[]),
+    body=tree.body))
+  code = compile(ast.fix_missing_locations(ast.copy_location(body, tree)), "<func>", "eval")
+  fn = eval(code, {"__builtins__": {}, **compiler.constants})
+  try:
+    numexpr_source = _NumexprSource(compiler.constants).visit(tree.body)
+  except (ValueError, KeyError):
+    numexpr_source = None
+  return Expression(source, fn, numexpr_source)
+
+def evaluate(source: str, X: np.ndarray, Y: np.ndarray, chunk_elements: int = EXPR_CHUNK_ELEMENTS) -> np.ndarray:
+  """Evaluates `source` over the mesh X, Y into one float64 array.
+
+  numexpr handles the whole mesh (multithreaded, blocked internally) when it is
+  installed and understands the expression; otherwise rows are evaluated in
+  chunks of about `chunk_elements` so intermediates stay small.
+  """
+  expression = compile_expression(source)
+  X, Y = np.broadcast_arrays(np.asarray(X, dtype=float), np.asarray(Y, dtype=float))
+  if numexpr is not None and EXPR_NUMEXPR and expression.numexpr_source is not None:
+    return np.broadcast_to(numexpr.evaluate(expression.numexpr_source, local_dict={"x": X, "y": Y}), X.shape).astype(float)
+  out = np.empty(X.shape, dtype=float)
+  if X.ndim == 0:
+    out[...] = expression(X, Y)
+    return out
+  row_elements = max(1, X[0].size)
+  rows = max(1, chunk_elements // row_elements)
+  for start in range(0, X.shape[0], rows):
+    # Assigning into `out` broadcasts constant expressions and casts booleans/integers
+    out[start:start + rows] = expression(X[start:start + rows], Y[start:start + rows])
+  return out
@@ -0,0 +1,262 @@
+from typing import Optional
+import numpy as np
+from scipy.optimize import curve_fit
+from scipy.special import gammaln, xlogy
+
+# Numeric side of the fits: no matplotlib here, so JSON-only callers never pay for a figure
+
+def exp_model(x, A, B):
+  return A * np.exp(B * x)
+
+def sigmoid(x, A, B, C):
+  return A / (1 + np.exp(-B * (x - C)))
+
+def gaussian(x, A, mu, sigma):
+  return A * np.exp(-(x - mu)**2 / (2 * sigma**2))
+
+def power_law(x, A, B):
+  return A * x**B
+
+def poisson_model(x, lambd):
+  # Evaluated in log space: lambd**x and x! overflow long before the pmf itself does
+  return np.exp(poisson_log_pmf(x, lambd))
+
+def poisson_log_pmf(x, lambd):
+  return xlogy(x, lambd) - lambd - gammaln(np.asarray(x, dtype=float) + 1)
+
+# Analytic Jacobians, one column per parameter
+
+def exp_jacobian(x, A, B):
+  e = np.exp(B * x)
+  return np.column_stack([e, A * x * e])
+
+def sigmoid_jacobian(x, A, B, C):
+  e = np.exp(-B * (x - C))
+  s = 1 / (1 + e)
+  return np.column_stack([s, A * s**2 * e * (x - C), -A * s**2 * e * B])
+
+def gaussian_jacobian(x, A, mu, sigma):
+  g = np.exp(-(x - mu)**2 / (2 * sigma**2))
+  return np.column_stack([g, A * g * (x - mu) / sigma**2, A * g * (x - mu)**2 / sigma**3])
+
+def power_law_jacobian(x, A, B):
+  p = x**B
+  return np.column_stack([p, A * p * np.log(np.where(x > 0, x, 1))])
+
+# Data-driven starting points, so the nonlinear refinement begins next to the answer
+
+def _sign(y: np.ndarray) -> float:
+  return -1.0 if np.sum(y) < 0 else 1.0
+
+def exp_guess(x, y):
+  # log|y| = log|A| + B x
+  sign = _sign(y)
+  keep = sign * y > 0
+  if keep.sum() < 2:
+    return [sign * np.max(np.abs(y), initial=1.0), 0.0]
+  B, log_A = np.polyfit(x[keep], np.log(sign * y[keep]), 1)
+  return [sign * np.exp(log_A), B]
+
+def power_law_guess(x, y):
+  # log|y| = log|A| + B log x
+  sign = _sign(y)
+  keep = (x > 0) & (sign * y > 0)
+  if keep.sum() < 2:
+    return [sign * np.max(np.abs(y), initial=1.0), 1.0]
+  B, log_A = np.polyfit(np.log(x[keep]), np.log(sign * y[keep]), 1)
+  return [sign * np.exp(log_A), B]
+
+def gaussian_guess(x, y):
+  # Treat the (sign-corrected, non-negative part of the) curve as a distribution and take its moments
+  sign = -1.0 if abs(np.min(y)) > abs(np.max(y)) else 1.0
+  weights = np.clip(sign * y, 0, None)
+  total = weights.sum()
+  if total <= 0:
+    return [sign * np.max(np.abs(y), initial=1.0), np.mean(x), np.std(x) or 1.0]
+  mu = np.sum(weights * x) / total
+  sigma = np.sqrt(np.sum(weights * (x - mu)**2) / total)
+  return [sign * weights.max(), mu, sigma or np.std(x) or 1.0]
+
+def sigmoid_guess(x, y):
+  # The outer quantile furthest from zero is the plateau A; logit(y / A) = B (x - C) on the transition
+  low, high = np.quantile(y, [0.02, 0.98])
+  A = high if abs(high) >= abs(low) else low
+  if A == 0:
+    return [1.0, 1.0, np.median(x)]
+  fraction = y / A
+  keep = (fraction > 0.05) & (fraction < 0.95)
+  if keep.sum() >= 2 and np.ptp(x[keep]) > 0:
+    B, intercept = np.polyfit(x[keep], np.log(fraction[keep] / (1 - fraction[keep])), 1)
+    if B != 0:
+      return [A, B, -intercept / B]
+  span = np.ptp(x) or 1.0
+  rising = np.corrcoef(x, fraction)[0, 1] >= 0 if np.std(fraction) > 0 else True
+  return [A, (4.0 if rising else -4.0) / span, np.median(x)]
+
+# name -> (model, parameter names, initial guess, Jacobian)
+MODELS = {
+  "exponential": (exp_model, ("A", "B"), exp_guess, exp_jacobian),
+  "logistic": (sigmoid, ("A", "B", "C"), sigmoid_guess, sigmoid_jacobian),
+  "gaussian": (gaussian, ("A", "mu", "sigma"), gaussian_guess, gaussian_jacobian),
+  "power_law": (power_law, ("A", "B"), power_law_guess, power_law_jacobian),
+}
+
+def _columns(data: np.ndarray):
+  x, y = data[0], data[1]
+  if len(x) != len(y):
+    raise ValueError("Columns must have the same length")
+  return x, y
+
+def goodness(y: np.ndarray, y_pred: np.ndarray) -> dict:
+  # Reduces over the last axis, so a stack of series gets one value per series
+  residuals = y - y_pred
+  rss = np.sum(residuals**2, axis=-1)  # Residual Sum of Squares
+  tss = np.sum((y - np.mean(y, axis=-1, keepdims=True))**2, axis=-1)  # Total Sum of Squares
+  return {
+    "r_squared": 1 - (rss / tss),
+    "rss": rss,
+    "rmse": np.sqrt(np.mean(residuals**2, axis=-1)),
+    "mae": np.mean(np.abs(residuals), axis=-1),
+  }
+
+def polyfit(data: np.ndarray, poly_degree: int) -> dict:
+  x, y = _columns(data)
+  coeffs, cov = np.polyfit(x, y, poly_degree, cov=True)
+  return {
+    "model": "polynomial",
+    "degree": poly_degree,
+    "coefficients": coeffs,
+    "std_errors": np.sqrt(np.diag(cov)) if cov is not None else None,
+    "covariance": cov,
+    **goodness(y, np.polyval(coeffs, x)),
+  }
+
+def _refine(model: str, x: np.ndarray, y: np.ndarray):
+  fn, _, guess, jacobian = MODELS[model]
+  p0 = guess(x, y)
+  params, covariance, info, _, _ = curve_fit(fn, x, y, p0=p0, jac=jacobian, full_output=True)
+  return params, covariance, p0, int(info["nfev"])
+
+def curvefit(model: str, data: np.ndarray) -> dict:
+  if model == "poisson":
+    return poissonfit(data)
+  x, y = _columns(data)
+  fn, names = MODELS[model][:2]
+  params, covariance, p0, nfev = _refine(model, x, y)
+  std_errors = np.sqrt(np.diag(covariance)) if np.ndim(covariance) == 2 else None
+  return {
+    "model": model,
+    "params": dict(zip(names, params)),
+    "std_errors": dict(zip(names, std_errors)) if std_errors is not None else None,
+    "covariance": covariance,
+    "initial_guess": dict(zip(names, p0)),
+    "nfev": nfev,
+    **goodness(y, fn(x, *params)),
+  }
+
+def poissonfit(data: np.ndarray, mode: str = "histogram") -> dict:
+  """Closed-form maximum-likelihood Poisson fit.
+
+  `histogram`: data[0] are counts k and data[1] how often each occurred; lambda
+  is the mean of k weighted by data[1].
+  `events`: data[0] holds one observed count per event; lambda is their mean.
+  The standard error sqrt(lambda / N), from the Fisher information N / lambda, takes
+  N = sum(data[1]) observations, so data[1] must be occurrence counts: probabilities
+  give the right lambda but sum to 1 and inflate the error.
+  """
+  if mode == "events":
+    events = np.asarray(data[0], dtype=float)
+    if len(events) == 0 or not np.all(np.isfinite(events)) or np.any(events < 0) or np.any(events != np.round(events)):
+      raise ValueError("Event counts must be non-negative integers")
+    total = len(events)
+    lambd = events.mean()
+    log_likelihood = poisson_log_pmf(events, lambd).sum()
+    # Goodness of fit is measured against the empirical pmf
+    x = np.arange(int(events.max()) + 1)
+    y = np.bincount(events.astype(np.int64)) / total
+    scale = 1.0
+  elif mode == "histogram":
+    x, y = _columns(data)
+    keep = np.isfinite(x) & np.isfinite(y)
+    if np.any(x[keep] < 0) or np.any(y[keep] < 0):
+      raise ValueError("Poisson histograms need non-negative counts and frequencies")
+    total = y[keep].sum()
+    if total <= 0:
+      raise ValueError("Poisson histograms need at least one observation")
+    lambd = np.dot(x[keep], y[keep]) / total
+    log_likelihood = np.dot(y[keep], poisson_log_pmf(x[keep], lambd))
+    scale = total
+  else:
+    raise ValueError(f"Unknown Poisson fit mode: {mode}")
+  variance = lambd / total
+  return {
+    "model": "poisson",
+    "mode": mode,
+    "params": {"lambda": lambd},
+    "std_errors": {"lambda": np.sqrt(variance)},
+    "covariance": np.array([[variance]]),
+    "initial_guess": None,
+    "nfev": 0,
+    "observations": total,
+    "scale": scale,
+    "log_likelihood": log_likelihood,
+    **goodness(y, scale * poisson_model(x, lambd)),
+  }
+
+def fit_params(model: str, data: np.ndarray, poly_degree: Optional[int] = None, mode: str = "histogram") -> dict:
+  """Fits `model` ("polynomial" or a key of MODELS) and returns the numbers only."""
+  if model == "polynomial":
+    return polyfit(data, poly_degree)
+  if model == "poisson":
+    return poissonfit(data, mode)
+  return curvefit(model, data)
+
+def predict(stats: dict, x: np.ndarray) -> np.ndarray:
+  if stats["model"] == "polynomial":
+    return np.polyval(stats["coefficients"], x)
+  if stats["model"] == "poisson":
+    return stats["scale"] * poisson_model(x, stats["params"]["lambda"])
+  return MODELS[stats["model"]][0](x, *stats["params"].values())
+
+def batch_polyfit(x: np.ndarray, Y: np.ndarray, poly_degree: int) -> list[dict]:
+  """Fits every row of Y against x with a single np.polyfit call on the stacked series."""
+  x, Y = np.asarray(x, dtype=float), np.asarray(Y, dtype=float)
+  results = [None] * len(Y)
+  finite = np.isfinite(Y).all(axis=1)
+  rows = np.flatnonzero(finite)
+  try:
+    stacked = np.polyfit(x, Y[rows].T, poly_degree, cov=True) if len(rows) else None
+  except Exception:
+    # Too few points for the degree, or a singular fit: let each series report its own error
+    stacked, finite = None, np.zeros(len(Y), dtype=bool)
+  if stacked is not None:
+    coeffs, cov = stacked
+    coeffs, cov = coeffs.T, np.moveaxis(cov, -1, 0)
+    std_errors = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+    fit_stats = goodness(Y[rows], coeffs @ np.vander(x, poly_degree + 1).T)
+    for i, row in enumerate(rows):
+      results[row] = {
+        "model": "polynomial",
+        "degree": poly_degree,
+        "coefficients": coeffs[i],
+        "std_errors": std_errors[i],
+        "covariance": cov[i],
+        **{name: values[i] for name, values in fit_stats.items()},
+      }
+  # Series with gaps are fitted on their finite samples one at a time
+  for row in np.flatnonzero(~finite):
+    keep = np.isfinite(Y[row])
+    results[row] = _guarded(polyfit, np.array([x[keep], Y[row][keep]]), poly_degree, model="polynomial")
+  return results
+
+def batch_curvefit(model: str, x: np.ndarray, Y: np.ndarray) -> list[dict]:
+  """Fits every row of Y against x; a series that fails to converge reports its error instead."""
+  if model == "poisson":
+    return [_guarded(poissonfit, np.array([x, y]), model=model) for y in np.asarray(Y, dtype=float)]
+  return [_guarded(curvefit, model, np.array([x, y]), model=model) for y in np.asarray(Y, dtype=float)]
+
+def _guarded(fn, *args, model: str) -> dict:
+  try:
+    return fn(*args)
+  except Exception as e:
+    return {"model": model, "error": str(e)}
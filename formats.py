@@ -0,0 +1,158 @@
+import base64
+import math
+import os
+from contextvars import ContextVar
+from io import BytesIO
+from typing import Optional
+import numpy as np
+from fastapi import Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+import canvas
+import metrics
+
+MEDIA_TYPES = {
+  "pdf": "application/pdf",
+  "png": "image/png",
+  "svg": "image/svg+xml",
+  "webp": "image/webp",
+}
+RASTER_FORMATS = ("png", "webp")
+OUTPUT_DPI = int(os.getenv("OUTPUT_DPI", "150"))
+MAX_OUTPUT_DPI = int(os.getenv("MAX_OUTPUT_DPI", "600"))
+
+class OutputFormat:
+  """Image format and raster resolution a plot or fit is rendered to."""
+
+  def __init__(self, fmt: str = "pdf", dpi: int = OUTPUT_DPI):
+    self.fmt = fmt
+    self.dpi = dpi
+
+  @property
+  def media_type(self) -> str:
+    return MEDIA_TYPES[self.fmt]
+
+  def __repr__(self):
+    return f"OutputFormat({self.fmt!r}, {self.dpi})"
+
+PDF = OutputFormat()
+# Format negotiated for the current request; render jobs are serialized to it
+_output: ContextVar[OutputFormat] = ContextVar("output_format", default=PDF)
+
+class FitReport:
+  """A fit figure with its statistics: a second PDF page as text, or JSON next to an image."""
+
+  def __init__(self, fig: Figure, stats: dict, summary: str, family: Optional[str] = "monospace"):
+    self.fig = fig
+    self.stats = stats
+    self.summary = summary
+    self.family = family
+
+def negotiate(requested: Optional[str], accept: Optional[str]) -> str:
+  """Picks the output format: an explicit `format` field wins, then the Accept header, then PDF."""
+  if requested:
+    fmt = requested.strip().lower()
+    if fmt not in MEDIA_TYPES:
+      raise HTTPException(status_code=400, detail=f"Unsupported output format. Use {', '.join(MEDIA_TYPES)}.")
+    return fmt
+  if not accept:
+    return "pdf"
+  candidates = []
+  for position, item in enumerate(accept.split(",")):
+    media_type, *params = [part.strip() for part in item.split(";")]
+    quality = 1.0
+    for param in params:
+      if param.startswith("q="):
+        try:
+          quality = float(param[2:])
+        except ValueError:
+          quality = 0.0
+    if media_type == "image/*":
+      media_type = "image/png"
+    for fmt, supported in MEDIA_TYPES.items():
+      if media_type == supported and quality > 0:
+        candidates.append((-quality, position, fmt))
+  return min(candidates)[2] if candidates else "pdf"
+
+async def output_format(request: Request, format: Optional[str] = Form(None), dpi: int = Form(OUTPUT_DPI)):
+  """Router dependency: picks the request's output format from the `format` and `dpi` fields and Accept."""
+  if not 10 <= dpi <= MAX_OUTPUT_DPI:
+    raise HTTPException(status_code=400, detail=f"dpi must be between 10 and {MAX_OUTPUT_DPI}")
+  _output.set(OutputFormat(negotiate(format, request.headers.get("accept")), dpi))
+
+def current() -> OutputFormat:
+  return _output.get()
+
+def savefig(fig, output: Optional[OutputFormat] = None, vector_dpi="figure") -> BytesIO:
+  """Serializes a figure; `vector_dpi` is the resolution of rasterized artists in PDF/SVG output."""
+  output = output or PDF
+  buf = BytesIO()
+  fig.savefig(buf, format=output.fmt, dpi=output.dpi if output.fmt in RASTER_FORMATS else vector_dpi)
+  buf.seek(0)
+  return buf
+
+def _fit_pdf(report: FitReport) -> BytesIO:
+  buf = BytesIO()
+  with PdfPages(buf) as pdf:
+    pdf.savefig(report.fig)
+    canvas.release(report.fig)
+    fig, ax = canvas.subplots("stats")
+    ax.axis("off")
+    ax.text(0.1, 0.5, report.summary, fontsize=10, verticalalignment="center", family=report.family)
+    pdf.savefig(fig)
+    canvas.release(fig)
+  buf.seek(0)
+  return buf
+
+def serialize(result, output: Optional[OutputFormat] = None):
+  """Turns what a plot or fit function drew into bytes for the response.
+
+  A figure becomes a buffer in `output`. A fit report becomes a two-page PDF, or for
+  image formats a dict with the base64 image and the statistics. A tuple led by either
+  (a figure and the points LOD dropped) keeps its other items; anything else is returned as is.
+  """
+  output = output or PDF
+  if isinstance(result, tuple) and result and isinstance(result[0], (Figure, FitReport)):
+    return (serialize(result[0], output), *result[1:])
+  if isinstance(result, Figure):
+    with metrics.stage("savefig"):
+      buf = savefig(result, output)
+    canvas.release(result)
+    return buf
+  if isinstance(result, FitReport):
+    if output.fmt == "pdf":
+      with metrics.stage("savefig"):
+        return _fit_pdf(result)
+    return {"image": base64.b64encode(serialize(result.fig, output).getvalue()).decode("ascii"), "stats": jsonable(result.stats)}
+  return result
+
+def rendered(output: OutputFormat, fn, *args, **kwargs):
+  """Render job wrapper: runs `fn` in the worker and serializes its result there."""
+  return serialize(fn(*args, **kwargs), output)
+
+def jsonable(value):
+  """Turns numpy values into JSON types, with NaN and infinities as null."""
+  if isinstance(value, dict):
+    return {key: jsonable(item) for key, item in value.items()}
+  if isinstance(value, (list, tuple)):
+    return [jsonable(item) for item in value]
+  if isinstance(value, np.ndarray):
+    return jsonable(value.tolist())
+  if isinstance(value, np.generic):
+    value = value.item()
+  if isinstance(value, float) and not math.isfinite(value):
+    return None
+  return value
+
+def respond(result, name: str, headers: Optional[dict[str, str]] = None):
+  """The response for a serialized render result in the request's output format.
+
+  PDF fits keep the stats page inside the document; image fits return the stats as JSON next to the image.
+  """
+  output = current()
+  if isinstance(result, dict):
+    return JSONResponse({"format": output.fmt, "media_type": output.media_type, "filename": f"{name}.{output.fmt}", **result},
+      headers=headers)
+  return StreamingResponse(result, media_type=output.media_type,
+    headers={"Content-Disposition": f"inline; filename={name}.{output.fmt}", **(headers or {})})
@@ -1,62 +1,339 @@
-from fastapi import HTTPException
+import asyncio
+from fastapi import Form, HTTPException, UploadFile
 import numpy as np
 import pandas as pd
 import io
-import json
+import os
+import struct
+import zipfile
 import h5py
+import decompression
+import expr
+import metrics
+import profiling
+import readers
+from typing import BinaryIO, Optional
+
+# Uploads below this size are still in Starlette's in-memory spool, so there is nothing to map
+MMAP_MIN_BYTES = int(os.getenv("MMAP_MIN_BYTES", str(1024 * 1024)))
 
 def normalize_data(data: np.ndarray, method: str = "minmax") -> np.ndarray:
-  if method == "minmax":
-    data_min, data_max = np.nanmin(data), np.nanmax(data)
-    return (data - data_min) / (data_max - data_min + 1e-8)
-  elif method == "zscore":
-    mean, std = np.nanmean(data), np.nanstd(data)
-    return (data - mean) / (std + 1e-8)
-  return data
+  with metrics.stage("normalize"):
+    if method == "minmax":
+      data_min, data_max = np.nanmin(data), np.nanmax(data)
+      return (data - data_min) / (data_max - data_min + 1e-8)
+    elif method == "zscore":
+      mean, std = np.nanmean(data), np.nanstd(data)
+      return (data - mean) / (std + 1e-8)
+    return data
 
 def handle_missing_values(data: np.ndarray, strategy: str) -> np.ndarray:
-  if np.all(np.isnan(data)):
-    return np.zeros_like(data)
-  if strategy == "mean":
-    fill_value = np.nanmean(data)
-  elif strategy == "median":
-    fill_value = np.nanmedian(data)
-  return np.nan_to_num(data, nan=fill_value)
-
-def load_data(file_ext: str, contents: bytes) -> np.ndarray:
+  with metrics.stage("missing_values"):
+    if np.all(np.isnan(data)):
+      return np.zeros_like(data)
+    if strategy == "mean":
+      fill_value = np.nanmean(data)
+    elif strategy == "median":
+      fill_value = np.nanmedian(data)
+    return np.nan_to_num(data, nan=fill_value)
+
+def prepared(fn, count: int, normalization: str, missing_values: str, *args, **kwargs):
+  """Normalizes the first `count` arrays of `args` and fills their missing values, then calls `fn`.
+
+  Heatmap and contour routes render through this so whole-array passes run in the render job, not on the event loop.
+  """
+  arrays = [handle_missing_values(normalize_data(data, method=normalization), strategy=missing_values) for data in args[:count]]
+  return fn(*arrays, *args[count:], **kwargs)
+
+class DataSelection:
+  """Subset of an upload to load: a dataset (HDF5 path or NPZ member), columns, rows and a row stride.
+
+  Columns are the series a plot indexes as `data[0]`, `data[1]`, ... and rows are
+  the samples within each series, whatever the file's on-disk layout is.
+  """
+
+  def __init__(self, dataset: Optional[str] = None, columns: Optional[str] = None, rows: Optional[str] = None, stride: int = 1):
+    self.dataset = dataset or None
+    self.columns = parse_index(columns)
+    self.rows = parse_index(rows)
+    self.stride = stride
+    if stride < 1:
+      raise HTTPException(status_code=400, detail="stride must be a positive integer")
+
+  @property
+  def is_empty(self) -> bool:
+    return self.columns == slice(None) and self.rows == slice(None) and self.stride == 1
+
+  def rows_only(self) -> "DataSelection":
+    """The same rows and stride with every column, for readers that already applied the column selection."""
+    selection = DataSelection(stride=self.stride)
+    selection.rows = self.rows
+    return selection
+
+  @property
+  def row_index(self) -> slice | list[int]:
+    if isinstance(self.rows, slice):
+      step = self.rows.step or 1
+      if step < 0:
+        raise HTTPException(status_code=400, detail="Row slices must not step backwards")
+      return slice(self.rows.start, self.rows.stop, step * self.stride)
+    return self.rows[::self.stride]
+
+def parse_index(spec: Optional[str]) -> slice | list[int]:
+  """Parses "start:stop[:step]" into a slice and "i,j,k" into a list of indices."""
+  if spec is None or not spec.strip():
+    return slice(None)
+  try:
+    if ":" in spec:
+      parts = [int(part) if part.strip() else None for part in spec.split(":")]
+      if len(parts) > 3:
+        raise ValueError(spec)
+      return slice(*parts)
+    return [int(part) for part in spec.split(",")]
+  except ValueError:
+    raise HTTPException(status_code=400, detail=f"Invalid index selection: {spec}")
+
+async def data_selection(
+  dataset: Optional[str] = Form(None),
+  columns: Optional[str] = Form(None),
+  rows: Optional[str] = Form(None),
+  stride: int = Form(1)
+  ) -> DataSelection:
+  return DataSelection(dataset, columns, rows, stride)
+
+def _select(data: np.ndarray, headers: list[str], selection: DataSelection):
+  if data.ndim == 1:
+    return data[selection.row_index], headers
+  if len(headers) == data.shape[0]:
+    headers = np.asarray(headers, dtype=object)[selection.columns].tolist()
+  return data[selection.columns][:, selection.row_index], headers
+
+def _read_hdf5(f: h5py.File, selection: DataSelection):
+  name = selection.dataset or list(f.keys())[0]
+  if name not in f or not isinstance(f[name], h5py.Dataset):
+    raise HTTPException(status_code=400, detail=f"Dataset not found: {name}")
+  dset = f[name]
+  if dset.ndim < 2:
+    headers = [name]
+  else:
+    # One label per series so the column-count checks in the routers apply to HDF5 too
+    headers = [f"{name}[{i}]" for i in np.arange(dset.shape[0])[selection.columns]]
+  if selection.is_empty:
+    return dset[()], headers
+  # Only the requested hyperslab is read from disk. HDF5 needs increasing, unique
+  # point lists, so read those sorted and restore the requested order in memory.
+  def sorted_index(index, length):
+    if isinstance(index, slice):
+      return index, None
+    index = [i + length if i < 0 else i for i in index]
+    unique = sorted(set(index))
+    return unique, [unique.index(i) for i in index]
+  rows, row_order = sorted_index(selection.row_index, dset.shape[1] if dset.ndim > 1 else dset.shape[0])
+  if dset.ndim == 1:
+    data = dset[rows]
+    return (data[row_order] if row_order is not None else data), headers
+  columns, column_order = sorted_index(selection.columns, dset.shape[0])
+  if column_order is not None and row_order is not None:
+    # Only one axis may be a point list, so read the bounding row range instead
+    data = dset[columns, rows[0]:rows[-1] + 1]
+    row_order = [rows[i] - rows[0] for i in row_order]
+  else:
+    data = dset[columns, rows]
+  if column_order is not None:
+    data = data[column_order]
+  if row_order is not None:
+    data = data[:, row_order]
+  return data, headers
+
+def _as_stream(source: bytes | BinaryIO) -> BinaryIO:
+  if isinstance(source, (bytes, bytearray, memoryview)):
+    return io.BytesIO(source)
+  source.seek(0)
+  return source
+
+def _stream_size(stream: BinaryIO) -> Optional[int]:
+  try:
+    position = stream.tell()
+    size = stream.seek(0, io.SEEK_END)
+    stream.seek(position)
+  except (AttributeError, OSError, ValueError):
+    return None
+  return size
+
+def _mappable(stream: BinaryIO) -> bool:
+  if isinstance(stream, io.BytesIO):
+    return False
   try:
-    if file_ext == "csv":
-      string_io = io.StringIO(contents.decode("utf-8"))
-      df = pd.read_csv(string_io)
-      headers = df.columns.tolist()
-      data = df.to_numpy(dtype=float)
-      if headers[0] != "m":
-        data = data.T
-    elif file_ext == "npy":
-      buf = io.BytesIO(contents)
-      data = np.load(buf)
-      headers = ["x", "y"]
-    elif file_ext == "npz":
-      buf = io.BytesIO(contents)
-      npz_data = np.load(buf)
-      data = npz_data[npz_data.files[0]]
-      headers = ["x", "y"]
-    elif file_ext in ["h5", "hdf5"]:
-      buf = io.BytesIO(contents)
-      with h5py.File(buf, "r") as f:
-        first_dataset = list(f.keys())[0]
-        data = np.array(f[first_dataset])
-        headers = [first_dataset]
-    elif file_ext == "json":
-      json_data = json.loads(contents.decode("utf-8"))
-      headers = list(json_data.keys())
-      data = np.array([json_data[key] for key in headers])
-    else:
-      raise HTTPException(status_code=400, detail="Unsupported file format. Use CSV, NPY, NPZ, or HDF5.")
-  except UnicodeDecodeError:
-    raise HTTPException(status_code=400, detail="Invalid file encoding (use UTF-8)")
-  except pd.errors.EmptyDataError:
-    raise HTTPException(status_code=400, detail="Empty CSV file")
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size < MMAP_MIN_BYTES:
+      return False
+    stream.fileno()
+  except (AttributeError, OSError, io.UnsupportedOperation):
+    return False
+  return True
+
+def _memmap_npy(stream: BinaryIO, offset: int = 0) -> Optional[np.ndarray]:
+  stream.seek(offset)
+  version = np.lib.format.read_magic(stream)
+  if version == (1, 0):
+    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+  elif version == (2, 0):
+    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+  else:
+    return None
+  if dtype.hasobject:
+    return None
+  return np.memmap(stream, dtype=dtype, mode="r", shape=shape, order="F" if fortran_order else "C", offset=stream.tell())
+
+def _memmap_npz_member(stream: BinaryIO, name: str) -> Optional[np.ndarray]:
+  with zipfile.ZipFile(stream) as archive:
+    try:
+      info = archive.getinfo(f"{name}.npy")
+    except KeyError:
+      # np.load also lists members stored without the .npy suffix
+      return None
+  if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+    return None
+  # The member's data starts after its local header, whose extra field may differ from the central directory's
+  stream.seek(info.header_offset)
+  local_header = stream.read(30)
+  if local_header[:4] != b"PK\x03\x04":
+    return None
+  name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+  return _memmap_npy(stream, info.header_offset + 30 + name_length + extra_length)
+
+def _load_npy(stream: BinaryIO) -> np.ndarray:
+  if _mappable(stream):
+    data = _memmap_npy(stream)
+    if data is not None:
+      return data
+    stream.seek(0)
+  return np.load(stream)
+
+def _load_npz(stream: BinaryIO, name: Optional[str] = None) -> np.ndarray:
+  mappable = _mappable(stream)
+  with np.load(stream) as npz_data:
+    name = name or npz_data.files[0]
+    if name not in npz_data.files:
+      raise HTTPException(status_code=400, detail=f"Dataset not found: {name}")
+    if not mappable:
+      return npz_data[name]
+  data = _memmap_npz_member(stream, name)
+  if data is None:
+    stream.seek(0)
+    with np.load(stream) as npz_data:
+      data = npz_data[name]
+  return data
+
+def _open(source: bytes | BinaryIO, file_ext: str, codec: Optional[str]) -> BinaryIO:
+  stream = _as_stream(source)
+  if codec is None:
+    return stream
+  return decompression.open_decompressed(stream, codec, file_ext, MMAP_MIN_BYTES)
+
+def _parse(stream: BinaryIO, file_ext: str, selection: DataSelection):
+  """Reads an opened upload; returns (data, headers, the part of `selection` still to apply)."""
+  if file_ext == "csv":
+    # Parsed from the binary stream straight into float64 series (matrix rows for an "m" header)
+    data, headers = readers.read_csv(stream)
+  elif file_ext == "npy":
+    # Large uncompressed arrays are memory-mapped read-only instead of copied (a process render pool still gets a pickled copy)
+    data = _load_npy(stream)
+    headers = ["x", "y"]
+  elif file_ext == "npz":
+    data = _load_npz(stream, selection.dataset)
+    headers = ["x", "y"]
+  elif file_ext in ["h5", "hdf5"]:
+    with h5py.File(stream, "r") as f:
+      data, headers = _read_hdf5(f, selection)
+    selection = DataSelection()
+  elif file_ext in readers.COLUMNAR_FORMATS:
+    # Column selection is pushed down into the reader; rows are sliced from what it returns
+    data, headers = readers.read_columnar(file_ext, stream, selection.columns, _mappable(stream))
+    selection = selection.rows_only()
+  elif file_ext == "json":
+    data, headers = readers.read_json(stream)
+  elif file_ext in ("ndjson", "jsonl"):
+    data, headers = readers.read_ndjson(stream)
+  else:
+    raise HTTPException(status_code=400, detail="Unsupported file format. Use CSV, NPY, NPZ, HDF5, JSON, NDJSON, Parquet, Feather or Arrow.")
+  return data, headers, selection
+
+def load_data(file_ext: str, source: bytes | BinaryIO, selection: Optional[DataSelection] = None, codec: Optional[str] = None) -> np.ndarray:
+  """Parses an upload of type `file_ext`, decompressing it on the way when `codec` (gzip, bz2, zstd) is given."""
+  selection = selection or DataSelection()
+  with metrics.stage("load_data"):
+    try:
+      size = _stream_size(_as_stream(source))
+      stream = _open(source, file_ext, codec)
+      if codec is not None and file_ext in decompression.STREAMED_FORMATS:
+        # Parsed straight from the decompressor, which records its time once closed
+        with stream:
+          data, headers, selection = _parse(stream, file_ext, selection)
+      else:
+        data, headers, selection = _parse(stream, file_ext, selection)
+      if not selection.is_empty:
+        data, headers = _select(data, headers, selection)
+    except HTTPException:
+      raise
+    except (readers.FormatError, decompression.DecompressionError) as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    except UnicodeDecodeError:
+      raise HTTPException(status_code=400, detail="Invalid file encoding (use UTF-8)")
+    except pd.errors.EmptyDataError:
+      raise HTTPException(status_code=400, detail="Empty CSV file")
+    except Exception as e:
+      raise HTTPException(status_code=500, detail=f"Error loading data: {str(e)}")
+  metrics.observe_input(file_ext, size, np.shape(data)[-1] if np.ndim(data) else 1)
+  return data, headers
+
+def check_expression(func: str):
+  """Rejects a `func` outside the expression whitelist before any data is loaded; compiled forms are cached."""
+  try:
+    with metrics.stage("compile_expression"):
+      expr.compile_expression(func)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+def open_upload(upload: UploadFile) -> tuple[str, BinaryIO, Optional[str]]:
+  """An upload's (format, stream, codec).
+
+  Compressed formats that need random access are inflated into a spool here, once, so several
+  datasets can be listed and read from it; their codec comes back as None.
+  """
+  _, file_ext, codec = decompression.split_extension(upload.filename)
+  if codec is None or file_ext in decompression.STREAMED_FORMATS:
+    return file_ext, upload.file, codec
+  try:
+    return file_ext, _open(upload.file, file_ext, codec), None
+  except decompression.DecompressionError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+def dataset_names(file_ext: str, stream: BinaryIO) -> list[Optional[str]]:
+  """Every array in an NPZ upload opened with open_upload; other formats are one dataset unless a name is given."""
+  if file_ext != "npz":
+    return [None]
+  try:
+    with np.load(_as_stream(stream)) as npz_data:
+      return list(npz_data.files)
   except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error loading data: {str(e)}")
-  return data, headers
\ No newline at end of file
+    raise HTTPException(status_code=400, detail=f"Error loading data: {str(e)}")
+
+def file_extension(upload: UploadFile) -> str:
+  """The data format of an upload, looking past a compression suffix (`.csv.gz` is "csv")."""
+  return decompression.split_extension(upload.filename)[1]
+
+def load_upload(upload: UploadFile, selection: Optional[DataSelection] = None):
+  """Parses an upload straight from its spooled file instead of reading it into memory first."""
+  _, file_ext, codec = decompression.split_extension(upload.filename)
+  return profiling.section(load_data, file_ext, upload.file, selection, codec)
+
+async def load_upload_async(upload: UploadFile, selection: Optional[DataSelection] = None):
+  """load_upload on a worker thread, so parsing a large upload does not stall the event loop."""
+  return await asyncio.to_thread(load_upload, upload, selection)
+
+async def load_stream_async(file_ext: str, stream: BinaryIO, selection: Optional[DataSelection] = None, codec: Optional[str] = None):
+  """load_upload_async for a stream from open_upload."""
+  return await asyncio.to_thread(profiling.section, load_data, file_ext, stream, selection, codec)
@@ -0,0 +1,93 @@
+import os
+from typing import Literal, Optional
+import numpy as np
+import canvas
+import metrics
+
+LOD_DPI = float(os.getenv("LOD_DPI", "150"))
+LOD_MIN_POINTS = int(os.getenv("LOD_MIN_POINTS", "5000"))
+# Share of the figure the axes occupy after tight_layout, roughly
+AXES_FRACTION = 0.8
+
+LodMethod = Literal["auto", "none", "minmax", "lttb", "density"]
+
+def pixel_grid(size: Optional[str], dpi: float = LOD_DPI) -> tuple[int, int]:
+  fig_size = canvas.FIGURE_SIZES[canvas.preset(size)]
+  return max(1, int(fig_size[0] * dpi * AXES_FRACTION)), max(1, int(fig_size[1] * dpi * AXES_FRACTION))
+
+def _bin(values: np.ndarray, bins: int) -> np.ndarray:
+  low, high = values.min(), values.max()
+  if high <= low:
+    return np.zeros(len(values), dtype=np.int64)
+  return np.minimum(((values - low) / (high - low) * bins).astype(np.int64), bins - 1)
+
+def minmax_indices(x: np.ndarray, low: np.ndarray, high: np.ndarray, columns: int) -> np.ndarray:
+  """Keeps the lowest and highest point of every pixel column."""
+  bins = _bin(x, columns)
+  order = np.lexsort((low, bins))
+  starts = np.flatnonzero(np.r_[True, bins[order][1:] != bins[order][:-1]])
+  lowest = order[starts]
+  order = np.lexsort((high, bins))
+  ends = np.r_[starts[1:], len(order)] - 1
+  highest = order[ends]
+  return np.unique(np.concatenate([lowest, highest]))
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+  """Largest-Triangle-Three-Buckets downsampling of an x-sorted series."""
+  n = len(x)
+  if threshold >= n or threshold < 3:
+    return np.arange(n)
+  edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+  selected = np.empty(threshold, dtype=np.int64)
+  selected[0], selected[-1] = 0, n - 1
+  previous = 0
+  for i in range(threshold - 2):
+    start, stop = edges[i], edges[i + 1]
+    next_start, next_stop = stop, edges[i + 2] if i + 2 < len(edges) else n
+    avg_x, avg_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+    bucket_x, bucket_y = x[start:stop], y[start:stop]
+    areas = np.abs((x[previous] - avg_x) * (bucket_y - y[previous]) - (x[previous] - bucket_x) * (avg_y - y[previous]))
+    previous = start + int(np.argmax(areas))
+    selected[i + 1] = previous
+  return selected
+
+def density_indices(x: np.ndarray, y: np.ndarray, columns: int, rows: int) -> np.ndarray:
+  """Keeps one point per occupied pixel cell of a scatter cloud."""
+  cells = _bin(x, columns) * rows + _bin(y, rows)
+  return np.sort(np.unique(cells, return_index=True)[1])
+
+def reduce(data: np.ndarray, size: Optional[str], method: LodMethod = "auto", yerr: Optional[np.ndarray] = None):
+  """Drops points that cannot be told apart at the figure's pixel size; returns (data, dropped)."""
+  data = np.asarray(data)
+  x, y = data[0], data[1]
+  n = len(x)
+  if method == "none" or n <= LOD_MIN_POINTS:
+    return data, 0
+  finite = np.isfinite(x) & np.isfinite(y)
+  if not finite.all():
+    data = data[:, finite]
+    x, y = data[0], data[1]
+    yerr = yerr[finite] if yerr is not None else None
+  columns, rows = pixel_grid(size)
+  monotonic = bool(np.all(x[1:] >= x[:-1]))
+  if method == "auto":
+    method = "minmax" if monotonic else "density"
+  if method == "minmax":
+    low, high = (y, y) if yerr is None else (y - yerr, y + yerr)
+    indices = minmax_indices(x, low, high, columns)
+  elif method == "lttb":
+    order = np.arange(len(x)) if monotonic else np.argsort(x, kind="stable")
+    indices = np.sort(order[lttb_indices(x[order], y[order], 2 * columns)])
+  elif method == "density":
+    indices = density_indices(x, y, columns, rows)
+  else:
+    raise ValueError(f"Unknown level-of-detail method: {method}")
+  return data[:, indices], n - len(indices)
+
+def plot_reduced(plot_fn, data: np.ndarray, headers: list[str], size: Optional[str], method: LodMethod = "auto",
+  error_row: Optional[int] = None):
+  """Reduces the data and draws it in the same job; returns (figure, dropped)."""
+  yerr = np.asarray(data)[error_row] if error_row is not None else None
+  with metrics.stage("lod"):
+    data, dropped = reduce(data, size, method, yerr)
+  return plot_fn(data, headers, size), dropped
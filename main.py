@@ -1,12 +1,19 @@
 from fastapi import FastAPI, Depends, Header, HTTPException, Request as FastAPIRequest
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 from routers.plot_router import plot_router
 from routers.fit_router import fit_router
-from google.cloud import iam_v3
+from executor import render_executor
+from auth import AuthorizationCache, TokenVerifier
+import result_cache
+import decompression
+import metrics
+import profiling
+from contextlib import asynccontextmanager
+import asyncio
+import hmac
 import os
 from dotenv import load_dotenv
-from google.auth.transport import requests as google_requests
-from google.oauth2 import id_token
 
 if os.getenv("CI") != "true":
     load_dotenv()
@@ -16,13 +23,32 @@ GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
 REQUIRED_ROLE = "roles/run.invoker"
 RESOURCE = f"projects/{GCP_PROJECT_ID}/sciencegraphapi"
 
-app = FastAPI()
+authorization_cache = AuthorizationCache(
+    RESOURCE,
+    REQUIRED_ROLE,
+    ttl=float(os.getenv("IAM_CACHE_TTL", "300")),
+    max_stale=float(os.getenv("IAM_CACHE_MAX_STALE", "3600")),
+    negative_ttl=float(os.getenv("IAM_NEGATIVE_CACHE_TTL", "60")),
+)
+token_verifier = TokenVerifier(GOOGLE_CLIENT_ID, max_tokens=int(os.getenv("TOKEN_CACHE_SIZE", "1024")))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    render_executor.start()
+    yield
+    await asyncio.to_thread(render_executor.shutdown)
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://andrewsonlinenotes.vercel.app"],
     allow_methods=["*"],
-    allow_headers=["Authorization", "Content-Type"],
+    allow_headers=["Authorization", "Content-Type", "Content-Encoding", "If-None-Match", "X-Profile", "X-Request-ID"],
+    expose_headers=["ETag", "X-Cache", "X-LOD-Dropped-Points", "Server-Timing", "X-Profile-Id"],
 )
+app.add_middleware(decompression.DecompressRequestMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
 
 # --- Authentication & Authorization Dependencies ---
 
@@ -32,14 +58,18 @@ async def get_current_user(request: FastAPIRequest, authorization: str = Header(
         raise HTTPException(status_code=401, detail="Not authenticated")
     token = authorization.split("Bearer ")[1]
     try:
-        request = google_requests.Request()
-        idinfo = id_token.verify_oauth2_token(token, request, GOOGLE_CLIENT_ID)
+        with metrics.stage("authenticate"):
+            idinfo = token_verifier.lookup(token)
+            if idinfo is None:
+                idinfo = await asyncio.to_thread(token_verifier.verify, token)
         if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
             raise HTTPException(status_code=401, detail="Invalid token issuer")
         user_email = idinfo['email']
         if not user_email:
             raise HTTPException(status_code=401, detail="Could not retrieve user email from token")
         return {"email": user_email}
+    except HTTPException:
+        raise
     except ValueError:
         raise HTTPException(status_code=401, detail="Invalid Google ID token")
     except Exception as e:
@@ -49,17 +79,26 @@ async def get_current_user(request: FastAPIRequest, authorization: str = Header(
 async def authorize_action(user: dict = Depends(get_current_user)):
     """Checks if the authenticated user has the required IAM role."""
     try:
-        client = iam_v3.PolicyBindingsClient()
-        request = iam_v3.ListPolicyBindingsRequest(parent=RESOURCE)
-        response = client.list_policy_bindings(request=request)
-        for binding in response.policy_bindings:
-            if binding.role == REQUIRED_ROLE and f"user:{user['email']}" in binding.principals:
-                return user
-        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
-
+        with metrics.stage("authorize"):
+            if authorization_cache.is_cached(user["email"]):
+                allowed = authorization_cache.is_authorized(user["email"])
+            else:
+                allowed = await asyncio.to_thread(authorization_cache.is_authorized, user["email"])
     except Exception as e:
         print(f"IAM v3 check failed: {e}")
         raise HTTPException(status_code=500, detail="Internal server error during authorization")
+    if not allowed:
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    return user
+
+async def profile_request(user: dict = Depends(authorize_action)):
+    """Profiles the request's upload parsing and render jobs when it sent `X-Profile` and the user is in PROFILE_ADMINS."""
+    profiling.start(user.get("email"))
+
+async def require_admin(user: dict = Depends(authorize_action)):
+    if not profiling.is_admin(user.get("email")):
+        raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+    return user
 
 # --- Routes ---
 
@@ -67,6 +106,46 @@ async def authorize_action(user: dict = Depends(get_current_user)):
 async def main_route():
     return {"msg": "Hello World"}
 
+@app.get("/stats", dependencies=[Depends(authorize_action)])
+async def stats_route():
+    return {
+        "authorization": authorization_cache.stats(),
+        "tokens": token_verifier.stats(),
+        "results": result_cache.cache.stats(),
+    }
+
+async def authorize_scrape(request: FastAPIRequest, authorization: str = Header(None)):
+    """`Authorization: Bearer $METRICS_TOKEN` when that is set, otherwise the same check as the API routes."""
+    if metrics.METRICS_TOKEN:
+        if not hmac.compare_digest(authorization or "", f"Bearer {metrics.METRICS_TOKEN}"):
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return
+    await authorize_action(await get_current_user(request, authorization))
+
+@app.get("/metrics", dependencies=[Depends(authorize_scrape)])
+async def metrics_route():
+    """Prometheus scrape endpoint."""
+    samples = {
+        "render_in_flight": ("gauge", "Render jobs running or waiting for a worker.", render_executor.in_flight),
+        "render_capacity": ("gauge", "Render jobs accepted before requests get 503.", render_executor.capacity),
+        "result_cache_hits_total": ("counter", "Responses served from the result cache.", result_cache.cache.hits),
+        "result_cache_misses_total": ("counter", "Result cache lookups that had to render.", result_cache.cache.misses),
+    }
+    return PlainTextResponse(metrics.expose(samples), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{request_id}", dependencies=[Depends(require_admin)])
+async def profile_route(request_id: str, format: str = "raw"):
+    """A stored profile: the pstats file or collapsed stacks (`raw`), or a readable report (`text`)."""
+    profile = profiling.store.get(request_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "text":
+        return PlainTextResponse(profile.text())
+    if profile.mode == "collapsed":
+        return PlainTextResponse(profile.data, headers={"Content-Disposition": f"inline; filename={request_id}.folded"})
+    return Response(profile.data, media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={request_id}.prof"})
+
 # Routers
-app.include_router(plot_router, dependencies=[Depends(authorize_action)])
-app.include_router(fit_router, dependencies=[Depends(authorize_action)])
\ No newline at end of file
+app.include_router(plot_router, dependencies=[Depends(authorize_action), Depends(profile_request)])
+app.include_router(fit_router, dependencies=[Depends(authorize_action), Depends(profile_request)])
\ No newline at end of file
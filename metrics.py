@@ -0,0 +1,181 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from starlette.datastructures import MutableHeaders
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_PREFIX = "sciencegraph"
+# Prometheus' default latency buckets, stretched to cover minute-long renders
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+ROWS_BUCKETS = tuple(10 ** i for i in range(9))
+
+class Histogram:
+  """Cumulative-bucket histogram per label set, exposed in the Prometheus text format."""
+
+  def __init__(self, name: str, documentation: str, labels: tuple[str, ...], buckets: tuple[float, ...]):
+    self.name = f"{METRICS_PREFIX}_{name}"
+    self.documentation = documentation
+    self.labels = labels
+    self.buckets = tuple(sorted(buckets))
+    self._series: dict[tuple[str, ...], list] = {}
+    self._lock = threading.Lock()
+
+  def observe(self, value: float, *label_values: str):
+    index = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      series = self._series.get(label_values)
+      if series is None:
+        series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+      series[0][index] += 1
+      series[1] += value
+      series[2] += 1
+
+  def clear(self):
+    with self._lock:
+      self._series.clear()
+
+  def _labels(self, values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labels, values)]
+    if extra:
+      pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+  def expose(self) -> list[str]:
+    lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+    with self._lock:
+      series = sorted((values, ([*counts], total, count)) for values, (counts, total, count) in self._series.items())
+    for values, (counts, total, count) in series:
+      cumulative = 0
+      for bound, bucket_count in zip(self.buckets, counts):
+        cumulative += bucket_count
+        lines.append(f"{self.name}_bucket{self._labels(values, _le(bound))} {cumulative}")
+      lines.append(f"{self.name}_bucket{self._labels(values, _le('+Inf'))} {count}")
+      lines.append(f"{self.name}_sum{self._labels(values)} {total:g}")
+      lines.append(f"{self.name}_count{self._labels(values)} {count}")
+    return lines
+
+def _le(bound) -> str:
+  return f'le="{bound:g}"' if isinstance(bound, (int, float)) else f'le="{bound}"'
+
+def _escape(value: str) -> str:
+  return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+REQUEST_SECONDS = Histogram("request_duration_seconds", "Time from request to the end of the response body.",
+  ("method", "route", "status"), SECONDS_BUCKETS)
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Time spent in each named pipeline stage; stage=\"queue\" is render pool wait.",
+  ("route", "stage"), SECONDS_BUCKETS)
+INPUT_BYTES = Histogram("input_bytes", "Size of each uploaded file.", ("format",), BYTES_BUCKETS)
+INPUT_ROWS = Histogram("input_rows", "Samples per series in each uploaded file.", ("format",), ROWS_BUCKETS)
+RESPONSE_BYTES = Histogram("response_bytes", "Size of each response body.", ("route", "content_type"), BYTES_BUCKETS)
+HISTOGRAMS = (REQUEST_SECONDS, STAGE_SECONDS, INPUT_BYTES, INPUT_ROWS, RESPONSE_BYTES)
+
+# (stage, seconds) pairs of the request being served, or of the render job running in this worker
+_stages: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar("stages", default=None)
+
+@contextmanager
+def stage(name: str):
+  """Times the block as a pipeline stage of the current request; a no-op outside of one."""
+  stages = _stages.get()
+  if stages is None:
+    yield
+    return
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    stages.append((name, time.perf_counter() - start))
+
+def record(name: str, seconds: float):
+  """Adds a stage timed elsewhere, such as one spread over many calls."""
+  stages = _stages.get()
+  if stages is not None:
+    stages.append((name, seconds))
+
+def collect(fn, *args, **kwargs):
+  """Runs a render job and returns (result, worker timings) so the request process can record them.
+
+  Histograms live in the process that serves /metrics, so workers only measure.
+  """
+  started = time.time()
+  stages = []
+  token = _stages.set(stages)
+  try:
+    result = fn(*args, **kwargs)
+  finally:
+    _stages.reset(token)
+  return result, {"started": started, "stages": stages}
+
+def record_worker(timings: dict, submitted: float):
+  stages = _stages.get()
+  if stages is not None:
+    stages.append(("queue", max(0.0, timings["started"] - submitted)))
+    stages.extend(timings["stages"])
+
+def observe_input(fmt: str, size: Optional[int], rows: Optional[int]):
+  if size is not None:
+    INPUT_BYTES.observe(size, fmt)
+  if rows is not None:
+    INPUT_ROWS.observe(rows, fmt)
+
+def server_timing(stages: list[tuple[str, float]], total: float) -> str:
+  """Stages summed by name in first-seen order, plus the total, as a Server-Timing header value."""
+  durations: dict[str, float] = {}
+  for name, seconds in stages:
+    durations[name] = durations.get(name, 0.0) + seconds
+  durations["total"] = total
+  return ", ".join(f"{name};dur={1000 * seconds:.2f}" for name, seconds in durations.items())
+
+def _route(scope) -> str:
+  # Path templates only, so the label set stays bounded whatever URLs clients send
+  route = scope.get("route")
+  return getattr(route, "path", None) or "unmatched"
+
+class MetricsMiddleware:
+  """Pure ASGI middleware: collects each request's stages, adds Server-Timing and records the histograms."""
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    if scope["type"] != "http":
+      await self.app(scope, receive, send)
+      return
+    stages = []
+    token = _stages.set(stages)
+    start = time.perf_counter()
+    response = {"status": 500, "content_type": "", "bytes": 0}
+
+    async def send_with_timing(message):
+      if message["type"] == "http.response.start":
+        headers = MutableHeaders(scope=message)
+        headers.append("Server-Timing", server_timing(stages, time.perf_counter() - start))
+        response["status"] = message["status"]
+        response["content_type"] = headers.get("content-type", "").split(";")[0]
+      elif message["type"] == "http.response.body":
+        response["bytes"] += len(message.get("body", b""))
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_with_timing)
+    finally:
+      _stages.reset(token)
+      route = _route(scope)
+      REQUEST_SECONDS.observe(time.perf_counter() - start, scope["method"], route, str(response["status"]))
+      RESPONSE_BYTES.observe(response["bytes"], route, response["content_type"])
+      for name, seconds in stages:
+        STAGE_SECONDS.observe(seconds, route, name)
+
+def expose(samples: Optional[dict[str, tuple[str, str, float]]] = None) -> str:
+  """Every histogram, plus single values given as {name: (type, help, value)}, in the Prometheus text format."""
+  lines = []
+  for name, (kind, documentation, value) in (samples or {}).items():
+    lines += [f"# HELP {METRICS_PREFIX}_{name} {documentation}", f"# TYPE {METRICS_PREFIX}_{name} {kind}",
+      f"{METRICS_PREFIX}_{name} {value:g}"]
+  for histogram in HISTOGRAMS:
+    lines += histogram.expose()
+  return "\n".join(lines) + "\n"
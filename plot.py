@@ -1,294 +1,312 @@
-import matplotlib
-matplotlib.use('Agg') # Force non-GUI backend
-import matplotlib.pyplot as plt
 import numpy as np
-from io import BytesIO
-import scipy
-from typing import Optional
+import canvas
+import annotate
+import expr
+import lod
+import math
+import metrics
+import os
+from typing import Literal, Optional
 
-def scatter(data: np.ndarray, headers: list[str], size: Optional[str]):
-  x, y = data[0], data[1]
-  if len(x) != len(y):
+# Meshes with at least this many cells are drawn as an embedded image instead of one PDF path per cell
+RASTERIZE_MIN_CELLS = int(os.getenv("RASTERIZE_MIN_CELLS", "10000"))
+RASTER_DPI = int(os.getenv("RASTER_DPI", "200"))
+
+def _rasterize(cells: int) -> bool:
+  return cells >= RASTERIZE_MIN_CELLS
+
+def _raster_resolution(fig, rasterized: bool):
+  # Vector output embeds rasterized artists at the figure's dpi
+  if rasterized:
+    fig.set_dpi(RASTER_DPI)
+
+def _tight_layout(fig):
+  with metrics.stage("tight_layout"):
+    fig.tight_layout()
+
+def _annotate_mesh(ax, mesh, values: np.ndarray, rasterized: bool, X: Optional[np.ndarray] = None, Y: Optional[np.ndarray] = None):
+  # Label the cells where the mesh puts them: at the grid points for nearest/gouraud shading, between them for flat
+  if X is None:
+    coords = mesh.get_coordinates()
+    X, Y = coords[..., 0], coords[..., 1]
+  X, Y = annotate.cell_centers(X, Y, values.shape)
+  with metrics.stage("annotate"):
+    annotate.annotate(ax, X, Y, values, rasterized=rasterized)
+
+def _same_length(*columns):
+  if any(len(column) != len(columns[0]) for column in columns[1:]):
     raise ValueError("Columns must have the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  ax.scatter(x, y, marker='o')
+
+# Draw one dataset onto an existing Axes; `style` (label, color, alpha) is passed through to matplotlib
+def _draw_scatter(ax, data: np.ndarray, **style):
+  _same_length(data[0], data[1])
+  ax.scatter(data[0], data[1], marker='o', **style)
+
+def _draw_errbar1x(ax, data: np.ndarray, **style):
+  _same_length(data[0], data[1], data[2])
+  ax.errorbar(data[0], data[1], xerr=data[2], marker='o', **style)
+
+def _draw_errbar1y(ax, data: np.ndarray, **style):
+  _same_length(data[0], data[1], data[2])
+  ax.errorbar(data[0], data[1], yerr=data[2], marker='o', **style)
+
+def _draw_errbar2xy(ax, data: np.ndarray, **style):
+  _same_length(data[0], data[1], data[2], data[3])
+  ax.errorbar(data[0], data[1], xerr=data[2], yerr=data[3], marker='o', **style)
+
+def _draw_bar(ax, data: np.ndarray, **style):
+  _same_length(data[0], data[1])
+  ax.bar(data[0], data[1], **style)
+
+def _draw_hist(ax, values: np.ndarray, bins="auto", weights: Optional[np.ndarray] = None, **style):
+  if weights is not None:
+    _same_length(values, weights)
+  ax.hist(values, bins=bins, weights=weights, **style)
+
+# Plot kinds /plot/compose can draw: (draw function, columns per dataset or None for any, reduced by LOD, error row)
+COMPOSE_KINDS = {
+  "scatter": (_draw_scatter, 2, True, None),
+  "errbar1x": (_draw_errbar1x, 3, True, None),
+  "errbar1y": (_draw_errbar1y, 3, True, 2),
+  "errbar2xy": (_draw_errbar2xy, 4, True, 3),
+  "bar": (_draw_bar, 2, False, None),
+  "hist": (_draw_hist, None, False, None),
+}
+
+def compose_grid(panels: int) -> tuple[int, int]:
+  """Rows and columns of the squarest grid with room for `panels`."""
+  cols = max(1, math.ceil(math.sqrt(panels)))
+  return math.ceil(panels / cols), cols
+
+def compose(datasets: list[np.ndarray], names: list[str], kinds: list[str], layout: Literal["overlay", "grid"], headers: list[str],
+  title: str, size: Optional[str], grid: Optional[tuple[int, int]] = None, share_axes: bool = False,
+  lod_method: lod.LodMethod = "auto"):
+  """Draws every dataset into one figure, all on one Axes or one panel each; returns (figure, dropped).
+
+  Dataset i keeps colour Ci in either layout, so panels and legend entries match.
+  """
+  if layout == "overlay":
+    fig, ax = canvas.subplots(size)
+    panels = [ax] * len(datasets)
+  else:
+    rows, cols = grid or compose_grid(len(datasets))
+    fig, axes = canvas.subplots(size, rows, cols, squeeze=False, sharex=share_axes, sharey=share_axes)
+    panels = list(axes.flat)
+    for unused in panels[len(datasets):]:
+      fig.delaxes(unused)
+  dropped = 0
+  for i, (data, name, kind, ax) in enumerate(zip(datasets, names, kinds, panels)):
+    draw, _, reducible, error_row = COMPOSE_KINDS[kind]
+    style = {"label": name, "color": f"C{i % 10}"}
+    if kind == "hist":
+      data = np.ravel(data)
+    elif reducible:
+      with metrics.stage("lod"):
+        data, n = lod.reduce(data, size, lod_method, np.asarray(data)[error_row] if error_row is not None else None)
+      dropped += n
+    if layout == "overlay" and kind in ("bar", "hist"):
+      style["alpha"] = 0.5
+    draw(ax, data, **style)
+    if layout == "grid":
+      ax.set_title(name, fontsize="medium")
+      ax.grid()
+  if layout == "overlay":
+    ax.set_xlabel(headers[0])
+    ax.set_ylabel(headers[1])
+    ax.set_title(title)
+    ax.grid()
+    if len(datasets) > 1:
+      ax.legend()
+  else:
+    fig.supxlabel(headers[0])
+    fig.supylabel(headers[1])
+    if title:
+      fig.suptitle(title)
+  _tight_layout(fig)
+  return fig, dropped
+
+def scatter(data: np.ndarray, headers: list[str], size: Optional[str]):
+  fig, ax = canvas.subplots(size)
+  _draw_scatter(ax, data)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(f"Scatter Plot of {headers[0]} vs {headers[1]}")
   ax.grid()
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def errbar1x(data: np.ndarray, headers: list[str], size: Optional[str]):
-  x, y, error = data[0], data[1], data[2]
-  if len(x) != len(y) or len(x) != len(error):
-    raise ValueError("Columns must have the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  ax.errorbar(x, y, xerr=error, marker='o')
+  fig, ax = canvas.subplots(size)
+  _draw_errbar1x(ax, data)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(f"Errorbar Plot of {headers[0]} vs {headers[1]}")
   ax.grid()
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def errbar1y(data: np.ndarray, headers: list[str], size: Optional[str]):
-  x, y, error = data[0], data[1], data[2]
-  if len(x) != len(y) or len(x) != len(error):
-    raise ValueError("Columns must have the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  ax.errorbar(x, y, yerr=error, marker='o')
+  fig, ax = canvas.subplots(size)
+  _draw_errbar1y(ax, data)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(f"Errorbar Plot of {headers[0]} vs {headers[1]}")
   ax.grid()
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def errbar2xy(data: np.ndarray, headers: list[str], size: Optional[str]):
-  x, y, error_x, error_y = data[0], data[1], data[2], data[3]
-  if len(x) != len(y) or len(x) != len(error_x) or len(x) != len(error_y):
-    raise ValueError("Columns must have the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  ax.errorbar(x, y, xerr=error_x, yerr=error_y, marker='o')
+  fig, ax = canvas.subplots(size)
+  _draw_errbar2xy(ax, data)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(f"Errorbar Plot of {headers[0]} vs {headers[1]}")
   ax.grid()
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def bar(data: np.ndarray, headers: list[str], size: Optional[str]):
-  x, y = data[0], data[1]
-  if len(x) != len(y):
-    raise ValueError("Columns must have the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  ax.bar(x, y)
+  fig, ax = canvas.subplots(size)
+  _draw_bar(ax, data)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(f"Bar Graph of {headers[0]} vs {headers[1]}")
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def pie(data: np.ndarray, categories: list[str], size: Optional[str]):
   percentages = data[0]
   if len(categories) != len(percentages):
     raise ValueError("Columns must be the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
+  fig, ax = canvas.subplots(size)
   ax.pie(percentages, labels=categories, autopct='%1.1f%%')
   ax.set_title(f"Pie Graph of {np.char.join(',', categories)}")
   ax.legend()
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def boxplot(data: np.ndarray, categories: list[str], size: Optional[str], xlabel: str, ylabel: str):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
+  fig, ax = canvas.subplots(size)
   if len(categories) == 1:
     data = data[0]
   ax.boxplot(data, tick_labels=categories)
   ax.set_xlabel(xlabel)
   ax.set_ylabel(ylabel)
   ax.set_title(f"Box Plot of {np.char.join(',', categories)}")
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def eqhist(data: np.ndarray, weights: Optional[np.ndarray], bins: int | list[int], xlabel: str, ylabel: str, size: Optional[str]):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
+  fig, ax = canvas.subplots(size)
   if data.ndim > 1:
     data = data.flatten()
-  if weights is not None:
-    if len(data) != len(weights):
-      raise ValueError("Columns must have the same length")
-    ax.hist(data, bins=bins, weights=weights)
-  else:
-    ax.hist(data, bins=bins)
+  _draw_hist(ax, data, bins, weights)
   ax.set_xlabel(xlabel)
   ax.set_ylabel(ylabel)
   ax.set_title(f"Histogram of {xlabel} vs {ylabel}")
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def varyhist(data: np.ndarray, weights: Optional[np.ndarray], xlabel: str, ylabel: str, size: Optional[str]):
   bins, counts = data[0], data[1]
-  if len(counts) != len(bins):
-    raise ValueError("Columns must have the same length")
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  if weights is not None:
-    if len(counts) != len(weights):
-      raise ValueError("Columns must have the same length")
-    ax.hist(counts, bins=bins, weights=weights)
-  else:
-    ax.hist(counts, bins=bins)
+  _same_length(bins, counts)
+  fig, ax = canvas.subplots(size)
+  _draw_hist(ax, counts, bins, weights)
   ax.set_xlabel(xlabel)
   ax.set_ylabel(ylabel)
   ax.set_title(f"Histogram of {xlabel} vs {ylabel}")
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  return fig
 
 def imshowhmap(data: np.ndarray, headers: list[str], title: str, cmap: str, origin: str, size: Optional[str], useAnnotation: bool = False):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
+  fig, ax = canvas.subplots(size)
   im = ax.imshow(data, cmap=cmap, origin=origin)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(title)
-  if useAnnotation:
-    num_rows, num_cols = data.shape
-    for i in range(num_rows):
-      for j in range(num_cols):
-        ax.text(j, i, f"{data[i, j]:.2f}", ha="center", va="center", color="black")
   cbar = fig.colorbar(im, ax=ax)
   cbar.set_label(headers[2])
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  if useAnnotation:
+    num_rows, num_cols = data.shape
+    X, Y = np.meshgrid(np.arange(num_cols), np.arange(num_rows))
+    with metrics.stage("annotate"):
+      annotate.annotate(ax, X, Y, data)
+  return fig
         
 def pmhmap(data: np.ndarray, headers: list[str], title: str, cmap: str, shading: str, size: Optional[str], useAnnotation: bool = False):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  im = ax.pcolormesh(data, cmap=cmap, shading=shading)
+  fig, ax = canvas.subplots(size)
+  rasterized = _rasterize(data.size)
+  im = ax.pcolormesh(data, cmap=cmap, shading=shading, rasterized=rasterized)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(title)
-  if useAnnotation:
-    num_rows, num_cols = data.shape
-    for i in range(num_rows):
-      for j in range(num_cols):
-        ax.text(j, i, f"{data[i, j]:.2f}", ha="center", va="center", color="black")
   cbar = fig.colorbar(im, ax=ax)
   cbar.set_label(headers[2])
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  if useAnnotation:
+    _annotate_mesh(ax, im, data, rasterized)
+  _raster_resolution(fig, rasterized)
+  return fig
 
 def pmChmap(data: np.ndarray, coords: np.ndarray, headers: list[str], title: str, cmap: str, shading: str, size: Optional[str], 
-  useAnnotation: bool = False
-          ):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
+  useAnnotation: bool = False):
+  fig, ax = canvas.subplots(size)
   x, y = coords[0], coords[1]
   X, Y = np.meshgrid(x, y)
-  im = ax.pcolormesh(X, Y, data, cmap=cmap, shading=shading)
+  rasterized = _rasterize(data.size)
+  im = ax.pcolormesh(X, Y, data, cmap=cmap, shading=shading, rasterized=rasterized)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(title)
-  if useAnnotation:
-    num_rows, num_cols = data.shape
-    for i in range(num_rows):
-      for j in range(num_cols):
-        ax.text(j, i, f"{data[i, j]:.2f}", ha="center", va="center", color="black")
   cbar = fig.colorbar(im, ax=ax)
   cbar.set_label(headers[2])
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  if useAnnotation:
+    _annotate_mesh(ax, im, data, rasterized, X, Y)
+  _raster_resolution(fig, rasterized)
+  return fig
 
 def pmfhmap(X: np.ndarray, Y: np.ndarray, headers: list[str], title: str, cmap: str, 
   shading: str, func: str, size: Optional[str], useAnnotation: bool = False):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  if func:
-    try:
-      transformation = eval(f"lambda x, y: {func}", {"np": np, "sp": scipy, "__builtins__": __builtins__})
-    except Exception as e:
-      raise ValueError(f"Error applying function {func}: {e}")
-  Z = transformation(X , Y)
-  im = ax.pcolormesh(X, Y, Z, cmap=cmap, shading=shading)
+  fig, ax = canvas.subplots(size)
+  with metrics.stage("eval"):
+    Z = expr.evaluate(func, X, Y)
+  rasterized = _rasterize(Z.size)
+  im = ax.pcolormesh(X, Y, Z, cmap=cmap, shading=shading, rasterized=rasterized)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(title)
-  if useAnnotation:
-    num_rows, num_cols = Z.shape
-    for i in range(num_rows):
-      for j in range(num_cols):
-        ax.text(X[i, j], Y[i, j], f"{Z[i, j]:.2f}", ha="center", va="center", color="black")
   cbar = fig.colorbar(im, ax=ax)
   cbar.set_label(headers[2])
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
+  _tight_layout(fig)
+  if useAnnotation:
+    _annotate_mesh(ax, im, Z, rasterized, X, Y)
+  _raster_resolution(fig, rasterized)
+  return fig
 
 def contourmap(X: np.ndarray, Y: np.ndarray, title: str, cmap: str, levels: int | list[int], 
                func: str, size: Optional[str], headers: list[str]):
-  fig_size = (7, 3) if size == "large" else (3.375, 3)
-  fig, ax = plt.subplots(figsize=fig_size)
-  if func:
-    try:
-      transformation = eval(f"lambda x, y: {func}", {"np": np, "sp": scipy, "__builtins__": __builtins__})
-    except Exception as e:
-      raise ValueError(f"Error applying function {func}: {e}")
-  Z = transformation(X , Y)
-  contour_filled = ax.contourf(X, Y, Z, levels=levels, cmap=cmap)
-  contour_lines = ax.contour(X, Y, Z, colors="black", levels=levels)
-  ax.clabel(contour_lines, inline=True, fontsize=8)
+  fig, ax = canvas.subplots(size)
+  with metrics.stage("eval"):
+    Z = expr.evaluate(func, X, Y)
+  rasterized = _rasterize(Z.size)
+  # ContourSet ignores the rasterized kwarg; artists below the axes' rasterization zorder are rasterized instead
+  zorder = -1 if rasterized else None
+  if rasterized:
+    ax.set_rasterization_zorder(0)
+  with metrics.stage("contour"):
+    contour_filled = ax.contourf(X, Y, Z, levels=levels, cmap=cmap, zorder=zorder)
+    contour_lines = ax.contour(X, Y, Z, colors="black", levels=levels, zorder=zorder)
+    ax.clabel(contour_lines, inline=True, fontsize=8)
   ax.set_xlabel(headers[0])
   ax.set_ylabel(headers[1])
   ax.set_title(title)
   ax.set_xticks(np.linspace(X.min(), X.max(), num=10))
   ax.set_yticks(np.linspace(Y.min(), Y.max(), num=10))
   ax.grid()
-  cbar = plt.colorbar(contour_filled)
+  cbar = fig.colorbar(contour_filled, ax=ax)
   cbar.set_label(headers[2])
-  fig.tight_layout()
-  buf = BytesIO()
-  fig.savefig(buf, format="pdf")
-  buf.seek(0)
-  plt.close(fig)
-  return buf
\ No newline at end of file
+  _tight_layout(fig)
+  _raster_resolution(fig, rasterized)
+  return fig
\ No newline at end of file
@@ -0,0 +1,253 @@
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextvars import ContextVar
+from typing import Literal, Optional
+from starlette.datastructures import MutableHeaders
+
+PROFILE_ADMINS = {email.strip().lower() for email in os.getenv("PROFILE_ADMINS", "").split(",") if email.strip()}
+PROFILE_STORE_SIZE = int(os.getenv("PROFILE_STORE_SIZE", "32"))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.001"))
+PROFILE_TEXT_LINES = 60
+
+ProfileMode = Literal["pstats", "collapsed"]
+MODES = {"1": "pstats", "true": "pstats", "pstats": "pstats", "cprofile": "pstats", "collapsed": "collapsed", "sample": "collapsed"}
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+def is_admin(email: Optional[str]) -> bool:
+  return bool(email) and email.lower() in PROFILE_ADMINS
+
+class _Snapshot:
+  """What pstats.Stats needs to load a stats dict that came from another process."""
+
+  def __init__(self, stats: dict):
+    self.stats = stats
+
+  def create_stats(self):
+    pass
+
+def _collapse(frame) -> str:
+  names = []
+  while frame is not None:
+    names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+    frame = frame.f_back
+  return ";".join(reversed(names))
+
+class StackSampler:
+  """Samples one thread's Python stack every `interval` seconds into collapsed-stack counts."""
+
+  def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL):
+    self.thread_id = thread_id
+    self.interval = interval
+    self.counts: Counter[str] = Counter()
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+  def _run(self):
+    while not self._stop.wait(self.interval):
+      frame = sys._current_frames().get(self.thread_id)
+      if frame is not None:
+        self.counts[_collapse(frame)] += 1
+
+  def start(self):
+    self._thread.start()
+
+  def stop(self):
+    self._stop.set()
+    self._thread.join()
+
+class Session:
+  """One profile, merged from the request's synchronous sections and its render jobs.
+
+  `pstats` mode is cProfile (deterministic, every call); `collapsed` mode samples
+  stacks, which costs less on call-heavy code and feeds flamegraph tools directly.
+  """
+
+  def __init__(self, mode: ProfileMode):
+    self.mode = mode
+    self.stats: dict = {}
+    self.stacks: Counter[str] = Counter()
+    self._profiler = None
+    self._sampler = None
+
+  def start(self):
+    if self.mode == "pstats":
+      self._profiler = cProfile.Profile()
+      self._profiler.enable()
+    else:
+      self._sampler = StackSampler(threading.get_ident())
+      self._sampler.start()
+
+  def stop(self):
+    if self._profiler is not None:
+      self._profiler.disable()
+      self._profiler.create_stats()
+      self.merge(self._profiler.stats)
+      self._profiler = None
+    if self._sampler is not None:
+      self._sampler.stop()
+      self.merge(self._sampler.counts)
+      self._sampler = None
+
+  def snapshot(self):
+    return self.stats if self.mode == "pstats" else dict(self.stacks)
+
+  def merge(self, data: Optional[dict]):
+    if not data:
+      return
+    if self.mode == "collapsed":
+      self.stacks.update(data)
+    elif not self.stats:
+      self.stats = dict(data)
+    else:
+      combined = pstats.Stats(_Snapshot(self.stats))
+      combined.add(_Snapshot(data))
+      self.stats = combined.stats
+
+  def dump(self) -> bytes:
+    """The profile as a pstats file (marshalled, like Stats.dump_stats) or as collapsed stacks."""
+    if self.mode == "pstats":
+      return marshal.dumps(self.stats)
+    return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()).encode("utf-8")
+
+def profiled(mode: ProfileMode, fn, *args, **kwargs):
+  """Runs `fn` under its own profile and returns (result, profile data) for the request's session."""
+  session = Session(mode)
+  try:
+    session.start()
+  except ValueError:
+    # Another profiler owns this worker (thread executor, concurrent profiled jobs)
+    return fn(*args, **kwargs), None
+  try:
+    result = fn(*args, **kwargs)
+  finally:
+    session.stop()
+  return result, session.snapshot()
+
+class StoredProfile:
+  __slots__ = ("mode", "data", "path", "created")
+
+  def __init__(self, mode: ProfileMode, data: bytes, path: str):
+    self.mode = mode
+    self.data = data
+    self.path = path
+    self.created = time.time()
+
+  def text(self, lines: int = PROFILE_TEXT_LINES) -> str:
+    if self.mode == "collapsed":
+      return self.data.decode("utf-8")
+    report = io.StringIO()
+    pstats.Stats(_Snapshot(marshal.loads(self.data)), stream=report).sort_stats("cumulative").print_stats(lines)
+    return report.getvalue()
+
+class ProfileStore:
+  """The most recent profiles by request id."""
+
+  def __init__(self, max_entries: int = PROFILE_STORE_SIZE):
+    self.max_entries = max_entries
+    self._profiles: OrderedDict[str, StoredProfile] = OrderedDict()
+    self._lock = threading.Lock()
+
+  def put(self, request_id: str, profile: StoredProfile):
+    with self._lock:
+      self._profiles[request_id] = profile
+      self._profiles.move_to_end(request_id)
+      while len(self._profiles) > self.max_entries:
+        self._profiles.popitem(last=False)
+
+  def get(self, request_id: str) -> Optional[StoredProfile]:
+    with self._lock:
+      return self._profiles.get(request_id)
+
+store = ProfileStore()
+
+# Set by the middleware when a request asks to be profiled; holds its mode, id and, once authorized, its session
+_request: ContextVar[Optional[dict]] = ContextVar("profile_request", default=None)
+# cProfile allows one active profiler per process (3.12+), so only one request is profiled at a time
+_busy = threading.Lock()
+
+def start(email: Optional[str]) -> bool:
+  """Opens a profile for the current request if it asked for it and `email` is an admin.
+
+  Nothing is profiled on the event loop, where other requests interleave at every await;
+  only `section` calls and render jobs add to the profile.
+  """
+  request = _request.get()
+  if request is None or request["session"] is not None or not is_admin(email):
+    return False
+  if not _busy.acquire(blocking=False):
+    return False
+  request["session"] = Session(request["mode"])
+  return True
+
+def active() -> Optional[Session]:
+  request = _request.get()
+  return request["session"] if request is not None else None
+
+def section(fn, *args, **kwargs):
+  """Runs a synchronous step of the request, under the request's profile if it has one."""
+  session = active()
+  if session is None:
+    return fn(*args, **kwargs)
+  result, data = profiled(session.mode, fn, *args, **kwargs)
+  session.merge(data)
+  return result
+
+def _finish(request: dict, path: str):
+  session, request["session"] = request["session"], None
+  _busy.release()
+  store.put(request["id"], StoredProfile(session.mode, session.dump(), path))
+
+def _requested(scope) -> Optional[tuple[ProfileMode, str]]:
+  mode = request_id = None
+  for name, value in scope["headers"]:
+    if name == b"x-profile":
+      mode = MODES.get(value.decode("latin-1").strip().lower())
+    elif name == b"x-request-id":
+      request_id = value.decode("latin-1").strip()
+  if mode is None:
+    return None
+  if not request_id or not _REQUEST_ID.match(request_id):
+    request_id = uuid.uuid4().hex
+  return mode, request_id
+
+class ProfilingMiddleware:
+  """Pure ASGI middleware for the `X-Profile` request header.
+
+  Requests without the header pass straight through. With it, the request is
+  profiled once `start` sees an admin, and the response names the stored
+  profile in `X-Profile-Id`.
+  """
+
+  def __init__(self, app):
+    self.app = app
+
+  async def __call__(self, scope, receive, send):
+    requested = _requested(scope) if scope["type"] == "http" else None
+    if requested is None:
+      await self.app(scope, receive, send)
+      return
+    request = {"mode": requested[0], "id": requested[1], "session": None}
+    token = _request.set(request)
+
+    async def send_with_profile(message):
+      # The handler has returned once the response starts; only the body remains to be sent
+      if message["type"] == "http.response.start" and request["session"] is not None:
+        _finish(request, scope["path"])
+        MutableHeaders(scope=message).append("X-Profile-Id", request["id"])
+      await send(message)
+
+    try:
+      await self.app(scope, receive, send_with_profile)
+    finally:
+      _request.reset(token)
+      if request["session"] is not None:
+        _finish(request, scope["path"])
@@ -0,0 +1,495 @@
+import csv
+import functools
+import io
+import json
+import mmap
+import os
+from typing import BinaryIO, Optional
+import numpy as np
+import pandas as pd
+
+try:
+  import pyarrow
+  import pyarrow.compute as pa_compute
+  import pyarrow.csv as pa_csv
+  import pyarrow.ipc as pa_ipc
+  import pyarrow.json as pa_json
+  import pyarrow.parquet as pa_parquet
+except ImportError:
+  pyarrow = None
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+# auto: pyarrow when installed, else pandas' C parser; numpy (np.loadtxt) is there for comparison
+CSV_ENGINE = os.getenv("CSV_ENGINE", "auto")
+CSV_SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = ",;\t|"
+# First header that marks a CSV as a matrix: rows stay rows instead of becoming series
+MATRIX_HEADER = "m"
+
+class FormatError(ValueError):
+  """An upload this module cannot turn into a numeric array."""
+
+class CsvError(FormatError):
+  """A CSV that is not a plain numeric table."""
+
+class CsvDialect:
+  __slots__ = ("delimiter", "headers", "columns")
+
+  def __init__(self, delimiter: str, headers: Optional[list[str]], columns: int):
+    self.delimiter = delimiter
+    self.headers = headers
+    self.columns = columns
+
+  @property
+  def is_matrix(self) -> bool:
+    return bool(self.headers) and self.headers[0] == MATRIX_HEADER
+
+def _is_number(token: str) -> bool:
+  token = token.strip()
+  if not token:
+    return True
+  try:
+    float(token)
+  except ValueError:
+    return False
+  return True
+
+def sniff(sample: bytes) -> CsvDialect:
+  """Delimiter and header row of a CSV from its first bytes.
+
+  The first line is a header when any of its fields is not a number; without one,
+  columns are named c0, c1, ...
+  """
+  text = sample.decode("utf-8-sig", errors="replace")
+  lines = [line for line in text.splitlines()[:2] if line.strip()]
+  if not lines:
+    raise pd.errors.EmptyDataError("No columns to parse from file")
+  try:
+    delimiter = csv.Sniffer().sniff("\n".join(lines), delimiters=CSV_DELIMITERS).delimiter
+  except csv.Error:
+    delimiter = next((candidate for candidate in CSV_DELIMITERS if candidate in lines[0]), ",")
+  first = next(csv.reader([lines[0]], delimiter=delimiter))
+  if all(_is_number(token) for token in first):
+    return CsvDialect(delimiter, None, len(first))
+  return CsvDialect(delimiter, [token.strip() for token in first], len(first))
+
+def _layout(columns: list[np.ndarray], is_matrix: bool) -> np.ndarray:
+  # Series are rows of a C-contiguous (columns, samples) array so data[0], data[1] are contiguous;
+  # a matrix keeps the file's rows as C-contiguous rows
+  rows = len(columns[0]) if columns else 0
+  out = np.empty((rows, len(columns)) if is_matrix else (len(columns), rows), dtype=np.float64)
+  for i, column in enumerate(columns):
+    if is_matrix:
+      out[:, i] = column
+    else:
+      out[i] = column
+  return out
+
+def _read_pyarrow(stream: BinaryIO, dialect: CsvDialect) -> np.ndarray:
+  names = [f"c{i}" for i in range(dialect.columns)]
+  table = pa_csv.read_csv(
+    stream,
+    read_options=pa_csv.ReadOptions(column_names=names, skip_rows=1 if dialect.headers else 0),
+    parse_options=pa_csv.ParseOptions(delimiter=dialect.delimiter),
+    convert_options=pa_csv.ConvertOptions(column_types={name: pyarrow.float64() for name in names}),
+  )
+  return _layout([column.to_numpy() for column in table.columns], dialect.is_matrix)
+
+def _read_pandas(stream: BinaryIO, dialect: CsvDialect) -> np.ndarray:
+  frame = pd.read_csv(stream, sep=dialect.delimiter, header=0 if dialect.headers else None, names=range(dialect.columns), index_col=False,
+    dtype=np.float64, encoding="utf-8", engine="c", skipinitialspace=True)
+  # One float64 block: (samples, columns) in Fortran order, so its transpose is already the series layout
+  data = frame.to_numpy(dtype=np.float64, copy=False)
+  return np.ascontiguousarray(data) if dialect.is_matrix else np.ascontiguousarray(data.T)
+
+def _read_numpy(stream: BinaryIO, dialect: CsvDialect) -> np.ndarray:
+  text = io.TextIOWrapper(stream, encoding="utf-8-sig")
+  try:
+    data = np.loadtxt(text, delimiter=dialect.delimiter, skiprows=1 if dialect.headers else 0, dtype=np.float64, ndmin=2)
+  finally:
+    # Leave the upload open for the caller
+    text.detach()
+  return data if dialect.is_matrix else np.ascontiguousarray(data.T)
+
+ENGINES = {"pyarrow": _read_pyarrow, "pandas": _read_pandas, "numpy": _read_numpy}
+
+def csv_engine(engine: str = CSV_ENGINE) -> str:
+  if engine == "auto":
+    return "pyarrow" if pyarrow is not None else "pandas"
+  if engine not in ENGINES or (engine == "pyarrow" and pyarrow is None):
+    raise ValueError(f"CSV engine not available: {engine}")
+  return engine
+
+def read_csv(stream: BinaryIO, engine: str = CSV_ENGINE) -> tuple[np.ndarray, list[str]]:
+  """Parses a numeric CSV into float64 (series, samples), or (rows, columns) for a matrix, plus its headers."""
+  if stream.seekable():
+    start = stream.tell()
+    dialect = sniff(stream.read(CSV_SNIFF_BYTES))
+    stream.seek(start)
+  else:
+    # A decompressing reader cannot rewind, so sniff what it has buffered
+    dialect = sniff(stream.peek(CSV_SNIFF_BYTES)[:CSV_SNIFF_BYTES])
+  engine = csv_engine(engine)
+  try:
+    data = ENGINES[engine](stream, dialect)
+  except UnicodeDecodeError:
+    raise
+  except (ValueError, pd.errors.ParserError) as e:
+    raise CsvError(f"Not a numeric CSV: {e}")
+  return data, dialect.headers or [f"c{i}" for i in range(dialect.columns)]
+
+# Extension -> Arrow container; "arrow" is either an IPC file or an IPC stream, told apart by its magic
+COLUMNAR_FORMATS = {"parquet": "parquet", "feather": "file", "arrow": "file", "arrows": "stream"}
+ARROW_FILE_MAGIC = b"ARROW1"
+
+def _project(names: list[str], columns: slice | list[int]) -> list[int]:
+  indices = list(range(len(names)))
+  try:
+    return indices[columns] if isinstance(columns, slice) else [indices[i] for i in columns]
+  except IndexError:
+    raise FormatError(f"Column selection out of range: the file has {len(names)} columns")
+
+def _to_array(table) -> np.ndarray:
+  """Columns of `table` as float64 (series, samples), copying each Arrow chunk once into place."""
+  if table.num_columns == 1 and table.column(0).num_chunks == 1:
+    chunk = table.column(0).chunk(0)
+    if chunk.type == pyarrow.float64() and chunk.null_count == 0:
+      # A lone float64 column without nulls is handed over as a read-only view of the Arrow buffer
+      return chunk.to_numpy(zero_copy_only=True)[None]
+  for field in table.schema:
+    if not (pyarrow.types.is_integer(field.type) or pyarrow.types.is_floating(field.type) or pyarrow.types.is_boolean(field.type)):
+      raise FormatError(f"Column {field.name} is not numeric ({field.type})")
+  out = np.empty((table.num_columns, table.num_rows), dtype=np.float64)
+  for i, column in enumerate(table.columns):
+    offset = 0
+    for chunk in column.chunks:
+      # Nulls come back as NaN; float64 chunks without them are views, so this assignment is the only copy
+      out[i, offset:offset + len(chunk)] = chunk.to_numpy(zero_copy_only=False)
+      offset += len(chunk)
+  return out
+
+def _arrow_source(stream: BinaryIO, mappable: bool):
+  # Arrow reads straight out of the mapped or in-memory upload, so uncompressed IPC buffers are never copied
+  if mappable:
+    return pyarrow.BufferReader(pyarrow.py_buffer(mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)))
+  if isinstance(stream, io.BytesIO):
+    return pyarrow.BufferReader(pyarrow.py_buffer(stream.getbuffer()))
+  return stream
+
+def read_columnar(file_ext: str, stream: BinaryIO, columns: slice | list[int] = slice(None), mappable: bool = False):
+  """Parquet, Feather or Arrow IPC upload as float64 (series, samples) plus column names.
+
+  Only the selected columns are read; the rest of the file is never decoded.
+  """
+  if pyarrow is None:
+    raise FormatError(f"{file_ext} uploads need pyarrow installed")
+  container = COLUMNAR_FORMATS[file_ext]
+  source = _arrow_source(stream, mappable)
+  try:
+    if container == "file":
+      if source.read(len(ARROW_FILE_MAGIC)) != ARROW_FILE_MAGIC:
+        container = "stream"
+      source.seek(0)
+    if container == "parquet":
+      parquet = pa_parquet.ParquetFile(source)
+      names = parquet.schema_arrow.names
+      table = parquet.read(columns=[names[i] for i in _project(names, columns)])
+    elif container == "file":
+      reader = pa_ipc.open_file(source)
+      # Batches of an uncompressed file are views of the upload, so dropping columns afterwards
+      # is free; Arrow's own field selection would copy the batch bodies it reads
+      table = reader.read_all().select(_project(reader.schema.names, columns))
+    else:
+      reader = pa_ipc.open_stream(source)
+      selected = _project(reader.schema.names, columns)
+      # A stream has no footer to seek by, so unselected columns are dropped batch by batch
+      table = pyarrow.Table.from_batches([batch.select(selected) for batch in reader], pyarrow.schema([reader.schema.field(i) for i in selected]))
+  except pyarrow.ArrowException as e:
+    raise FormatError(f"Not a valid {file_ext} file: {e}")
+  return _to_array(table), table.column_names
+
+# auto/stream: the incremental column parser below; orjson and json decode the whole document into Python objects first
+JSON_ENGINE = os.getenv("JSON_ENGINE", "auto")
+JSON_CHUNK_BYTES = 4 * 1024 * 1024
+NDJSON_BATCH_LINES = 65536
+# Everything that may appear between the brackets of a numeric JSON array; NaN and Infinity are not JSON
+_JSON_NUMBER_BYTES = b"0123456789+-.eE \t\r\n,nul"
+_JSON_WHITESPACE = b" \t\r\n"
+# Commas and whitespace both become line breaks: one value per line, blank lines skipped
+_JSON_TO_LINES = bytes.maketrans(b", \t\r", b"\n\n\n\n")
+
+class JsonError(FormatError):
+  """A JSON upload that is not an object of numeric arrays (or, for NDJSON, not numeric records)."""
+
+def _reject_constant(name: str):
+  raise JsonError(f"{name} is not a JSON number")
+
+# json accepts NaN and Infinity, which orjson and the streaming engine reject
+_json_loads = functools.partial(json.loads, parse_constant=_reject_constant)
+
+class _Growable:
+  """float64 buffer that doubles its capacity as values are appended."""
+
+  def __init__(self, capacity: int = 1024):
+    self.buffer = np.empty(capacity, dtype=np.float64)
+    self.size = 0
+
+  def extend(self, values: np.ndarray):
+    end = self.size + len(values)
+    if end > len(self.buffer):
+      grown = np.empty(max(end, 2 * len(self.buffer)), dtype=np.float64)
+      grown[:self.size] = self.buffer[:self.size]
+      self.buffer = grown
+    self.buffer[self.size:end] = values
+    self.size = end
+
+  def array(self) -> np.ndarray:
+    # Shrinks in place, so the spare capacity is released without copying
+    self.buffer.resize(self.size, refcheck=False)
+    return self.buffer
+
+def _parse_numbers(piece: bytes) -> np.ndarray:
+  """Comma-separated JSON numbers as float64, parsed by the CSV engine as one value per line."""
+  if piece.translate(None, _JSON_NUMBER_BYTES):
+    raise JsonError("JSON arrays must hold only numbers or null")
+  if not piece.strip(_JSON_WHITESPACE):
+    return np.empty(0)
+  expected = piece.count(b",") + 1
+  lines = io.BytesIO(piece.translate(_JSON_TO_LINES))
+  try:
+    if pyarrow is not None:
+      table = pa_csv.read_csv(lines, read_options=pa_csv.ReadOptions(column_names=["v"]),
+        convert_options=pa_csv.ConvertOptions(column_types={"v": pyarrow.float64()}))
+      values = table.column(0).to_numpy()
+    else:
+      values = pd.read_csv(lines, header=None, names=["v"], dtype=np.float64, engine="c").to_numpy()[:, 0]
+  except (ValueError, pd.errors.ParserError) as e:
+    raise JsonError(f"Invalid number in JSON array: {e}")
+  if len(values) != expected:
+    raise JsonError("Invalid number in JSON array")
+  return values
+
+class _JsonScanner:
+  """Reads `{"name": [numbers...], ...}` from a stream in JSON_CHUNK_BYTES pieces."""
+
+  def __init__(self, stream: BinaryIO):
+    self.stream = stream
+    self.buffer = b""
+    self.pos = 0
+
+  def _fill(self) -> bool:
+    chunk = self.stream.read(JSON_CHUNK_BYTES)
+    if not chunk:
+      return False
+    self.buffer = self.buffer[self.pos:] + chunk
+    self.pos = 0
+    return True
+
+  def peek(self) -> Optional[bytes]:
+    while True:
+      while self.pos < len(self.buffer) and self.buffer[self.pos] in _JSON_WHITESPACE:
+        self.pos += 1
+      if self.pos < len(self.buffer):
+        return self.buffer[self.pos:self.pos + 1]
+      if not self._fill():
+        return None
+
+  def expect(self, token: bytes, what: str):
+    if self.peek() != token:
+      raise JsonError(f"Expected {what} in JSON upload")
+    self.pos += 1
+
+  def string(self) -> str:
+    if self.peek() != b'"':
+      raise JsonError("Expected a column name in JSON upload")
+    end = self.pos + 1
+    while True:
+      end = self.buffer.find(b'"', end)
+      if end < 0:
+        scanned = len(self.buffer) - self.pos
+        if not self._fill():
+          raise JsonError("Unterminated string in JSON upload")
+        end = scanned
+        continue
+      # A quote preceded by an odd number of backslashes is escaped
+      text = self.buffer[self.pos + 1:end]
+      if (len(text) - len(text.rstrip(b"\\"))) % 2 == 0:
+        break
+      end += 1
+    value = json.loads(self.buffer[self.pos:end + 1])
+    self.pos = end + 1
+    return value
+
+  def numbers(self, capacity: int = 1024) -> np.ndarray:
+    self.expect(b"[", "an array of numbers")
+    column = _Growable(capacity)
+    while True:
+      end = self.buffer.find(b"]", self.pos)
+      if end >= 0:
+        column.extend(_parse_numbers(self.buffer[self.pos:end]))
+        self.pos = end + 1
+        return column.array()
+      # Parse every complete value in this chunk; the one cut off at its end waits for the next
+      cut = self.buffer.rfind(b",", self.pos)
+      if cut >= 0:
+        column.extend(_parse_numbers(self.buffer[self.pos:cut]))
+        self.pos = cut + 1
+      if not self._fill():
+        raise JsonError("Unterminated array in JSON upload")
+
+def _stack(columns: list[np.ndarray], headers: list[str]) -> np.ndarray:
+  if not columns:
+    raise JsonError("JSON upload has no columns")
+  if any(len(column) != len(columns[0]) for column in columns):
+    raise JsonError("JSON columns have different lengths")
+  # A single column is handed over as is; more are copied once into the (series, samples) array
+  return columns[0][None] if len(columns) == 1 else np.vstack(columns)
+
+def _check_unique(names: list[str]):
+  seen = set()
+  for name in names:
+    if name in seen:
+      raise JsonError(f"Duplicate column name in JSON upload: {name}")
+    seen.add(name)
+
+def _member_names(raw: bytes) -> list[str]:
+  """Keys of a decoded JSON object, repeats included; its values must be numbers, null or flat arrays of them."""
+  scanner = _JsonScanner(io.BytesIO())
+  scanner.buffer = raw
+  scanner.expect(b"{", "an object")
+  names = []
+  while scanner.peek() not in (b"}", None):
+    names.append(scanner.string())
+    scanner.expect(b":", "':'")
+    if scanner.peek() == b"[":
+      scanner.pos = raw.index(b"]", scanner.pos) + 1
+    else:
+      scanner.pos = min(end for end in (raw.find(b",", scanner.pos), raw.find(b"}", scanner.pos)) if end >= 0)
+    if scanner.peek() == b",":
+      scanner.pos += 1
+  return names
+
+def _read_json_stream(stream: BinaryIO) -> tuple[np.ndarray, list[str]]:
+  scanner = _JsonScanner(stream)
+  scanner.expect(b"{", "an object of columns")
+  headers, columns = [], []
+  if scanner.peek() == b"}":
+    scanner.pos += 1
+  else:
+    while True:
+      headers.append(scanner.string())
+      _check_unique(headers)
+      scanner.expect(b":", "':'")
+      # Later columns are sized after the first, so only the first one ever grows
+      columns.append(scanner.numbers(len(columns[0]) if columns else 1024))
+      if scanner.peek() == b",":
+        scanner.pos += 1
+        continue
+      scanner.expect(b"}", "',' or '}'")
+      break
+  if scanner.peek() is not None:
+    raise JsonError("Unexpected data after the JSON object")
+  return _stack(columns, headers), headers
+
+def _read_json_document(stream: BinaryIO, loads) -> tuple[np.ndarray, list[str]]:
+  raw = stream.read()
+  try:
+    document = loads(raw)
+  except ValueError as e:
+    raise JsonError(f"Invalid JSON: {e}")
+  if not isinstance(document, dict):
+    raise JsonError("JSON upload must be an object of columns")
+  headers = list(document)
+  # Booleans would convert to 0 and 1; the streaming engine rejects them as well
+  if any(isinstance(values, list) and bool in set(map(type, values)) for values in document.values()):
+    raise JsonError("JSON arrays must hold only numbers or null")
+  try:
+    columns = [np.array(document.pop(name), dtype=np.float64) for name in headers]
+  except (TypeError, ValueError) as e:
+    raise JsonError(f"JSON arrays must hold only numbers or null: {e}")
+  if any(column.ndim != 1 for column in columns):
+    raise JsonError("JSON columns must be flat arrays of numbers")
+  # The decoder keeps the last of repeated keys, so look for repeats in the text
+  _check_unique(_member_names(raw))
+  return _stack(columns, headers), headers
+
+def json_engine(engine: str = JSON_ENGINE) -> str:
+  if engine == "auto":
+    return "stream"
+  if engine not in ("stream", "orjson", "json") or (engine == "orjson" and orjson is None):
+    raise ValueError(f"JSON engine not available: {engine}")
+  return engine
+
+def read_json(stream: BinaryIO, engine: str = JSON_ENGINE) -> tuple[np.ndarray, list[str]]:
+  """Parses `{"name": [numbers...], ...}` into float64 (series, samples) plus the names.
+
+  The default engine never materializes the numbers as Python objects: each array
+  is cut into chunks and parsed by the CSV engine straight into a growing float64 buffer.
+  """
+  engine = json_engine(engine)
+  if engine == "stream":
+    return _read_json_stream(stream)
+  return _read_json_document(stream, orjson.loads if engine == "orjson" else _json_loads)
+
+def read_ndjson(stream: BinaryIO) -> tuple[np.ndarray, list[str]]:
+  """Newline-delimited JSON records, one numeric field per series, into float64 (series, samples).
+
+  pyarrow's JSON reader builds the columns when installed; otherwise records are
+  decoded in batches (with orjson when installed) and appended to float64 buffers.
+  Fields missing from a record are NaN.
+  """
+  if pyarrow is not None:
+    try:
+      table = pa_json.read_json(stream)
+    except pyarrow.ArrowException as e:
+      raise JsonError(f"Invalid NDJSON: {e}")
+    if table.num_columns == 0:
+      raise JsonError("NDJSON upload has no records")
+    # Like the JSON engines, reject booleans and the NaN/Infinity literals pyarrow accepts
+    for field, column in zip(table.schema, table.columns):
+      if pyarrow.types.is_boolean(field.type):
+        raise JsonError("NDJSON records must be objects of numbers")
+      if pyarrow.types.is_floating(field.type) and pa_compute.all(pa_compute.is_finite(column)).as_py() is False:
+        raise JsonError(f"NDJSON field {field.name} holds NaN or Infinity, which are not JSON numbers")
+    return _to_array(table), table.column_names
+  loads = orjson.loads if orjson is not None else _json_loads
+  headers, columns = None, None
+  text = io.TextIOWrapper(stream, encoding="utf-8")
+  try:
+    while True:
+      lines = [line for line in text.readlines(NDJSON_BATCH_LINES * 64) if line.strip()]
+      if not lines:
+        break
+      try:
+        records = [loads(line) for line in lines]
+      except ValueError as e:
+        raise JsonError(f"Invalid NDJSON: {e}")
+      if headers is None:
+        headers = list(records[0]) if isinstance(records[0], dict) else []
+        columns = [_Growable() for _ in headers]
+      try:
+        rows = [[record.get(name) for name in headers] for record in records]
+      except AttributeError as e:
+        raise JsonError(f"NDJSON records must be objects of numbers: {e}")
+      # Booleans would convert to 0 and 1
+      if bool in {type(value) for row in rows for value in row}:
+        raise JsonError("NDJSON records must be objects of numbers")
+      try:
+        block = np.array(rows, dtype=np.float64)
+      except (TypeError, ValueError) as e:
+        raise JsonError(f"NDJSON records must be objects of numbers: {e}")
+      if headers and not columns[0].size:
+        # The first record names the series; the decoder keeps only the last of repeated fields
+        _check_unique(_member_names(lines[0].encode("utf-8")))
+      for column, values in zip(columns, block.T):
+        column.extend(values)
+  finally:
+    # Leave the upload open for the caller
+    text.detach()
+  if not headers:
+    raise JsonError("NDJSON upload has no records")
+  return _stack([column.array() for column in columns], headers), headers
@@ -0,0 +1,276 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.datastructures import UploadFile
+import profiling
+
+RESULT_CACHE_BYTES = int(os.getenv("RESULT_CACHE_BYTES", str(256 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR")
+RESULT_CACHE_DISK_BYTES = int(os.getenv("RESULT_CACHE_DISK_BYTES", str(4 * 1024 * 1024 * 1024)))
+HASH_CHUNK_SIZE = 1024 * 1024
+
+class CacheEntry:
+  __slots__ = ("body", "media_type", "headers")
+
+  def __init__(self, body: bytes, media_type: str, headers: dict[str, str]):
+    self.body = body
+    self.media_type = media_type
+    self.headers = headers
+
+class ResultCache:
+  """Rendered responses keyed by request content, bounded by total bytes.
+
+  Entries live in an in-memory LRU and, when a directory is configured, in an
+  on-disk tier that survives evictions and restarts. The disk tier's files and
+  sizes are listed once at startup and tracked in memory from then on.
+  """
+
+  def __init__(self, max_bytes: int = RESULT_CACHE_BYTES, directory: Optional[str] = RESULT_CACHE_DIR,
+    max_disk_bytes: int = RESULT_CACHE_DISK_BYTES):
+    self.max_bytes = max_bytes
+    self.directory = directory
+    self.max_disk_bytes = max_disk_bytes
+    self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+    self._size = 0
+    self._lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.bytes_saved = 0
+    # Disk tier: key -> body size, least recently used first
+    self._disk: OrderedDict[str, int] = OrderedDict()
+    self._disk_size = 0
+    self._disk_lock = threading.Lock()
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+      self._scan_disk()
+
+  def _scan_disk(self):
+    stats = []
+    for name in os.listdir(self.directory):
+      if name.endswith(".bin"):
+        try:
+          stats.append((os.stat(os.path.join(self.directory, name)), name[:-len(".bin")]))
+        except FileNotFoundError:
+          pass
+    for stat, key in sorted(stats, key=lambda item: item[0].st_mtime):
+      self._disk[key] = stat.st_size
+      self._disk_size += stat.st_size
+
+  def _paths(self, key: str):
+    return os.path.join(self.directory, f"{key}.bin"), os.path.join(self.directory, f"{key}.json")
+
+  def _remember(self, key: str, entry: CacheEntry):
+    size = len(entry.body)
+    if size > self.max_bytes:
+      return
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._size -= len(previous.body)
+      self._entries[key] = entry
+      self._size += size
+      while self._size > self.max_bytes:
+        _, evicted = self._entries.popitem(last=False)
+        self._size -= len(evicted.body)
+
+  def _read_disk(self, key: str) -> Optional[CacheEntry]:
+    body_path, meta_path = self._paths(key)
+    try:
+      with open(meta_path, "r") as f:
+        meta = json.load(f)
+      with open(body_path, "rb") as f:
+        body = f.read()
+    except (OSError, ValueError):
+      with self._disk_lock:
+        self._disk_size -= self._disk.pop(key, 0)
+      return None
+    # The mtime keeps the LRU order for the next startup's scan
+    os.utime(body_path)
+    with self._disk_lock:
+      if key in self._disk:
+        self._disk.move_to_end(key)
+    return CacheEntry(body, meta["media_type"], meta["headers"])
+
+  def _write_disk(self, key: str, entry: CacheEntry):
+    body_path, meta_path = self._paths(key)
+    try:
+      for path, data, mode in ((body_path, entry.body, "wb"), (meta_path, json.dumps({"media_type": entry.media_type, "headers": entry.headers}), "w")):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode) as f:
+          f.write(data)
+        os.replace(tmp_path, path)
+    except OSError as e:
+      print(f"Result cache disk write failed: {e}")
+      return
+    with self._disk_lock:
+      self._disk_size += len(entry.body) - self._disk.pop(key, 0)
+      self._disk[key] = len(entry.body)
+      stale = []
+      while self._disk_size > self.max_disk_bytes and self._disk:
+        evicted, size = self._disk.popitem(last=False)
+        self._disk_size -= size
+        stale.append(evicted)
+    self._remove_disk(stale)
+
+  def _remove_disk(self, keys: list[str]):
+    for key in keys:
+      for path in self._paths(key):
+        try:
+          os.remove(path)
+        except FileNotFoundError:
+          pass
+
+  def _lookup(self, key: str) -> Optional[CacheEntry]:
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        self._entries.move_to_end(key)
+    return entry
+
+  def _load(self, key: str) -> Optional[CacheEntry]:
+    entry = self._read_disk(key)
+    if entry is not None:
+      self._remember(key, entry)
+    return entry
+
+  def _count(self, entry: Optional[CacheEntry]):
+    with self._lock:
+      if entry is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+        self.bytes_saved += len(entry.body)
+
+  def get(self, key: str) -> Optional[CacheEntry]:
+    entry = self._lookup(key)
+    if entry is None and self.directory:
+      entry = self._load(key)
+    self._count(entry)
+    return entry
+
+  async def get_async(self, key: str) -> Optional[CacheEntry]:
+    """get, reading the disk tier on a worker thread; memory hits stay on the event loop."""
+    entry = self._lookup(key)
+    if entry is None and self.directory:
+      entry = await asyncio.to_thread(self._load, key)
+    self._count(entry)
+    return entry
+
+  def put(self, key: str, entry: CacheEntry):
+    self._remember(key, entry)
+    if self.directory:
+      self._write_disk(key, entry)
+
+  async def put_async(self, key: str, entry: CacheEntry):
+    """put, writing the disk tier on a worker thread."""
+    self._remember(key, entry)
+    if self.directory:
+      await asyncio.to_thread(self._write_disk, key, entry)
+
+  def clear(self):
+    with self._lock:
+      self._entries.clear()
+      self._size = 0
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_ratio": self.hits / lookups if lookups else 0.0,
+      "bytes_saved": self.bytes_saved,
+      "entries": len(self._entries),
+      "bytes": self._size,
+    }
+
+cache = ResultCache()
+
+class CacheHit(Exception):
+  def __init__(self, key: str, entry: CacheEntry):
+    self.key = key
+    self.entry = entry
+
+def _digest(method: str, path: str, accept: str, items: list) -> str:
+  digest = hashlib.sha256()
+  digest.update(f"{method} {path}\0".encode("utf-8"))
+  # The output format can be negotiated from Accept, so it is part of the result
+  digest.update(f"accept={accept}\0".encode("utf-8"))
+  # Stable sort keeps the order of repeated fields such as `files` and `categories`
+  for name, value in sorted(items, key=lambda item: item[0]):
+    if isinstance(value, UploadFile):
+      extension = (value.filename or "").split(".")[-1].lower()
+      digest.update(f"{name}:file:{extension}\0".encode("utf-8"))
+      value.file.seek(0)
+      while chunk := value.file.read(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+      value.file.seek(0)
+      digest.update(b"\0")
+    else:
+      digest.update(f"{name}={value.strip()}\0".encode("utf-8"))
+  return digest.hexdigest()
+
+async def request_key(request: Request) -> str:
+  """Hashes the endpoint, the Accept header, the normalized form fields and the uploaded bytes.
+
+  The uploads are read and hashed on a worker thread, so a large upload does not stall the event loop.
+  """
+  form = await request.form()
+  return await asyncio.to_thread(_digest, request.method, request.url.path, request.headers.get("accept", ""), form.multi_items())
+
+async def lookup_result(request: Request):
+  """Router dependency: serves a cached result once the request is authorized."""
+  key = await request_key(request)
+  request.state.result_key = key
+  entry = await cache.get_async(key)
+  # A profiled request has to run for real
+  if entry is not None and profiling.active() is None:
+    raise CacheHit(key, entry)
+
+def _etag_matches(request: Request, etag: str) -> bool:
+  if_none_match = request.headers.get("if-none-match")
+  if not if_none_match:
+    return False
+  candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+  return etag in candidates or "*" in candidates
+
+def cached_response(request: Request, key: str, entry: CacheEntry, status: str) -> Response:
+  etag = f'"{key}"'
+  headers = {"ETag": etag, "X-Cache": status, "Vary": "Accept"}
+  if _etag_matches(request, etag):
+    return Response(status_code=304, headers=headers)
+  return Response(entry.body, media_type=entry.media_type, headers={**entry.headers, **headers})
+
+def _keep_header(name: str) -> bool:
+  name = name.lower()
+  return name == "content-disposition" or (name.startswith("x-") and name != "x-cache")
+
+class CachedRoute(APIRoute):
+  """Route class that stores successful responses in the result cache."""
+
+  def get_route_handler(self):
+    handler = super().get_route_handler()
+
+    async def cached_handler(request: Request) -> Response:
+      try:
+        response = await handler(request)
+      except CacheHit as hit:
+        return cached_response(request, hit.key, hit.entry, "HIT")
+      key = getattr(request.state, "result_key", None)
+      if key is None or response.status_code != 200:
+        return response
+      if hasattr(response, "body_iterator"):
+        body = b"".join([chunk if isinstance(chunk, bytes) else chunk.encode("utf-8") async for chunk in response.body_iterator])
+      else:
+        body = response.body
+      headers = {name: value for name, value in response.headers.items() if _keep_header(name)}
+      entry = CacheEntry(body, response.media_type or response.headers.get("content-type"), headers)
+      await cache.put_async(key, entry)
+      return cached_response(request, key, entry, "MISS")
+
+    return cached_handler
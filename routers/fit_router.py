@@ -1,89 +1,138 @@
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException
-from fastapi.responses import StreamingResponse
+import asyncio
+import os
+import numpy as np
+from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException
+from fastapi.responses import JSONResponse
+from executor import render, render_executor
+import formats
+from result_cache import CachedRoute, lookup_result
 import helper
 import fit
-from typing import Literal
+import fitting
+from typing import Literal, Optional
 
-fit_router = APIRouter(prefix="/fit")
+FIT_BATCH_MAX_SERIES = int(os.getenv("FIT_BATCH_MAX_SERIES", "10000"))
+
+fit_router = APIRouter(prefix="/fit", route_class=CachedRoute, dependencies=[Depends(formats.output_format), Depends(lookup_result)])
 
 @fit_router.post("/polyfit")
 async def generate_polyfit(
-  file: UploadFile = File(...), 
+  file: UploadFile = File(...),
+  selection: helper.DataSelection = Depends(helper.data_selection),
   poly_degree: int = Form(..., ge=0), 
   size: Literal["small", "large"] = Form(...)
   ):
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) < 2 or size is None:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = fit.polyfit(data, headers, poly_degree, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=polyfit.pdf"})
+  result = await render(fit.polyfit, data, headers, poly_degree, size)
+  return formats.respond(result, "polyfit")
 
 @fit_router.post("/expfit")
-async def generate_expfit(file: UploadFile = File(...), size: str = Form(...)):
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_expfit(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...)):
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) < 2 or size is None:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = fit.expfit(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=expfit.pdf"})
+  result = await render(fit.expfit, data, headers, size)
+  return formats.respond(result, "expfit")
 
 @fit_router.post("/logfit")
-async def generate_logfit(file: UploadFile = File(...), size: str = Form(...)):
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_logfit(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...)):
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) < 2 or size is None:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = fit.logfit(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=logfit.pdf"})
+  result = await render(fit.logfit, data, headers, size)
+  return formats.respond(result, "logfit")
 
 @fit_router.post("/gaussfit")
-async def generate_gaussfit(file: UploadFile = File(...), size: str = Form(...)):
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_gaussfit(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...)):
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) < 2 or size is None:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = fit.gaussfit(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=gaussfit.pdf"})
+  result = await render(fit.gaussfit, data, headers, size)
+  return formats.respond(result, "gaussfit")
 
 @fit_router.post("/powfit")
-async def generate_powfit(file: UploadFile = File(...), size: str = Form(...)):
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_powfit(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...)):
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) < 2 or size is None:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = fit.powfit(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=powfit.pdf"})
+  result = await render(fit.powfit, data, headers, size)
+  return formats.respond(result, "powfit")
 
 @fit_router.post("/poissonfit")
-async def generate_poissonfit(file: UploadFile = File(...), size: str = Form(...)):
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
-  if len(headers) < 2 or size is None:
+async def generate_poissonfit(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...),
+  mode: Literal["histogram", "events"] = Form("histogram")):
+  data, headers = await helper.load_upload_async(file, selection)
+  if len(headers) < (1 if mode == "events" else 2) or size is None:
+    raise HTTPException(status_code=400, detail="Missing column or data!")
+  result = await render(fit.poissonfit, data, headers, size, mode=mode)
+  return formats.respond(result, "poissonfit")
+
+# Fit endpoint name -> model in fitting.py
+PARAMS_MODELS = {
+  "polyfit": "polynomial",
+  "expfit": "exponential",
+  "logfit": "logistic",
+  "gaussfit": "gaussian",
+  "powfit": "power_law",
+  "poissonfit": "poisson",
+}
+
+@fit_router.post("/{model}/params")
+async def generate_fit_params(
+  model: Literal["polyfit", "expfit", "logfit", "gaussfit", "powfit", "poissonfit"],
+  file: UploadFile = File(...),
+  selection: helper.DataSelection = Depends(helper.data_selection),
+  poly_degree: Optional[int] = Form(None, ge=0),
+  mode: Literal["histogram", "events"] = Form("histogram")
+  ):
+  data, headers = await helper.load_upload_async(file, selection)
+  if len(headers) < (1 if model == "poissonfit" and mode == "events" else 2):
+    raise HTTPException(status_code=400, detail="Missing column or data!")
+  if model == "polyfit" and poly_degree is None:
+    raise HTTPException(status_code=400, detail="poly_degree is required for polyfit")
+  stats = await render(fitting.fit_params, PARAMS_MODELS[model], data, poly_degree, mode)
+  return JSONResponse(formats.jsonable(stats))
+
+@fit_router.post("/batch")
+async def generate_batch_fit(
+  file: UploadFile = File(...),
+  selection: helper.DataSelection = Depends(helper.data_selection),
+  model: Literal["polyfit", "expfit", "logfit", "gaussfit", "powfit", "poissonfit"] = Form(...),
+  poly_degree: Optional[int] = Form(None, ge=0),
+  series: Literal["rows", "columns"] = Form("rows"),
+  x: Literal["first", "index"] = Form("first"),
+  document: Literal["none", "pages", "grid"] = Form("none"),
+  size: Literal["small", "large"] = Form("small")
+  ):
+  data, _ = await helper.load_upload_async(file, selection)
+  data = np.asarray(data, dtype=float)
+  if data.ndim != 2:
+    raise HTTPException(status_code=400, detail="Batch fits need a 2D array")
+  if series == "columns":
+    data = data.T
+  if x == "first":
+    x_values, Y = data[0], data[1:]
+  else:
+    x_values, Y = np.arange(data.shape[1], dtype=float), data
+  if len(Y) == 0:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = fit.poissonfit(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=poissonfit.pdf"})
\ No newline at end of file
+  # Documents run to many pages, which only PDF holds
+  if document != "none" and formats.current().fmt != "pdf":
+    raise HTTPException(status_code=400, detail=f"Batch documents are only available as PDF, not {formats.current().fmt}")
+  if len(Y) > FIT_BATCH_MAX_SERIES:
+    raise HTTPException(status_code=400, detail=f"At most {FIT_BATCH_MAX_SERIES} series per batch")
+  if model == "polyfit":
+    if poly_degree is None:
+      raise HTTPException(status_code=400, detail="poly_degree is required for polyfit")
+    results = await render(fitting.batch_polyfit, x_values, Y, poly_degree)
+  else:
+    # Nonlinear fits are independent per series, so spread them over the pool in one chunk per worker
+    chunks = np.array_split(Y, min(len(Y), render_executor.workers))
+    parts = await asyncio.gather(*(render(fitting.batch_curvefit, PARAMS_MODELS[model], x_values, chunk) for chunk in chunks))
+    results = [result for part in parts for result in part]
+  if document != "none":
+    buffer = await render(fit.batch_document, x_values, Y, results, document, size)
+    return formats.respond(buffer, f"batch_{model}")
+  return JSONResponse(formats.jsonable({"model": PARAMS_MODELS[model], "series": len(Y), "results": results}))
@@ -1,102 +1,80 @@
-from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+import asyncio
+import os
+from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException
 from fastapi.responses import StreamingResponse
+from executor import render
+import decompression
+import formats
+from result_cache import CachedRoute, lookup_result
 import plot as pltpdf
 import helper
-from typing import List
+import lod
+from typing import List, Literal, Optional
 
-plot_router = APIRouter(prefix="/plot")
+COMPOSE_MAX_PANELS = int(os.getenv("COMPOSE_MAX_PANELS", "64"))
+
+plot_router = APIRouter(prefix="/plot", route_class=CachedRoute, dependencies=[Depends(formats.output_format), Depends(lookup_result)])
 
 @plot_router.post("/scatter")
-async def generate_scatter_plot(file: UploadFile = File(...), size: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_scatter_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...),
+  lod_method: lod.LodMethod = Form("auto", alias="lod")) -> StreamingResponse:
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) != 2:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.scatter(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=scatter.pdf"})
+  buffer, dropped = await render(lod.plot_reduced, pltpdf.scatter, data, headers, size, lod_method)
+  return formats.respond(buffer, "scatter", {"X-LOD-Dropped-Points": str(dropped)})
 
 @plot_router.post("/errbar1x")
-async def generate_errbar1x_plot(file: UploadFile = File(...), size: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_errbar1x_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...),
+  lod_method: lod.LodMethod = Form("auto", alias="lod")) -> StreamingResponse:
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) != 3:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.errbar1x(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=errbar1x.pdf"})
+  buffer, dropped = await render(lod.plot_reduced, pltpdf.errbar1x, data, headers, size, lod_method)
+  return formats.respond(buffer, "errbar1x", {"X-LOD-Dropped-Points": str(dropped)})
 
 @plot_router.post("/errbar1y")
-async def generate_errbar1x_plot(file: UploadFile = File(...), size: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_errbar1x_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...),
+  lod_method: lod.LodMethod = Form("auto", alias="lod")) -> StreamingResponse:
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) != 3:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.errbar1y(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=errbar1y.pdf"})
+  buffer, dropped = await render(lod.plot_reduced, pltpdf.errbar1y, data, headers, size, lod_method, error_row=2)
+  return formats.respond(buffer, "errbar1y", {"X-LOD-Dropped-Points": str(dropped)})
 
 @plot_router.post("/errbar2xy")
-async def generate_errbar2xy_plot(file: UploadFile = File(...), size: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_errbar2xy_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...),
+  lod_method: lod.LodMethod = Form("auto", alias="lod")) -> StreamingResponse:
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) != 4:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.errbar2xy(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=errbar2xy.pdf"})
+  buffer, dropped = await render(lod.plot_reduced, pltpdf.errbar2xy, data, headers, size, lod_method, error_row=3)
+  return formats.respond(buffer, "errbar2xy", {"X-LOD-Dropped-Points": str(dropped)})
 
 @plot_router.post("/bar")
-async def generate_bar_plot(file: UploadFile = File(...), size: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_bar_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...)) -> StreamingResponse:
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) != 2:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.bar(data, headers, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=bar.pdf"})
+  buffer = await render(pltpdf.bar, data, headers, size)
+  return formats.respond(buffer, "bar")
 
 @plot_router.post("/pie")
-async def generate_pie_plot(file: UploadFile = File(...), size: str = Form(...), categories: list[str] = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, headers = helper.load_data(file_ext, contents)
+async def generate_pie_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...), categories: list[str] = Form(...)) -> StreamingResponse:
+  data, headers = await helper.load_upload_async(file, selection)
   if len(headers) != 1:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.pie(data, categories, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=pie.pdf"})
+  buffer = await render(pltpdf.pie, data, categories, size)
+  return formats.respond(buffer, "pie")
 
 @plot_router.post("/boxplot")
-async def generate_boxplot_plot(file: UploadFile = File(...), size: str = Form(...), categories: list[str] = Form(...),
+async def generate_boxplot_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), size: str = Form(...), categories: list[str] = Form(...),
   xlabel: str = Form(...), ylabel: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, _ = helper.load_data(file_ext, contents)
+  data, _ = await helper.load_upload_async(file, selection)
   if categories is None or xlabel is None or ylabel is None:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.boxplot(data, categories, size, xlabel, ylabel)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=boxplot.pdf"})
+  buffer = await render(pltpdf.boxplot, data, categories, size, xlabel, ylabel)
+  return formats.respond(buffer, "boxplot")
 
 @plot_router.post("/eqhist")
 async def generate_eqhist_plot(
@@ -106,19 +84,12 @@ async def generate_eqhist_plot(
   ylabel: str = Form(...),
   size: str = Form(...)
   ) -> StreamingResponse:
-  contents_data = await files[0].read()
-  file_extdata = files[0].filename.split(".")[-1].lower()
-  data, _ = helper.load_data(file_extdata, contents_data)
+  data, _ = await helper.load_upload_async(files[0])
   weights = None
   if len(files) > 1:
-    contents_weights = await files[1].read()
-    file_extweights = files[1].filename.split(".")[-1].lower()
-    weights, _ = helper.load_data(file_extweights, contents_weights)
-  try:
-    pdf_buffer = pltpdf.eqhist(data, weights, bins, xlabel, ylabel, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=eqhist.pdf"})
+    weights, _ = await helper.load_upload_async(files[1])
+  buffer = await render(pltpdf.eqhist, data, weights, bins, xlabel, ylabel, size)
+  return formats.respond(buffer, "eqhist")
 
 @plot_router.post("/varyhist")
 async def generate_varyhist_plot(
@@ -127,68 +98,47 @@ async def generate_varyhist_plot(
   ylabel: str = Form(...),
   size: str = Form(...)
   ) -> StreamingResponse:
-  contents_data = await files[0].read()
-  file_extdata = files[0].filename.split(".")[-1].lower()
-  data, h1 = helper.load_data(file_extdata, contents_data)
+  data, h1 = await helper.load_upload_async(files[0])
   weights = None
   h2 = None
   if len(files) > 1:
-    contents_weights = await files[1].read()
-    file_extweights = files[1].filename.split(".")[-1].lower()
-    weights, h2 = helper.load_data(file_extweights, contents_weights)
+    weights, h2 = await helper.load_upload_async(files[1])
     if len(h2) != 2:
       raise HTTPException(status_code=400, detail="Missing column or data!")
   if h2 is None:
     h2 = []
   if len(h1) != 2:
     raise HTTPException(status_code=400, detail="Missing column or data!")
-  try:
-    pdf_buffer = pltpdf.varyhist(data, weights, xlabel, ylabel, size)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=varyhist.pdf"})
+  buffer = await render(pltpdf.varyhist, data, weights, xlabel, ylabel, size)
+  return formats.respond(buffer, "varyhist")
 
 @plot_router.post("/imshowhmap")
-async def generate_imshowhmap_plot(file: UploadFile = File(...), title: str = Form(...), cmap: str = Form(...), origin: str = Form(...),
+async def generate_imshowhmap_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), title: str = Form(...), cmap: str = Form(...), origin: str = Form(...),
   size: str = Form(...), useAnnotation: bool = Form(...), normalization: str = Form(...), missing_values: str = Form(...),
   xlabel: str = Form(...), ylabel: str = Form(...), zlabel: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, _ = helper.load_data(file_ext, contents)
-  data = helper.normalize_data(data, method=normalization)
-  data = helper.handle_missing_values(data, strategy=missing_values)
+  data, _ = await helper.load_upload_async(file, selection)
   headers = [xlabel, ylabel, zlabel]
-  pdf_buffer = pltpdf.imshowhmap(data, headers, title, cmap, origin, size, useAnnotation)
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=imshowhmap.pdf"})
+  buffer = await render(helper.prepared, pltpdf.imshowhmap, 1, normalization, missing_values, data, headers, title, cmap, origin, size, useAnnotation)
+  return formats.respond(buffer, "imshowhmap")
 
 @plot_router.post("/pmhmap")
-async def generate_pmhmap_plot(file: UploadFile = File(...), title: str = Form(...), cmap: str = Form(...), shading: str = Form(...),
+async def generate_pmhmap_plot(file: UploadFile = File(...), selection: helper.DataSelection = Depends(helper.data_selection), title: str = Form(...), cmap: str = Form(...), shading: str = Form(...),
   size: str = Form(...), useAnnotation: bool = Form(...), normalization: str = Form(...), missing_values: str = Form(...),
   xlabel: str = Form(...), ylabel: str = Form(...), zlabel: str = Form(...)) -> StreamingResponse:
-  contents = await file.read()
-  file_ext = file.filename.split(".")[-1].lower()
-  data, _ = helper.load_data(file_ext, contents)
-  data = helper.normalize_data(data, method=normalization)
-  data = helper.handle_missing_values(data, strategy=missing_values)
+  data, _ = await helper.load_upload_async(file, selection)
   headers = [xlabel, ylabel, zlabel]
-  pdf_buffer = pltpdf.pmhmap(data, headers, title, cmap, shading, size, useAnnotation)
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=pmhmap.pdf"})
+  buffer = await render(helper.prepared, pltpdf.pmhmap, 1, normalization, missing_values, data, headers, title, cmap, shading, size, useAnnotation)
+  return formats.respond(buffer, "pmhmap")
 
 @plot_router.post("/pmChmap")
 async def generate_pmChmap_plot(files: List[UploadFile] = File(...), title: str = Form(...), cmap: str = Form(...), shading: str = Form(...),
   size: str = Form(...), useAnnotation: bool = Form(...), normalization: str = Form(...), missing_values: str = Form(...),
   xlabel: str = Form(...), ylabel: str = Form(...), zlabel: str = Form(...)) -> StreamingResponse:
-  contents_data = await files[0].read()
-  contents_coord = await files[1].read()
-  file_extdata = files[0].filename.split(".")[-1].lower()
-  file_extcoord = files[1].filename.split(".")[-1].lower()
-  data, _ = helper.load_data(file_extdata, contents_data)
-  coord, _ = helper.load_data(file_extcoord, contents_coord)
-  data = helper.normalize_data(data, method=normalization)
-  data = helper.handle_missing_values(data, strategy=missing_values)
+  data, _ = await helper.load_upload_async(files[0])
+  coord, _ = await helper.load_upload_async(files[1])
   headers = [xlabel, ylabel, zlabel]
-  pdf_buffer = pltpdf.pmChmap(data, coord, headers, title, cmap, shading, size, useAnnotation)
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=pmChmap.pdf"})
+  buffer = await render(helper.prepared, pltpdf.pmChmap, 1, normalization, missing_values, data, coord, headers, title, cmap, shading, size, useAnnotation)
+  return formats.respond(buffer, "pmChmap")
 
 @plot_router.post("/pmfhmap")
 async def generate_pmfhmap_plot(files: List[UploadFile] = File(...), title: str = Form(...), cmap: str = Form(...), func: str = Form(...),
@@ -196,19 +146,12 @@ async def generate_pmfhmap_plot(files: List[UploadFile] = File(...), title: str
   missing_values: str = Form(...), xlabel: str = Form(...), ylabel: str = Form(...), zlabel: str = Form(...)) -> StreamingResponse:
   if len(files) != 2:
     raise ValueError("Missing required files.")
-  contents_X = await files[0].read()
-  contents_Y = await files[1].read()
-  file_extX = files[0].filename.split(".")[-1].lower()
-  file_extY = files[1].filename.split(".")[-1].lower()
-  X, _ = helper.load_data(file_extX, contents_X)
-  Y, _ = helper.load_data(file_extY, contents_Y)
-  X = helper.normalize_data(X, method=normalization)
-  X = helper.handle_missing_values(X, strategy=missing_values)
-  Y = helper.normalize_data(Y, method=normalization)
-  Y = helper.handle_missing_values(Y, strategy=missing_values)
+  helper.check_expression(func)
+  X, _ = await helper.load_upload_async(files[0])
+  Y, _ = await helper.load_upload_async(files[1])
   headers = [xlabel, ylabel, zlabel]
-  pdf_buffer = pltpdf.pmfhmap(X, Y, headers, title, cmap, shading, func, size, useAnnotation)
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=pmfhmap.pdf"})
+  buffer = await render(helper.prepared, pltpdf.pmfhmap, 2, normalization, missing_values, X, Y, headers, title, cmap, shading, func, size, useAnnotation)
+  return formats.respond(buffer, "pmfhmap")
 
 @plot_router.post("/contour")
 async def generate_contour_plot(files: List[UploadFile] = File(...), title: str = Form(...), cmap: str = Form(...), 
@@ -216,16 +159,71 @@ async def generate_contour_plot(files: List[UploadFile] = File(...), title: str
   missing_values: str = Form(...), xlabel: str = Form(...), ylabel: str = Form(...), zlabel: str = Form(...)) -> StreamingResponse:
   if len(files) != 2:
     raise ValueError("Missing required files.")
-  contents_X = await files[0].read()
-  contents_Y = await files[1].read()
-  file_extX = files[0].filename.split(".")[-1].lower()
-  file_extY = files[1].filename.split(".")[-1].lower()
-  X, _ = helper.load_data(file_extX, contents_X)
-  Y, _ = helper.load_data(file_extY, contents_Y)
-  X = helper.normalize_data(X, method=normalization)
-  X = helper.handle_missing_values(X, strategy=missing_values)
-  Y = helper.normalize_data(Y, method=normalization)
-  Y = helper.handle_missing_values(Y, strategy=missing_values)
+  helper.check_expression(func)
+  X, _ = await helper.load_upload_async(files[0])
+  Y, _ = await helper.load_upload_async(files[1])
   headers = [xlabel, ylabel, zlabel]
-  pdf_buffer = pltpdf.contourmap(X, Y, title, cmap, levels, func, size, headers)
-  return StreamingResponse(pdf_buffer, media_type="application/pdf", headers={"Content-Disposition": "inline; filename=contour.pdf"})
\ No newline at end of file
+  buffer = await render(helper.prepared, pltpdf.contourmap, 2, normalization, missing_values, X, Y, title, cmap, levels, func, size, headers)
+  return formats.respond(buffer, "contour")
+
+def _compose_grid(spec: Optional[str], panels: int) -> Optional[tuple[int, int]]:
+  if not spec:
+    return None
+  try:
+    rows, cols = (int(part) for part in spec.lower().split("x"))
+  except ValueError:
+    raise HTTPException(status_code=400, detail=f"Invalid grid: {spec} (use ROWSxCOLS)")
+  if rows < 1 or cols < 1 or rows * cols < panels:
+    raise HTTPException(status_code=400, detail=f"Grid {spec} has no room for {panels} panels")
+  return rows, cols
+
+def _compose_datasets(files: List[UploadFile], names: Optional[list[str]]):
+  # Compressed NPZ archives are inflated once, both to list their members and to load them
+  planned = []
+  for upload in files:
+    stem = decompression.split_extension(upload.filename)[0]
+    file_ext, stream, codec = helper.open_upload(upload)
+    planned += [(stem, file_ext, stream, codec, name) for name in names or helper.dataset_names(file_ext, stream)]
+  return planned
+
+@plot_router.post("/compose")
+async def generate_compose_plot(
+  files: List[UploadFile] = File(...),
+  layout: Literal["overlay", "grid"] = Form("overlay"),
+  kind: str = Form("scatter"),
+  datasets: Optional[str] = Form(None),
+  grid: Optional[str] = Form(None),
+  share_axes: bool = Form(False),
+  title: str = Form(""),
+  xlabel: Optional[str] = Form(None),
+  ylabel: Optional[str] = Form(None),
+  size: str = Form("large"),
+  lod_method: lod.LodMethod = Form("auto", alias="lod")
+  ) -> StreamingResponse:
+  # Every file, and every array of an NPZ, becomes one dataset drawn into the same figure
+  names = [name.strip() for name in datasets.split(",")] if datasets else None
+  # Count the datasets before parsing any of them
+  planned = await asyncio.to_thread(_compose_datasets, files, names)
+  if len(planned) > COMPOSE_MAX_PANELS:
+    raise HTTPException(status_code=400, detail=f"At most {COMPOSE_MAX_PANELS} datasets per figure")
+  data, labels, headers = [], [], None
+  for stem, file_ext, stream, codec, name in planned:
+    values, columns = await helper.load_stream_async(file_ext, stream, helper.DataSelection(dataset=name), codec)
+    data.append(values)
+    labels.append(stem if name is None else name if len(files) == 1 else f"{stem}/{name}")
+    headers = headers or columns
+  kinds = [part.strip() for part in kind.split(",")]
+  if len(kinds) == 1:
+    kinds = kinds * len(data)
+  if len(kinds) != len(data):
+    raise HTTPException(status_code=400, detail=f"Got {len(kinds)} plot kinds for {len(data)} datasets")
+  for values, label, panel_kind in zip(data, labels, kinds):
+    if panel_kind not in pltpdf.COMPOSE_KINDS:
+      raise HTTPException(status_code=400, detail=f"Unsupported plot kind: {panel_kind} (use {', '.join(pltpdf.COMPOSE_KINDS)})")
+    columns = pltpdf.COMPOSE_KINDS[panel_kind][1]
+    if columns is not None and (values.ndim != 2 or len(values) != columns):
+      raise HTTPException(status_code=400, detail=f"Missing column or data in {label}: {panel_kind} needs {columns} columns")
+  headers = [xlabel or headers[0], ylabel or (headers[1] if len(headers) > 1 and kinds[0] != "hist" else "count")]
+  buffer, dropped = await render(pltpdf.compose, data, labels, kinds, layout, headers, title, size, _compose_grid(grid, len(data)),
+    share_axes, lod_method)
+  return formats.respond(buffer, "compose", {"X-LOD-Dropped-Points": str(dropped)})
@@ -0,0 +1,17 @@
+import pytest
+from fastapi import Depends
+from main import app, get_current_user, authorize_action
+
+def mock_get_current_user():
+  return {"user_id": "test_user", "email": "test@example.com"}
+
+def mock_authorize_action(user: dict = Depends(mock_get_current_user)):
+  return user
+
+@pytest.fixture(autouse=True)
+def mock_auth():
+  """Every test talks to the app as an authorized user; tests can swap the overrides with monkeypatch."""
+  app.dependency_overrides[get_current_user] = mock_get_current_user
+  app.dependency_overrides[authorize_action] = mock_authorize_action
+  yield
+  app.dependency_overrides.clear()
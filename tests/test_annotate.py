@@ -0,0 +1,44 @@
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+import annotate
+import plot
+from formats import serialize
+
+def annotated_mesh(data, *coords, shading="auto", fig_size=(7, 3)):
+  fig, ax = plt.subplots(figsize=fig_size)
+  mesh = ax.pcolormesh(*coords, data, shading=shading)
+  fig.tight_layout()
+  plot._annotate_mesh(ax, mesh, data, False, *coords)
+  artists = [artist for artist in ax.artists if isinstance(artist, annotate.CellLabels)]
+  plt.close(fig)
+  return ax, artists
+
+def test_labels_are_one_artist_at_cell_centres():
+  data = np.arange(6.).reshape(2, 3)
+  ax, artists = annotated_mesh(data)
+  assert len(artists) == 1 and not ax.texts
+  assert np.allclose(artists[0]._offsets, [[0.5, 0.5], [1.5, 0.5], [2.5, 0.5], [0.5, 1.5], [1.5, 1.5], [2.5, 1.5]])
+  assert list(artists[0]._labels) == ["0.00", "1.00", "2.00", "3.00", "4.00", "5.00"]
+
+def test_coordinate_mesh_labels_use_mesh_coordinates():
+  data = np.arange(6.).reshape(2, 3)
+  X, Y = np.meshgrid([10., 20., 40.], [-1., 1.])
+  _, (labels,) = annotated_mesh(data, X, Y, shading="nearest")
+  assert np.allclose(labels._offsets, np.column_stack([X.ravel(), Y.ravel()]))
+  X, Y = np.meshgrid([0., 1., 3., 7.], [0., 2., 4.])
+  _, (labels,) = annotated_mesh(data, X, Y, shading="flat")
+  assert np.allclose(labels._offsets[:3], [[0.5, 1], [2, 1], [5, 1]])
+
+def test_small_cells_are_thinned_not_shrunk():
+  data = np.random.default_rng(0).normal(size=(100, 100))
+  _, (labels,) = annotated_mesh(data, fig_size=(3.375, 3))
+  assert 0 < len(labels) < data.size / 10
+  assert labels._prop.get_size_in_points() >= annotate.ANNOTATION_MIN_FONT
+
+def test_annotated_heatmaps_render():
+  data = np.random.default_rng(1).normal(size=(40, 40))
+  data[3, 4] = np.nan
+  assert serialize(plot.pmhmap(data, ["x", "y", "z"], "Test", "viridis", "auto", "small", True)).getvalue().startswith(b"%PDF")
+  assert serialize(plot.imshowhmap(data, ["x", "y", "z"], "Test", "viridis", "lower", "large", True)).getvalue().startswith(b"%PDF")
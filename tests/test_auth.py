@@ -0,0 +1,193 @@
+import json
+import time
+from types import SimpleNamespace
+import pytest
+import rsa
+from google.auth import crypt, jwt
+from auth import AuthorizationCache, TokenVerifier
+
+class FakeClock:
+  def __init__(self):
+    self.now = 1000.0
+
+  def __call__(self):
+    return self.now
+
+class FakeBindingsClient:
+  def __init__(self, bindings):
+    self.bindings = bindings
+    self.calls = 0
+
+  def list_policy_bindings(self, request):
+    self.calls += 1
+    return SimpleNamespace(policy_bindings=[SimpleNamespace(role=role, principals=principals) for role, principals in self.bindings])
+
+def make_cache(bindings, **kwargs):
+  client = FakeBindingsClient(bindings)
+  clock = FakeClock()
+  cache = AuthorizationCache("projects/test/sciencegraphapi", "roles/run.invoker", client_factory=lambda: client, clock=clock,
+    ttl=300, max_stale=3600, negative_ttl=60, min_refresh=5, **kwargs)
+  return cache, client, clock
+
+def test_authorization_cache_reuses_bindings():
+  cache, client, _ = make_cache([("roles/run.invoker", ["user:a@example.com"]), ("roles/viewer", ["user:b@example.com"])])
+  assert cache.is_authorized("a@example.com")
+  assert cache.is_authorized("a@example.com")
+  assert client.calls == 1
+  assert cache.stats()["hits"] == 1
+  assert cache.stats()["misses"] == 1
+
+def test_authorization_cache_only_counts_required_role():
+  cache, _, _ = make_cache([("roles/viewer", ["user:b@example.com"])])
+  assert not cache.is_authorized("b@example.com")
+
+def test_authorization_cache_negative_entries():
+  cache, client, clock = make_cache([("roles/run.invoker", ["user:a@example.com"])])
+  cache.is_authorized("a@example.com")
+  clock.now += 10
+  assert not cache.is_authorized("x@example.com")
+  assert client.calls == 2
+  clock.now += 10
+  assert not cache.is_authorized("x@example.com")
+  assert client.calls == 2
+  assert cache.stats()["negative_hits"] == 1
+
+def test_authorization_cache_keeps_denials_across_refreshes():
+  cache, client, clock = make_cache([("roles/run.invoker", ["user:a@example.com"])])
+  cache.is_authorized("a@example.com")
+  clock.now += 10
+  assert not cache.is_authorized("x@example.com")
+  clock.now += 10
+  assert not cache.is_authorized("y@example.com")
+  assert client.calls == 3
+  # Taking turns within the negative TTL no longer clears the other's denial
+  for _ in range(3):
+    clock.now += 10
+    assert not cache.is_authorized("x@example.com")
+    assert not cache.is_authorized("y@example.com")
+  assert client.calls == 3
+
+def test_authorization_cache_forgets_denials_the_policy_now_grants():
+  cache, client, clock = make_cache([("roles/run.invoker", ["user:a@example.com"])])
+  cache.is_authorized("a@example.com")
+  clock.now += 10
+  assert not cache.is_authorized("x@example.com")
+  client.bindings = [("roles/run.invoker", ["user:a@example.com", "user:x@example.com"])]
+  cache.refresh()
+  assert cache.is_authorized("x@example.com")
+
+def test_authorization_cache_picks_up_new_grants():
+  cache, client, clock = make_cache([("roles/run.invoker", ["user:a@example.com"])])
+  cache.is_authorized("a@example.com")
+  client.bindings = [("roles/run.invoker", ["user:a@example.com", "user:new@example.com"])]
+  clock.now += 10
+  assert cache.is_authorized("new@example.com")
+
+def test_authorization_cache_refreshes_stale_snapshot_in_background():
+  cache, client, clock = make_cache([("roles/run.invoker", ["user:a@example.com"])])
+  cache.is_authorized("a@example.com")
+  clock.now += 400
+  assert cache.is_authorized("a@example.com")
+  for _ in range(100):
+    if cache.refreshes == 2:
+      break
+    time.sleep(0.01)
+  assert client.calls == 2
+
+def test_authorization_cache_refetches_expired_snapshot():
+  cache, client, clock = make_cache([("roles/run.invoker", ["user:a@example.com"])])
+  cache.is_authorized("a@example.com")
+  clock.now += 4000
+  assert cache.is_cached("a@example.com") is False
+  assert cache.is_authorized("a@example.com")
+  assert client.calls == 2
+
+CLIENT_ID = "test-client.apps.googleusercontent.com"
+
+class StubCertEndpoint:
+  def __init__(self, certs, max_age=3600):
+    self.certs = certs
+    self.max_age = max_age
+    self.calls = 0
+
+  def __call__(self, url, method="GET", **kwargs):
+    self.calls += 1
+    return SimpleNamespace(status=200, headers={"Cache-Control": f"public, max-age={self.max_age}"},
+      data=json.dumps(self.certs).encode("utf-8"))
+
+@pytest.fixture(scope="module")
+def keypair():
+  public_key, private_key = rsa.newkeys(1024)
+  return public_key.save_pkcs1().decode("utf-8"), private_key.save_pkcs1().decode("utf-8")
+
+def make_token(private_pem, key_id="key-1", lifetime=3600, **claims):
+  now = int(time.time())
+  payload = {"iss": "https://accounts.google.com", "aud": CLIENT_ID, "email": "a@example.com", "iat": now, "exp": now + lifetime}
+  payload.update(claims)
+  return jwt.encode(crypt.RSASigner.from_string(private_pem, key_id=key_id), payload).decode("utf-8")
+
+def test_token_verifier_checks_signature_once(keypair):
+  public_pem, private_pem = keypair
+  endpoint = StubCertEndpoint({"key-1": public_pem})
+  verifier = TokenVerifier(CLIENT_ID, request=endpoint)
+  token = make_token(private_pem)
+  for _ in range(5):
+    assert verifier.verify(token)["email"] == "a@example.com"
+  assert endpoint.calls == 1
+  assert verifier.stats()["misses"] == 1
+  assert verifier.stats()["hits"] == 4
+
+def test_token_verifier_reuses_certs_until_max_age(keypair):
+  public_pem, private_pem = keypair
+  clock = FakeClock()
+  endpoint = StubCertEndpoint({"key-1": public_pem}, max_age=100)
+  verifier = TokenVerifier(CLIENT_ID, request=endpoint, clock=clock)
+  verifier.verify(make_token(private_pem, email="a@example.com"))
+  verifier.verify(make_token(private_pem, email="b@example.com"))
+  assert endpoint.calls == 1
+  clock.now += 101
+  verifier.verify(make_token(private_pem, email="c@example.com"))
+  assert endpoint.calls == 2
+
+def test_token_verifier_forgets_tokens_after_exp(keypair):
+  public_pem, private_pem = keypair
+  clock = FakeClock()
+  clock.now = time.time()
+  verifier = TokenVerifier(CLIENT_ID, request=StubCertEndpoint({"key-1": public_pem}), clock=clock)
+  token = make_token(private_pem, lifetime=60)
+  verifier.verify(token)
+  assert verifier.lookup(token) is not None
+  clock.now += 120
+  assert verifier.lookup(token) is None
+
+def test_token_verifier_refetches_rotated_keys(keypair):
+  public_pem, private_pem = keypair
+  endpoint = StubCertEndpoint({"old-key": public_pem})
+  verifier = TokenVerifier(CLIENT_ID, request=endpoint)
+  verifier.certs()
+  endpoint.certs = {"key-1": public_pem}
+  assert verifier.verify(make_token(private_pem))["email"] == "a@example.com"
+  assert endpoint.calls == 2
+
+def test_token_verifier_rate_limits_unknown_key_ids(keypair):
+  public_pem, private_pem = keypair
+  clock = FakeClock()
+  clock.now = time.time()
+  endpoint = StubCertEndpoint({"key-1": public_pem})
+  verifier = TokenVerifier(CLIENT_ID, request=endpoint, clock=clock)
+  verifier.certs()
+  for key_id in ("bogus-1", "bogus-2", "bogus-3"):
+    with pytest.raises(ValueError):
+      verifier.verify(make_token(private_pem, key_id=key_id))
+  assert endpoint.calls == 2
+  clock.now += 61
+  with pytest.raises(ValueError):
+    verifier.verify(make_token(private_pem, key_id="bogus-4"))
+  assert endpoint.calls == 3
+
+def test_token_verifier_rejects_wrong_audience(keypair):
+  public_pem, private_pem = keypair
+  verifier = TokenVerifier(CLIENT_ID, request=StubCertEndpoint({"key-1": public_pem}))
+  with pytest.raises(ValueError):
+    verifier.verify(make_token(private_pem, aud="someone-else"))
+  assert verifier.stats()["cached_tokens"] == 0
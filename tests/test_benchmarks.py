@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+import helper
+from benchmarks import datagen, harness
+
+@pytest.mark.parametrize("file_ext", datagen.FORMATS)
+def test_generated_uploads_load_back(file_ext):
+  data = datagen.series(50)
+  loaded, _ = helper.load_data(file_ext, datagen.encode(data, file_ext, ["x", "y"]))
+  assert np.allclose(loaded, data)
+
+def test_matrix_csv_keeps_rows():
+  matrix = datagen.matrix(16)
+  loaded, _ = helper.load_data("csv", datagen.encode(matrix, "csv"))
+  assert np.allclose(loaded, matrix)
+
+def test_compare_flags_slowdowns_beyond_tolerance():
+  baseline = {"fast": {"seconds": 1.0}, "slow": {"seconds": 1.0}, "gone": {"seconds": 1.0}}
+  results = {"fast": {"seconds": 0.9}, "slow": {"seconds": 1.5}, "new": {"seconds": 1.0}}
+  assert harness.compare(baseline, results, 0.25) == ["slow"]
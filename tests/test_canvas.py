@@ -0,0 +1,38 @@
+import sys
+import numpy as np
+import canvas
+import plot
+from formats import OutputFormat, serialize
+
+def test_released_figures_are_reused_clean():
+  pool = canvas.FigurePool(max_idle=1)
+  fig = pool.acquire("large")
+  ax = fig.subplots()
+  ax.plot([1, 2], [3, 4])
+  fig.tight_layout()
+  fig.set_size_inches(1, 1)
+  pool.release(fig)
+  again = pool.acquire("large")
+  assert again is fig
+  assert again.axes == [] and tuple(again.get_size_inches()) == canvas.FIGURE_SIZES["large"]
+  assert again.get_layout_engine() is None
+  assert pool.stats()["reused"] == 1
+
+def test_pool_keeps_at_most_max_idle():
+  pool = canvas.FigurePool(max_idle=1)
+  first, second = pool.acquire("small"), pool.acquire("small")
+  pool.release(first)
+  pool.release(second)
+  assert pool.stats()["idle"]["small"] == 1
+
+def test_reused_figure_renders_identically():
+  data = np.array([[1., 2., 3.], [2., 4., 1.]])
+  png = OutputFormat("png", 50)
+  first = serialize(plot.scatter(data, ["x", "y"], "small"), png).getvalue()
+  serialize(plot.pmhmap(np.random.default_rng(0).random((4, 4)), ["x", "y", "z"], "Test", "viridis", "auto", "small", True), png)
+  assert serialize(plot.scatter(data, ["x", "y"], "small"), png).getvalue() == first
+
+def test_rendering_does_not_use_pyplot():
+  assert "matplotlib.pyplot" not in sys.modules or not sys.modules["matplotlib.pyplot"].get_fignums()
+  serialize(plot.scatter(np.array([[1., 2.], [3., 4.]]), ["x", "y"], "large"))
+  assert "matplotlib.pyplot" not in sys.modules or not sys.modules["matplotlib.pyplot"].get_fignums()
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+import pytest
+from fastapi import HTTPException
+import executor as executor_module
+from executor import RenderExecutor
+
+def slow_square(x, delay=0.0):
+  time.sleep(delay)
+  return x * x
+
+def fail(message):
+  raise ValueError(message)
+
+def test_thread_executor_runs_job():
+  executor = RenderExecutor(kind="thread", workers=2, max_queue=0, timeout=5)
+  try:
+    assert asyncio.run(executor.run(slow_square, 4)) == 16
+    assert executor.in_flight == 0
+  finally:
+    executor.shutdown()
+
+def test_process_executor_runs_job():
+  executor = RenderExecutor(kind="process", workers=1, max_queue=0, timeout=30)
+  try:
+    assert asyncio.run(executor.run(pow, 2, 10)) == 1024
+  finally:
+    executor.shutdown()
+
+def test_executor_propagates_job_errors():
+  executor = RenderExecutor(kind="thread", workers=1, max_queue=0, timeout=5)
+  try:
+    with pytest.raises(ValueError, match="bad data"):
+      asyncio.run(executor.run(fail, "bad data"))
+    assert executor.in_flight == 0
+  finally:
+    executor.shutdown()
+
+def test_render_reports_job_errors_as_500(monkeypatch):
+  executor = RenderExecutor(kind="thread", workers=1, max_queue=0, timeout=5)
+  monkeypatch.setattr(executor_module, "render_executor", executor)
+  try:
+    with pytest.raises(HTTPException) as info:
+      asyncio.run(executor_module.render(fail, "bad data"))
+    assert info.value.status_code == 500
+    assert info.value.detail == "Error rendering result: bad data"
+  finally:
+    executor.shutdown()
+
+def test_executor_rejects_when_queue_full():
+  executor = RenderExecutor(kind="thread", workers=1, max_queue=1, timeout=5, retry_after=7)
+  release = threading.Event()
+
+  async def scenario():
+    first = asyncio.ensure_future(executor.run(release.wait))
+    second = asyncio.ensure_future(executor.run(release.wait))
+    await asyncio.sleep(0.05)
+    with pytest.raises(HTTPException) as excinfo:
+      await executor.run(slow_square, 2)
+    release.set()
+    await asyncio.gather(first, second)
+    return excinfo.value
+
+  try:
+    error = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert error.headers["Retry-After"] == "7"
+  finally:
+    executor.shutdown()
+
+def test_executor_times_out_slow_jobs():
+  executor = RenderExecutor(kind="thread", workers=1, max_queue=0, timeout=0.05)
+  try:
+    with pytest.raises(HTTPException) as excinfo:
+      asyncio.run(executor.run(slow_square, 3, delay=0.5))
+    assert excinfo.value.status_code == 504
+  finally:
+    executor.shutdown()
+
+def test_process_executor_stops_jobs_that_time_out():
+  executor = RenderExecutor(kind="process", workers=1, max_queue=0, timeout=30)
+  try:
+    assert asyncio.run(executor.run(pow, 2, 3)) == 8
+    stuck = executor.start()
+    executor.timeout = 0.2
+    with pytest.raises(HTTPException) as excinfo:
+      asyncio.run(executor.run(time.sleep, 60))
+    assert excinfo.value.status_code == 504
+    deadline = time.monotonic() + 10
+    while executor.in_flight and time.monotonic() < deadline:
+      time.sleep(0.05)
+    assert executor.in_flight == 0
+    assert executor.start() is not stuck
+    executor.timeout = 30
+    assert asyncio.run(executor.run(pow, 2, 4)) == 16
+  finally:
+    executor.shutdown()
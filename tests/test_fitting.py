@@ -0,0 +1,150 @@
+import io
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import fitting
+from main import app
+
+client = TestClient(app)
+
+def post_params(model, data=None):
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  with open(csv_path, "rb") as csv_file:
+    return client.post(f"/fit/{model}/params", files={"file": ("data.csv", csv_file, "text/csv")}, data=data or {})
+
+def test_fitting_does_not_import_matplotlib():
+  code = "import sys, fitting; sys.exit('matplotlib' in sys.modules)"
+  root = os.path.dirname(os.path.dirname(__file__))
+  assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+
+def test_polyfit_recovers_coefficients():
+  x = np.linspace(0, 10, 50)
+  stats = fitting.polyfit(np.array([x, 3 * x**2 - 2 * x + 1]), 2)
+  assert np.allclose(stats["coefficients"], [3, -2, 1])
+  assert stats["r_squared"] > 0.999999
+  assert stats["rmse"] < 1e-8
+
+def test_curvefit_recovers_exponential():
+  x = np.linspace(0, 2, 40)
+  stats = fitting.curvefit("exponential", np.array([x, 2.5 * np.exp(0.7 * x)]))
+  assert np.isclose(stats["params"]["A"], 2.5)
+  assert np.isclose(stats["params"]["B"], 0.7)
+  assert set(stats["std_errors"]) == {"A", "B"}
+
+def test_params_endpoint_returns_json():
+  response = post_params("polyfit", {"poly_degree": "1"})
+  assert response.status_code == 200
+  body = response.json()
+  assert body["model"] == "polynomial"
+  assert len(body["coefficients"]) == 2
+  assert {"r_squared", "rss", "rmse", "mae", "covariance"} <= set(body)
+
+def test_params_endpoint_requires_degree_for_polyfit():
+  assert post_params("polyfit").status_code == 400
+  assert post_params("splinefit").status_code == 422
+
+def post_batch(array, data):
+  buf = io.BytesIO()
+  np.save(buf, array)
+  return client.post("/fit/batch", files={"file": ("batch.npy", buf.getvalue(), "application/octet-stream")}, data=data)
+
+def test_batch_polyfit_matches_single_fits():
+  rng = np.random.default_rng(1)
+  x = np.linspace(0, 1, 30)
+  Y = rng.normal(size=(6, 30))
+  Y[4, 7] = np.nan
+  results = fitting.batch_polyfit(x, Y, 2)
+  for y, stats in zip(Y, results):
+    keep = np.isfinite(y)
+    single = fitting.polyfit(np.array([x[keep], y[keep]]), 2)
+    assert np.allclose(stats["coefficients"], single["coefficients"])
+    assert np.allclose(stats["covariance"], single["covariance"])
+    assert np.isclose(stats["rmse"], single["rmse"])
+
+@pytest.mark.filterwarnings("ignore:Polyfit may be poorly conditioned")
+def test_batch_polyfit_with_too_few_points_reports_errors():
+  x = np.array([0.0, 1.0, 2.0])
+  results = fitting.batch_polyfit(x, np.array([x ** 2, [1.0, np.nan, 3.0]]), 2)
+  assert [set(result) for result in results] == [{"model", "error"}] * 2
+
+def test_batch_endpoint_fits_every_series():
+  x = np.linspace(0, 2, 25)
+  data = np.vstack([x, 2 * np.exp(0.5 * x), 3 * np.exp(-x)])
+  response = post_batch(data, {"model": "expfit"})
+  assert response.status_code == 200
+  body = response.json()
+  assert body["series"] == 2
+  assert np.allclose([r["params"]["A"] for r in body["results"]], [2, 3])
+  response = post_batch(data.T, {"model": "polyfit", "poly_degree": "1", "series": "columns"})
+  assert [len(r["coefficients"]) for r in response.json()["results"]] == [2, 2]
+
+def test_batch_endpoint_grid_pdf():
+  data = np.random.default_rng(2).normal(size=(20, 15))
+  response = post_batch(data, {"model": "polyfit", "poly_degree": "1", "x": "index", "document": "grid"})
+  assert response.status_code == 200
+  assert response.headers["content-type"] == "application/pdf"
+  assert "filename=batch_polyfit.pdf" in response.headers["Content-Disposition"]
+  response = post_batch(data, {"model": "polyfit", "poly_degree": "1", "x": "index", "document": "grid", "format": "png"})
+  assert response.status_code == 400
+
+def test_analytic_jacobians_match_finite_differences():
+  x = np.linspace(0.5, 3, 7)
+  cases = {"exponential": [2.0, 0.4], "logistic": [5.0, 1.5, 1.2], "gaussian": [3.0, 1.5, 0.7], "power_law": [2.0, 1.3]}
+  for model, params in cases.items():
+    fn, _, _, jacobian = fitting.MODELS[model]
+    step = 1e-6
+    numeric = np.column_stack([(fn(x, *np.add(params, step * e)) - fn(x, *np.subtract(params, step * e))) / (2 * step)
+      for e in np.eye(len(params))])
+    assert np.allclose(jacobian(x, *params), numeric, rtol=1e-5, atol=1e-8), model
+
+def test_initial_guess_converges_far_from_ones():
+  rng = np.random.default_rng(3)
+  x = np.linspace(30, 70, 200)
+  y = fitting.gaussian(x, 40, 50, 4) + rng.normal(scale=0.5, size=len(x))
+  stats = fitting.curvefit("gaussian", np.array([x, y]))
+  assert np.isclose(stats["params"]["mu"], 50, rtol=0.01)
+  assert abs(stats["initial_guess"]["mu"] - 50) < 1
+  assert 0 < stats["nfev"] < 50
+  x = np.linspace(-20, 0, 200)
+  y = fitting.sigmoid(x, 80, 2, -12) + rng.normal(scale=1, size=len(x))
+  assert np.isclose(fitting.curvefit("logistic", np.array([x, y]))["params"]["C"], -12, rtol=0.01)
+
+def test_poisson_histogram_is_weighted_mean_without_overflow():
+  x = np.arange(0, 2000)
+  y = 1e6 * fitting.poisson_model(x, 800.0)
+  stats = fitting.poissonfit(np.array([x, y]))
+  assert np.isfinite(y).all()
+  assert np.isclose(stats["params"]["lambda"], np.dot(x, y) / y.sum())
+  assert np.isclose(stats["params"]["lambda"], 800)
+  assert stats["r_squared"] > 0.999999
+  assert np.isfinite(stats["log_likelihood"])
+
+def test_batch_poisson_uses_the_closed_form_fit():
+  x = np.arange(20.0)
+  Y = np.array([1e4 * fitting.poisson_model(x, lambd) for lambd in (2.0, 7.5)])
+  results = fitting.batch_curvefit("poisson", x, Y)
+  assert np.allclose([result["params"]["lambda"] for result in results], [2.0, 7.5], rtol=1e-3)
+  assert results[0]["nfev"] == 0
+
+def test_poisson_events_mode():
+  events = np.random.default_rng(4).poisson(3000, size=50_000)
+  stats = fitting.poissonfit(events[np.newaxis, :], "events")
+  assert np.isclose(stats["params"]["lambda"], events.mean())
+  assert np.isclose(stats["std_errors"]["lambda"], np.sqrt(events.mean() / len(events)))
+  assert all(np.isfinite(value) for value in (stats["rss"], stats["r_squared"], stats["log_likelihood"]))
+  with pytest.raises(ValueError):
+    fitting.poissonfit(np.array([[1.5, 2.0]]), "events")
+
+def test_poissonfit_events_endpoint():
+  csv_path = os.path.join(os.path.dirname(__file__), "singlecolumn.csv")
+  with open(csv_path, "rb") as csv_file:
+    response = client.post("/fit/poissonfit/params", files={"file": ("singlecolumn.csv", csv_file, "text/csv")}, data={"mode": "events"})
+  assert response.status_code == 200
+  assert response.json()["mode"] == "events"
+  with open(csv_path, "rb") as csv_file:
+    response = client.post("/fit/poissonfit", files={"file": ("singlecolumn.csv", csv_file, "text/csv")}, data={"mode": "events", "size": "small"})
+  assert response.status_code == 200
+  assert response.headers["content-type"] == "application/pdf"
@@ -0,0 +1,54 @@
+import base64
+import os
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from formats import negotiate
+from main import app
+
+client = TestClient(app)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def post_csv(path, data, headers=None):
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  with open(csv_path, "rb") as csv_file:
+    return client.post(path, files={"file": ("data.csv", csv_file, "text/csv")}, data=data, headers=headers or {})
+
+def test_negotiate_prefers_explicit_format():
+  assert negotiate("SVG", "image/png") == "svg"
+  with pytest.raises(HTTPException):
+    negotiate("gif", None)
+
+def test_negotiate_accept_header():
+  assert negotiate(None, None) == "pdf"
+  assert negotiate(None, "text/html") == "pdf"
+  assert negotiate(None, "image/webp;q=0.5, image/svg+xml") == "svg"
+  assert negotiate(None, "image/*") == "png"
+  assert negotiate(None, "application/pdf;q=0, image/png;q=0.1") == "png"
+
+def test_scatter_png():
+  response = post_csv("/plot/scatter", {"size": "small", "format": "png", "dpi": "72"})
+  assert response.status_code == 200
+  assert response.headers["content-type"] == "image/png"
+  assert "inline; filename=scatter.png" in response.headers["Content-Disposition"]
+  assert response.content.startswith(PNG_SIGNATURE)
+
+def test_scatter_svg_from_accept_header():
+  response = post_csv("/plot/scatter", {"size": "large"}, headers={"Accept": "image/svg+xml"})
+  assert response.status_code == 200
+  assert response.headers["content-type"].startswith("image/svg+xml")
+  assert response.headers["Vary"] == "Accept"
+  assert b"<svg" in response.content
+
+def test_invalid_dpi():
+  assert post_csv("/plot/scatter", {"size": "small", "format": "png", "dpi": "5000"}).status_code == 400
+
+def test_polyfit_png_returns_stats():
+  response = post_csv("/fit/polyfit", {"poly_degree": "1", "size": "small", "format": "png"})
+  assert response.status_code == 200
+  body = response.json()
+  assert body["filename"] == "polyfit.png"
+  assert base64.b64decode(body["image"]).startswith(PNG_SIGNATURE)
+  assert len(body["stats"]["coefficients"]) == 2
+  assert 0 <= body["stats"]["r_squared"] <= 1
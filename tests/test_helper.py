@@ -1,5 +1,7 @@
 import numpy as np
 import pytest
+from fastapi import HTTPException
+import helper
 from helper import normalize_data, handle_missing_values, load_data
 import io
 import h5py
@@ -111,4 +113,166 @@ def test_load_data_json():
   data, headers = load_data("json", json_contents)
   expected = np.array([[1, 2], [3, 4]])
   assert headers == ['x', 'y']
-  assert np.allclose(data, expected)
\ No newline at end of file
+  assert np.allclose(data, expected)
+
+def test_load_data_csv_from_file_object():
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  with open(csv_path, "rb") as csv_file:
+    csv_file.read(3)
+    data, headers = load_data("csv", csv_file)
+  expected = np.array([[1, 2, 3], [2, 3, 4]])
+  assert headers == ["x", "y"]
+  assert data.dtype == np.float64
+  assert np.allclose(data, expected)
+
+def test_load_data_unsupported_format():
+  with pytest.raises(HTTPException) as excinfo:
+    load_data("xlsx", b"")
+  assert excinfo.value.status_code == 400
+
+def test_load_data_npy_is_memory_mapped(tmp_path, monkeypatch):
+  monkeypatch.setattr(helper, "MMAP_MIN_BYTES", 0)
+  path = tmp_path / "data.npy"
+  np.save(path, np.arange(10, dtype=np.float64).reshape(2, 5))
+  with open(path, "rb") as f:
+    data, _ = load_data("npy", f)
+  assert isinstance(data, np.memmap)
+  assert not data.flags.writeable
+  assert np.allclose(data, np.arange(10).reshape(2, 5))
+
+def test_load_data_stored_npz_member_is_memory_mapped(tmp_path, monkeypatch):
+  monkeypatch.setattr(helper, "MMAP_MIN_BYTES", 0)
+  path = tmp_path / "data.npz"
+  np.savez(path, first=np.array([[1., 2.], [3., 4.]]), second=np.zeros(3))
+  with open(path, "rb") as f:
+    data, _ = load_data("npz", f)
+  assert isinstance(data, np.memmap)
+  assert np.allclose(data, [[1, 2], [3, 4]])
+
+def test_load_data_compressed_npz_is_copied(tmp_path, monkeypatch):
+  monkeypatch.setattr(helper, "MMAP_MIN_BYTES", 0)
+  path = tmp_path / "data.npz"
+  np.savez_compressed(path, arr=np.array([[1., 2.], [3., 4.]]))
+  with open(path, "rb") as f:
+    data, _ = load_data("npz", f)
+  assert not isinstance(data, np.memmap)
+  assert np.allclose(data, [[1, 2], [3, 4]])
+
+def test_load_data_npz_member_without_npy_suffix(tmp_path, monkeypatch):
+  import zipfile
+  monkeypatch.setattr(helper, "MMAP_MIN_BYTES", 0)
+  member = io.BytesIO()
+  np.save(member, np.array([[1., 2.], [3., 4.]]))
+  path = tmp_path / "data.npz"
+  with zipfile.ZipFile(path, "w") as archive:
+    archive.writestr("values", member.getvalue())
+  with open(path, "rb") as f:
+    data, _ = load_data("npz", f)
+  assert np.allclose(data, [[1, 2], [3, 4]])
+
+def test_load_upload_async_parses_off_the_event_loop(monkeypatch):
+  import asyncio
+  import threading
+  from fastapi import UploadFile
+  threads = []
+  parse = helper.load_data
+  def recording_load_data(*args):
+    threads.append(threading.get_ident())
+    return parse(*args)
+  monkeypatch.setattr(helper, "load_data", recording_load_data)
+  upload = UploadFile(io.BytesIO(b"x,y\n1,2\n3,4\n"), filename="data.csv")
+  data, headers = asyncio.run(helper.load_upload_async(upload))
+  assert headers == ["x", "y"] and np.allclose(data, [[1, 3], [2, 4]])
+  assert threads and threads[0] != threading.get_ident()
+
+def test_plot_and_fit_accept_read_only_views():
+  import fit
+  import plot
+  from formats import serialize
+  data = np.array([[1., 2., 3., 4.], [2., 4., 6., 8.]])
+  data.flags.writeable = False
+  assert serialize(plot.scatter(data, ["x", "y"], "small")).getvalue().startswith(b"%PDF")
+  assert serialize(fit.polyfit(data, ["x", "y"], 1, "small")).getvalue().startswith(b"%PDF")
+  normalized = normalize_data(data)
+  assert np.allclose(handle_missing_values(normalized, "mean"), normalized)
+
+def write_hdf5(path):
+  signals = np.arange(3 * 100, dtype=np.float64).reshape(3, 100)
+  with h5py.File(path, "w") as f:
+    f.create_dataset("first", data=np.zeros(4))
+    f.create_dataset("run/signals", data=signals)
+  return signals
+
+def test_load_data_hdf5_selection(tmp_path):
+  path = tmp_path / "dump.h5"
+  signals = write_hdf5(path)
+  selection = helper.DataSelection(dataset="run/signals", columns="0,2", rows="10:20", stride=2)
+  with open(path, "rb") as f:
+    data, headers = load_data("h5", f, selection)
+  assert headers == ["run/signals[0]", "run/signals[2]"]
+  assert np.allclose(data, signals[[0, 2], 10:20:2])
+
+def test_load_data_hdf5_unsorted_point_selection(tmp_path):
+  path = tmp_path / "dump.h5"
+  signals = write_hdf5(path)
+  selection = helper.DataSelection(dataset="run/signals", columns="2,0", rows="5,-1,3")
+  with open(path, "rb") as f:
+    data, _ = load_data("h5", f, selection)
+  assert np.allclose(data, signals[[2, 0]][:, [5, 99, 3]])
+
+def test_load_data_hdf5_missing_dataset(tmp_path):
+  path = tmp_path / "dump.h5"
+  write_hdf5(path)
+  with open(path, "rb") as f, pytest.raises(HTTPException) as excinfo:
+    load_data("h5", f, helper.DataSelection(dataset="run/missing"))
+  assert excinfo.value.status_code == 400
+
+def test_load_data_csv_selection():
+  csv_path = os.path.join(os.path.dirname(__file__), "error2.csv")
+  with open(csv_path, "rb") as csv_file:
+    data, headers = load_data("csv", csv_file, helper.DataSelection(columns="0,3", rows="1:"))
+  assert headers == ["x", "erry"]
+  assert np.allclose(data, [[2, 3], [0.1, 0.1]])
+
+def write_columnar(path, file_ext):
+  pytest.importorskip("pyarrow")
+  from benchmarks import datagen
+  table = {"x": np.arange(6.0), "y": np.arange(6, dtype=np.int32), "z": np.linspace(0, 1, 6)}
+  path.write_bytes(datagen.encode(np.vstack(list(table.values())), file_ext, list(table)))
+  return np.vstack(list(table.values()))
+
+@pytest.mark.parametrize("file_ext", ["parquet", "feather", "arrows"])
+def test_load_data_columnar_projection(tmp_path, file_ext):
+  path = tmp_path / f"data.{file_ext}"
+  values = write_columnar(path, file_ext)
+  selection = helper.DataSelection(columns="2,0", rows="1:5", stride=2)
+  with open(path, "rb") as f:
+    data, headers = load_data(file_ext, f, selection)
+  assert headers == ["z", "x"]
+  assert np.allclose(data, values[[2, 0], 1:5:2])
+
+def test_load_data_mapped_feather_column_is_not_copied(tmp_path, monkeypatch):
+  monkeypatch.setattr(helper, "MMAP_MIN_BYTES", 0)
+  path = tmp_path / "data.arrow"
+  write_columnar(path, "feather")
+  with open(path, "rb") as f:
+    data, headers = load_data("arrow", f, helper.DataSelection(columns="2"))
+  assert headers == ["z"]
+  assert not data.flags.owndata and not data.flags.writeable
+  assert np.allclose(data, [np.linspace(0, 1, 6)])
+
+def test_load_data_columnar_rejects_text_columns(tmp_path):
+  pa = pytest.importorskip("pyarrow")
+  import pyarrow.parquet as pq
+  buf = io.BytesIO()
+  pq.write_table(pa.table({"label": ["a", "b"], "y": [1.0, 2.0]}), buf)
+  with pytest.raises(HTTPException) as excinfo:
+    load_data("parquet", buf.getvalue())
+  assert excinfo.value.status_code == 400
+
+def test_prepared_cleans_only_the_leading_arrays():
+  data = np.array([[1.0, np.nan], [3.0, 5.0]])
+  coord = np.array([[np.nan, 2.0]])
+  cleaned, untouched = helper.prepared(lambda *arrays: arrays, 1, "minmax", "mean", data, coord)
+  assert np.allclose(cleaned, [[0, 0.5], [0.5, 1]])
+  assert untouched is coord
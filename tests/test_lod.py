@@ -0,0 +1,55 @@
+import numpy as np
+import lod
+
+def test_small_inputs_are_left_alone():
+  data = np.vstack([np.arange(100.), np.arange(100.)])
+  reduced, dropped = lod.reduce(data, "small")
+  assert dropped == 0
+  assert reduced.shape == data.shape
+
+def test_minmax_keeps_extremes_of_each_pixel_column():
+  x = np.linspace(0, 1, 200_000)
+  y = np.sin(40 * x)
+  y[12345] = 50.0
+  reduced, dropped = lod.reduce(np.vstack([x, y]), "small", "minmax")
+  columns, _ = lod.pixel_grid("small")
+  assert dropped > 0
+  assert reduced.shape[1] <= 2 * columns
+  assert reduced[1].max() == 50.0
+  assert reduced[1].min() == y.min()
+  assert np.all(np.diff(reduced[0]) >= 0)
+
+def test_minmax_uses_error_bars():
+  x = np.linspace(0, 1, 100_000)
+  y = np.zeros_like(x)
+  err = np.full_like(x, 0.1)
+  err[777] = 5.0
+  reduced, _ = lod.reduce(np.vstack([x, y, err]), "small", "minmax", yerr=err)
+  assert 5.0 in reduced[2]
+
+def test_lttb_returns_requested_point_count():
+  x = np.arange(10_000, dtype=float)
+  y = np.random.default_rng(0).normal(size=x.size)
+  indices = lod.lttb_indices(x, y, 500)
+  assert len(indices) == 500
+  assert indices[0] == 0 and indices[-1] == x.size - 1
+  assert np.all(np.diff(indices) > 0)
+
+def test_auto_uses_density_for_unsorted_clouds():
+  rng = np.random.default_rng(1)
+  data = rng.normal(size=(2, 500_000))
+  reduced, dropped = lod.reduce(data, "large")
+  columns, rows = lod.pixel_grid("large")
+  assert reduced.shape[1] + dropped == 500_000
+  assert reduced.shape[1] <= columns * rows
+
+def test_none_opts_out():
+  data = np.random.default_rng(2).normal(size=(2, 50_000))
+  reduced, dropped = lod.reduce(data, "small", "none")
+  assert dropped == 0 and reduced.shape == data.shape
+
+def test_pixel_grid_follows_the_canvas_sizes():
+  import canvas
+  for size in ("small", "large", "grid", None):
+    width, height = canvas.FIGURE_SIZES[canvas.preset(size)]
+    assert lod.pixel_grid(size, dpi=100) == (int(width * 100 * lod.AXES_FRACTION), int(height * 100 * lod.AXES_FRACTION))
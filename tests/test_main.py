@@ -1,23 +1,11 @@
 import matplotlib
 matplotlib.use('Agg')
 from fastapi.testclient import TestClient
-from fastapi import Depends
-from main import app
 import os
-from main import app, get_current_user, authorize_action  # Import the dependency functions
+from main import app
 
 client = TestClient(app)
 
-def mock_get_current_user():
-    return {"user_id": "test_user", "email": "test@example.com"}
-
-# Override the authorize_action dependency for testing
-def mock_authorize_action(user: dict = Depends(mock_get_current_user)):
-    return user
-
-app.dependency_overrides[get_current_user] = mock_get_current_user
-app.dependency_overrides[authorize_action] = mock_authorize_action
-
 def test_read_main():
   response = client.get("/")
   assert response.status_code == 200
@@ -412,4 +400,142 @@ def test_contour():
       )
   assert response.status_code == 200
   assert response.headers["content-type"] == "application/pdf"
-  assert "inline; filename=contour.pdf" in response.headers["Content-Disposition"]
\ No newline at end of file
+  assert "inline; filename=contour.pdf" in response.headers["Content-Disposition"]
+
+def test_contour_rejects_unsafe_func():
+  xpath = os.path.join(os.path.dirname(__file__), "cornerX.csv")
+  ypath = os.path.join(os.path.dirname(__file__), "cornerY.csv")
+  with open(xpath, "rb") as xfile, open(ypath, "rb") as yfile:
+    files = [
+      ("files", ("cornerX.csv", xfile, "test/csv")),
+      ("files", ("cornerY.csv", yfile, "test/csv"))
+      ]
+    response = client.post(
+      "/plot/contour",
+      files=files,
+      data={
+        "title": "Test",
+        "cmap": "plasma",
+        "levels": [2, 3],
+        "func": "__import__('os').getcwd()",
+        "size": "small",
+        "normalization": "zscore",
+        "missing_values": "median",
+        "xlabel": "x",
+        "ylabel": "y",
+        "zlabel": "z",
+        }
+      )
+  assert response.status_code == 400
+  assert "Unsupported expression" in response.json()["detail"]
+
+def test_scatter_hdf5_selection():
+  import io
+  import h5py
+  import numpy as np
+  buf = io.BytesIO()
+  with h5py.File(buf, "w") as f:
+    f.create_dataset("run/signals", data=np.arange(300, dtype=float).reshape(3, 100))
+  response = client.post(
+    "/plot/scatter",
+    files={"file": ("dump.h5", buf.getvalue(), "application/x-hdf5")},
+    data={"size": "small", "dataset": "run/signals", "columns": "0,2", "rows": "0:50", "stride": "5"}
+  )
+  assert response.status_code == 200
+  assert response.headers["content-type"] == "application/pdf"
+
+def test_scatter_reports_dropped_points():
+  import io
+  import numpy as np
+  buf = io.BytesIO()
+  np.save(buf, np.vstack([np.linspace(0, 1, 100_000), np.linspace(0, 1, 100_000) ** 2]))
+  response = client.post(
+    "/plot/scatter",
+    files={"file": ("big.npy", buf.getvalue(), "application/octet-stream")},
+    data={"size": "small"}
+  )
+  assert response.status_code == 200
+  assert int(response.headers["X-LOD-Dropped-Points"]) > 0
+  response = client.post(
+    "/plot/scatter",
+    files={"file": ("big.npy", buf.getvalue(), "application/octet-stream")},
+    data={"size": "small", "lod": "none"}
+  )
+  assert response.headers["X-LOD-Dropped-Points"] == "0"
+
+def test_compose_overlays_files():
+  data_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  error_path = os.path.join(os.path.dirname(__file__), "error.csv")
+  with open(data_path, "rb") as data_file, open(error_path, "rb") as error_file:
+    response = client.post(
+      "/plot/compose",
+      files=[("files", ("data.csv", data_file.read(), "text/csv")), ("files", ("error.csv", error_file.read(), "text/csv"))],
+      data={"kind": "scatter,errbar1y", "title": "Runs"}
+    )
+  assert response.status_code == 200
+  assert response.headers["content-type"] == "application/pdf"
+  assert "inline; filename=compose.pdf" in response.headers["Content-Disposition"]
+
+def test_compose_grid_from_npz():
+  import io
+  import numpy as np
+  buf = io.BytesIO()
+  runs = {f"run{i}": np.vstack([np.arange(20.0), np.arange(20.0) * i]) for i in range(5)}
+  np.savez(buf, **runs)
+  response = client.post(
+    "/plot/compose",
+    files={"files": ("runs.npz", buf.getvalue(), "application/octet-stream")},
+    data={"layout": "grid", "grid": "2x3", "size": "grid", "share_axes": "true"}
+  )
+  assert response.status_code == 200
+  assert response.headers["content-type"] == "application/pdf"
+  response = client.post(
+    "/plot/compose",
+    files={"files": ("runs.npz", buf.getvalue(), "application/octet-stream")},
+    data={"layout": "grid", "grid": "2x2"}
+  )
+  assert response.status_code == 400
+
+def test_compose_rejects_mismatched_kind():
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  with open(csv_path, "rb") as csv_file:
+    response = client.post(
+      "/plot/compose",
+      files={"files": ("data.csv", csv_file, "text/csv")},
+      data={"kind": "errbar2xy"}
+    )
+  assert response.status_code == 400
+  assert "errbar2xy needs 4 columns" in response.json()["detail"]
+
+def test_compose_rejects_too_many_datasets_before_loading(monkeypatch):
+  import io
+  import numpy as np
+  import helper
+  from routers import plot_router
+  buf = io.BytesIO()
+  np.savez(buf, **{f"run{i}": np.vstack([np.arange(5.0), np.arange(5.0)]) for i in range(4)})
+  monkeypatch.setattr(plot_router, "COMPOSE_MAX_PANELS", 3)
+  def fail(*args, **kwargs):
+    raise AssertionError("datasets were loaded")
+  monkeypatch.setattr(helper, "load_data", fail)
+  response = client.post("/plot/compose", files={"files": ("runs.npz", buf.getvalue(), "application/octet-stream")})
+  assert response.status_code == 400
+  assert "At most 3 datasets" in response.json()["detail"]
+
+def test_compose_inflates_a_compressed_npz_once(monkeypatch):
+  import gzip
+  import io
+  import numpy as np
+  import decompression
+  buf = io.BytesIO()
+  np.savez(buf, **{f"run{i}": np.vstack([np.arange(5.0), np.arange(5.0) * i]) for i in range(3)})
+  inflated = []
+  open_decompressed = decompression.open_decompressed
+  def counting(*args):
+    inflated.append(args[2])
+    return open_decompressed(*args)
+  monkeypatch.setattr(decompression, "open_decompressed", counting)
+  response = client.post("/plot/compose", files={"files": ("runs.npz.gz", gzip.compress(buf.getvalue()), "application/gzip")},
+    data={"layout": "grid"})
+  assert response.status_code == 200
+  assert inflated == ["npz"]
@@ -0,0 +1,71 @@
+import os
+import main
+import metrics
+from tests.test_main import client
+
+def test_stage_is_a_noop_outside_requests():
+  with metrics.stage("idle"):
+    pass
+  assert metrics._stages.get() is None
+
+def test_collect_returns_worker_stages():
+  def job(value):
+    with metrics.stage("work"):
+      return value * 2
+  result, timings = metrics.collect(job, 21)
+  assert result == 42
+  assert [name for name, _ in timings["stages"]] == ["work"]
+  token = metrics._stages.set([])
+  try:
+    metrics.record_worker(timings, timings["started"] - 0.5)
+    stages = metrics._stages.get()
+  finally:
+    metrics._stages.reset(token)
+  assert stages[0][0] == "queue" and abs(stages[0][1] - 0.5) < 1e-6
+  assert stages[1][0] == "work"
+
+def test_server_timing_sums_repeated_stages():
+  header = metrics.server_timing([("load_data", 0.001), ("render", 0.01), ("load_data", 0.002)], 0.02)
+  assert header == "load_data;dur=3.00, render;dur=10.00, total;dur=20.00"
+
+def test_histogram_exposition():
+  histogram = metrics.Histogram("test_seconds", "Test.", ("route",), (0.1, 1))
+  histogram.observe(0.05, "/a")
+  histogram.observe(0.5, "/a")
+  histogram.observe(5, "/a")
+  lines = histogram.expose()
+  assert 'sciencegraph_test_seconds_bucket{route="/a",le="0.1"} 1' in lines
+  assert 'sciencegraph_test_seconds_bucket{route="/a",le="1"} 2' in lines
+  assert 'sciencegraph_test_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+  assert 'sciencegraph_test_seconds_count{route="/a"} 3' in lines
+
+def test_requests_carry_server_timing_and_feed_metrics(monkeypatch):
+  monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  # A body no other test sends, so the result cache cannot answer it
+  with open(csv_path, "rb") as csv_file:
+    response = client.post("/plot/scatter", files={"file": ("timed.csv", csv_file.read() + b"\n", "text/csv")}, data={"size": "small"})
+  assert response.status_code == 200
+  stages = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+  for name in ("load_data", "render", "queue", "tight_layout", "savefig", "total"):
+    assert name in stages
+  body = client.get("/metrics", headers={"Authorization": "Bearer secret"}).text
+  assert 'sciencegraph_stage_duration_seconds_count{route="/plot/scatter",stage="savefig"}' in body
+  assert 'sciencegraph_request_duration_seconds_count{method="POST",route="/plot/scatter",status="200"}' in body
+  assert 'sciencegraph_input_rows_count{format="csv"}' in body
+  assert 'sciencegraph_response_bytes_count{route="/plot/scatter",content_type="application/pdf"}' in body
+
+def test_metrics_token(monkeypatch):
+  monkeypatch.setattr(metrics, "METRICS_TOKEN", "secret")
+  assert client.get("/metrics").status_code == 401
+  assert client.get("/metrics", headers={"Authorization": "Bearer secret"}).status_code == 200
+
+def test_metrics_without_token_needs_an_authorized_user(monkeypatch):
+  monkeypatch.setattr(metrics, "METRICS_TOKEN", None)
+  assert client.get("/metrics").status_code == 401
+  monkeypatch.setattr(main.token_verifier, "lookup", lambda token: {"iss": "accounts.google.com", "email": "ops@example.com"})
+  monkeypatch.setattr(main.authorization_cache, "is_cached", lambda email: True)
+  monkeypatch.setattr(main.authorization_cache, "is_authorized", lambda email: email == "ops@example.com")
+  assert client.get("/metrics", headers={"Authorization": "Bearer google-id-token"}).status_code == 200
+  monkeypatch.setattr(main.authorization_cache, "is_authorized", lambda email: False)
+  assert client.get("/metrics", headers={"Authorization": "Bearer google-id-token"}).status_code == 403
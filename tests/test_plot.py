@@ -0,0 +1,31 @@
+import numpy as np
+import plot
+from formats import serialize
+
+def pdf_size(monkeypatch, threshold, render):
+  monkeypatch.setattr(plot, "RASTERIZE_MIN_CELLS", threshold)
+  return len(serialize(render()).getvalue())
+
+def test_dense_mesh_is_rasterized(monkeypatch):
+  data = np.random.default_rng(0).random((60, 60))
+  render = lambda: plot.pmhmap(data, ["x", "y", "z"], "Test", "viridis", "auto", "small")
+  assert pdf_size(monkeypatch, 100, render) < pdf_size(monkeypatch, 10**9, render) / 2
+
+def test_small_mesh_stays_vector(monkeypatch):
+  data = np.random.default_rng(0).random((5, 5))
+  monkeypatch.setattr(plot, "RASTERIZE_MIN_CELLS", 10_000)
+  assert not plot._rasterize(data.size)
+  render = lambda: plot.pmhmap(data, ["x", "y", "z"], "Test", "viridis", "auto", "small")
+  assert pdf_size(monkeypatch, 10_000, render) == pdf_size(monkeypatch, 10**9, render)
+
+def test_dense_contour_is_rasterized(monkeypatch):
+  X, Y = np.meshgrid(np.linspace(-3, 3, 200), np.linspace(-3, 3, 200))
+  render = lambda: plot.contourmap(X, Y, "Test", "viridis", 20, "np.sin(3 * x) * np.cos(3 * y)", "small", ["x", "y", "z"])
+  assert pdf_size(monkeypatch, 100, render) < pdf_size(monkeypatch, 10**9, render)
+
+def test_compose_grid_leaves_no_empty_panels():
+  data = [np.vstack([np.arange(10.0), np.arange(10.0) ** i]) for i in range(3)]
+  buf, dropped = serialize(plot.compose(data, ["a", "b", "c"], ["scatter", "bar", "hist"], "grid", ["x", "y"], "Runs", "grid"))
+  assert buf.getvalue().startswith(b"%PDF") and dropped == 0
+  assert plot.compose_grid(3) == (2, 2)
+  assert plot.compose_grid(7) == (3, 3)
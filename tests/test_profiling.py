@@ -0,0 +1,54 @@
+import marshal
+import os
+import pstats
+import profiling
+from tests.test_main import client
+
+def post_scatter(headers, suffix=b""):
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  with open(csv_path, "rb") as csv_file:
+    return client.post("/plot/scatter", files={"file": ("data.csv", csv_file.read() + suffix, "text/csv")}, data={"size": "small"},
+      headers=headers)
+
+def test_admin_gets_a_profile_covering_load_render_and_save(monkeypatch):
+  monkeypatch.setattr(profiling, "PROFILE_ADMINS", {"test@example.com"})
+  # The plain request fills the result cache; the profiled one must render anyway
+  post_scatter({})
+  response = post_scatter({"X-Profile": "1", "X-Request-ID": "scatter-1"})
+  assert response.status_code == 200
+  assert response.headers["X-Profile-Id"] == "scatter-1"
+  assert response.headers["X-Cache"] == "MISS"
+  raw = client.get("/profiles/scatter-1")
+  assert raw.status_code == 200
+  functions = {name for _, _, name in marshal.loads(raw.content)}
+  assert {"load_data", "scatter", "savefig"} <= functions
+  # The handler's own coroutine runs on the event loop, shared with other requests
+  assert "generate_scatter_plot" not in functions
+  assert "cumulative" in client.get("/profiles/scatter-1", params={"format": "text"}).text
+
+def test_collapsed_stacks(monkeypatch):
+  monkeypatch.setattr(profiling, "PROFILE_ADMINS", {"test@example.com"})
+  monkeypatch.setattr(profiling, "PROFILE_SAMPLE_INTERVAL", 0.0005)
+  response = post_scatter({"X-Profile": "collapsed"}, b"\n")
+  request_id = response.headers["X-Profile-Id"]
+  stacks = client.get(f"/profiles/{request_id}").text.splitlines()
+  assert stacks and all(line.rsplit(" ", 1)[1].isdigit() for line in stacks)
+
+def test_non_admins_are_not_profiled(monkeypatch):
+  monkeypatch.setattr(profiling, "PROFILE_ADMINS", set())
+  response = post_scatter({"X-Profile": "1"})
+  assert response.status_code == 200
+  assert "X-Profile-Id" not in response.headers
+  assert client.get("/profiles/anything").status_code == 403
+
+def test_sessions_merge_worker_stats():
+  def work():
+    return sum(range(1000))
+  result, worker_stats = profiling.profiled("pstats", work)
+  assert result == 499500
+  session = profiling.Session("pstats")
+  session.merge(worker_stats)
+  session.merge(worker_stats)
+  stats = pstats.Stats(profiling._Snapshot(marshal.loads(session.dump())))
+  (calls, *_), = [value for (_, _, name), value in stats.stats.items() if name == "work"]
+  assert calls == 2
@@ -0,0 +1,133 @@
+import io
+import json
+import numpy as np
+import pytest
+from fastapi import HTTPException
+import readers
+from helper import load_data
+
+ENGINES = [name for name in readers.ENGINES if name != "pyarrow" or readers.pyarrow is not None]
+
+def test_sniff_delimiter_and_header():
+  dialect = readers.sniff(b"time;value\n1;2\n")
+  assert dialect.delimiter == ";"
+  assert dialect.headers == ["time", "value"]
+  assert readers.sniff(b"x\ty\n1\t2\n").delimiter == "\t"
+
+def test_sniff_headerless_and_matrix():
+  dialect = readers.sniff(b"1,2,3\n4,5,6\n")
+  assert dialect.headers is None and dialect.columns == 3
+  assert readers.sniff(b"m, _\n1, 2\n").is_matrix
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_series_are_contiguous_rows(engine):
+  data, headers = readers.read_csv(io.BytesIO(b"x, y\n1, 2\n3, 4\n5, 6\n"), engine)
+  assert headers == ["x", "y"]
+  np.testing.assert_array_equal(data, [[1, 3, 5], [2, 4, 6]])
+  assert data.dtype == np.float64 and data.flags.c_contiguous
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_matrix_keeps_rows(engine):
+  data, headers = readers.read_csv(io.BytesIO(b"m,_,_\n1,2,3\n4,5,6\n"), engine)
+  assert headers[0] == "m"
+  np.testing.assert_array_equal(data, [[1, 2, 3], [4, 5, 6]])
+  assert data.flags.c_contiguous
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_headerless_columns_are_named(engine):
+  data, headers = readers.read_csv(io.BytesIO(b"1|2\n3|4\n"), engine)
+  assert headers == ["c0", "c1"]
+  np.testing.assert_array_equal(data, [[1, 3], [2, 4]])
+
+def test_engines_agree():
+  rng = np.random.default_rng(0)
+  values = rng.normal(size=(500, 3))
+  buf = io.BytesIO()
+  np.savetxt(buf, values, delimiter=",", header="a,b,c", comments="", fmt="%.17g")
+  for engine in ENGINES:
+    buf.seek(0)
+    data, _ = readers.read_csv(buf, engine)
+    np.testing.assert_allclose(data, values.T, rtol=1e-12)
+
+def test_missing_values_become_nan():
+  data, _ = readers.read_csv(io.BytesIO(b"x,y\n1,\n3,4\n"))
+  assert np.isnan(data[1, 0]) and data[1, 1] == 4
+
+def test_non_numeric_csv_is_rejected():
+  with pytest.raises(HTTPException) as info:
+    load_data("csv", b"x,y\n1,abc\n")
+  assert info.value.status_code == 400
+
+JSON_ENGINES = ["stream", "json"] + (["orjson"] if readers.orjson is not None else [])
+
+@pytest.mark.parametrize("engine", JSON_ENGINES)
+def test_json_columns(engine):
+  data, headers = readers.read_json(io.BytesIO(b'{"x": [1, 2, 3], "y": [0.5, null, -1e3]}'), engine)
+  assert headers == ["x", "y"]
+  np.testing.assert_array_equal(data, [[1, 2, 3], [0.5, np.nan, -1000]])
+  assert data.dtype == np.float64
+
+def test_json_stream_across_chunk_boundaries(monkeypatch):
+  monkeypatch.setattr(readers, "JSON_CHUNK_BYTES", 7)
+  columns = {'a "quoted" name': np.arange(200) * 0.25, "y": -np.arange(200.0)}
+  raw = json.dumps({name: values.tolist() for name, values in columns.items()}, indent=2).encode()
+  data, headers = readers.read_json(io.BytesIO(raw), "stream")
+  assert headers == list(columns)
+  np.testing.assert_array_equal(data, np.vstack(list(columns.values())))
+
+@pytest.mark.parametrize("raw", [b'{"x": [1, "a"]}', b'{"x": [1 2]}', b'{"x": [1, 2], "y": [1]}', b'{"x": [[1]]}', b'[1, 2]',
+  b'{"x": [1, 2]} {}', b'{"x": [1, 2'])
+def test_invalid_json_is_rejected(raw):
+  with pytest.raises(HTTPException) as info:
+    load_data("json", raw)
+  assert info.value.status_code == 400
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_ndjson_records(monkeypatch, arrow):
+  if not arrow:
+    monkeypatch.setattr(readers, "pyarrow", None)
+  elif readers.pyarrow is None:
+    pytest.skip("pyarrow is not installed")
+  data, headers = load_data("ndjson", b'{"x": 1, "y": 2.5}\n{"x": 2, "y": null}\n\n{"x": 3, "y": 4}\n')
+  assert headers == ["x", "y"]
+  np.testing.assert_array_equal(data, [[1, 2, 3], [2.5, np.nan, 4]])
+
+@pytest.mark.parametrize("engine", JSON_ENGINES)
+def test_duplicate_json_columns_are_rejected(engine):
+  for raw in (b'{"x": [1, 2], "y": [3, 4], "x": [5, 6]}', b'{"x": [1], "\\u0078": [2]}'):
+    with pytest.raises(readers.JsonError, match="Duplicate column name in JSON upload: x"):
+      readers.read_json(io.BytesIO(raw), engine)
+
+@pytest.mark.parametrize("arrow", [True, False])
+def test_duplicate_ndjson_fields_are_rejected(monkeypatch, arrow):
+  if not arrow:
+    monkeypatch.setattr(readers, "pyarrow", None)
+  elif readers.pyarrow is None:
+    pytest.skip("pyarrow is not installed")
+  with pytest.raises(HTTPException) as info:
+    load_data("ndjson", b'{"x": 1, "y": 2, "x": 3}\n{"x": 2, "y": 4}\n')
+  assert info.value.status_code == 400
+
+@pytest.mark.parametrize("engine", JSON_ENGINES)
+def test_json_booleans_are_rejected(engine):
+  # Older versions read boolean arrays as 0 and 1
+  with pytest.raises(readers.JsonError):
+    readers.read_json(io.BytesIO(b'{"x": [1, 2], "flag": [true, false]}'), engine)
+
+@pytest.mark.parametrize("engine", JSON_ENGINES)
+@pytest.mark.parametrize("literal", [b"NaN", b"Infinity", b"-Infinity"])
+def test_json_non_finite_literals_are_rejected(engine, literal):
+  with pytest.raises(readers.JsonError):
+    readers.read_json(io.BytesIO(b'{"x": [1, ' + literal + b']}'), engine)
+
+@pytest.mark.parametrize("arrow", [True, False])
+@pytest.mark.parametrize("raw", [b'{"x": 1, "flag": true}\n{"x": 2, "flag": false}\n', b'{"x": 1}\n{"x": NaN}\n',
+  b'{"x": Infinity}\n'])
+def test_ndjson_booleans_and_non_finite_literals_are_rejected(monkeypatch, arrow, raw):
+  if not arrow:
+    monkeypatch.setattr(readers, "pyarrow", None)
+  elif readers.pyarrow is None:
+    pytest.skip("pyarrow is not installed")
+  with pytest.raises(HTTPException) as info:
+    load_data("ndjson", raw)
+  assert info.value.status_code == 400
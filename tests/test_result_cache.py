@@ -0,0 +1,105 @@
+import asyncio
+import os
+import threading
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from main import app, authorize_action
+import result_cache
+from result_cache import CacheEntry, ResultCache, cache
+
+client = TestClient(app)
+
+def deny_action():
+  raise HTTPException(status_code=403, detail="Not authorized to perform this action")
+
+def post_scatter(size="small", headers=None):
+  csv_path = os.path.join(os.path.dirname(__file__), "data.csv")
+  with open(csv_path, "rb") as csv_file:
+    return client.post(
+      "/plot/scatter",
+      files={"file": ("data.csv", csv_file, "text/csv")},
+      data={"size": size},
+      headers=headers or {},
+    )
+
+def test_repeated_request_is_served_from_cache():
+  cache.clear()
+  first = post_scatter()
+  second = post_scatter()
+  assert first.status_code == 200 and second.status_code == 200
+  assert first.headers["X-Cache"] == "MISS"
+  assert second.headers["X-Cache"] == "HIT"
+  assert first.headers["ETag"] == second.headers["ETag"]
+  assert first.content == second.content
+  assert second.headers["content-type"] == "application/pdf"
+  assert "inline; filename=scatter.pdf" in second.headers["Content-Disposition"]
+
+def test_different_form_fields_miss_cache():
+  cache.clear()
+  small = post_scatter("small")
+  large = post_scatter("large")
+  assert large.headers["X-Cache"] == "MISS"
+  assert small.headers["ETag"] != large.headers["ETag"]
+
+def test_if_none_match_returns_304():
+  cache.clear()
+  etag = post_scatter().headers["ETag"]
+  response = post_scatter(headers={"If-None-Match": etag})
+  assert response.status_code == 304
+  assert response.content == b""
+
+def test_cache_hit_still_requires_authorization(monkeypatch):
+  cache.clear()
+  post_scatter()
+  monkeypatch.setitem(app.dependency_overrides, authorize_action, deny_action)
+  assert post_scatter().status_code == 403
+
+def test_result_cache_evicts_by_bytes():
+  results = ResultCache(max_bytes=10)
+  results.put("a", CacheEntry(b"123456", "application/pdf", {}))
+  results.put("b", CacheEntry(b"123456", "application/pdf", {}))
+  assert results.get("a") is None
+  assert results.get("b").body == b"123456"
+  assert results.stats()["bytes_saved"] == 6
+
+def test_result_cache_disk_tier(tmp_path):
+  results = ResultCache(max_bytes=10, directory=str(tmp_path))
+  results.put("a", CacheEntry(b"123456", "application/pdf", {"content-disposition": "inline; filename=a.pdf"}))
+  results.put("b", CacheEntry(b"123456", "application/pdf", {}))
+  entry = ResultCache(max_bytes=10, directory=str(tmp_path)).get("a")
+  assert entry.body == b"123456"
+  assert entry.headers["content-disposition"] == "inline; filename=a.pdf"
+
+def test_result_cache_disk_tier_lists_the_directory_once(tmp_path, monkeypatch):
+  (tmp_path / "old.bin").write_bytes(b"1234")
+  (tmp_path / "old.json").write_text('{"media_type": "application/pdf", "headers": {}}')
+  results = ResultCache(max_bytes=10, directory=str(tmp_path), max_disk_bytes=10)
+  monkeypatch.setattr(result_cache.os, "listdir", lambda path: pytest.fail("disk tier listed on write"))
+  results.put("a", CacheEntry(b"123456", "application/pdf", {}))
+  assert (tmp_path / "old.bin").exists()
+  results.put("b", CacheEntry(b"123456", "application/pdf", {}))
+  assert not (tmp_path / "old.bin").exists() and not (tmp_path / "old.json").exists()
+  assert not (tmp_path / "a.bin").exists() and (tmp_path / "b.bin").exists()
+  assert results._disk_size == 6
+
+def test_hashing_and_disk_io_run_off_the_event_loop(tmp_path, monkeypatch):
+  results = ResultCache(max_bytes=10, directory=str(tmp_path))
+  threads = []
+  for name in ("_read_disk", "_write_disk"):
+    original = getattr(results, name)
+    monkeypatch.setattr(results, name, lambda *args, original=original: threads.append(threading.get_ident()) or original(*args))
+  digest = result_cache._digest
+  monkeypatch.setattr(result_cache, "_digest", lambda *args: threads.append(threading.get_ident()) or digest(*args))
+  monkeypatch.setattr(result_cache, "cache", results)
+
+  async def scenario():
+    await results.put_async("a", CacheEntry(b"123456", "application/pdf", {}))
+    results.clear()
+    return (await results.get_async("a")).body, threading.get_ident()
+
+  body, loop_thread = asyncio.run(scenario())
+  assert body == b"123456"
+  assert post_scatter().status_code == 200
+  # put and get above, then the hash, disk miss and write of one request
+  assert len(threads) == 5 and loop_thread not in threads